@@ -3,8 +3,8 @@ import os
 import sys
 from datetime import datetime
 
-from PyQt6.QtCore import QUrl, QPoint, QMarginsF, QSizeF, QRectF
-from PyQt6.QtGui import QPainter, QKeySequence, QAction, QTransform, QPdfWriter, QPageSize, QPageLayout, QFont, QUndoStack
+from PyQt6.QtCore import QUrl, QPoint, QMarginsF, QSizeF, QRectF, QStandardPaths
+from PyQt6.QtGui import QPainter, QKeySequence, QAction, QActionGroup, QTransform, QPdfWriter, QPageSize, QPageLayout, QFont, QUndoStack
 from PyQt6.QtWidgets import (QApplication, QGraphicsScene, QMainWindow, QGraphicsView,
                              QDialog, QMessageBox, QSizePolicy, QFileDialog, QVBoxLayout,
                              QLabel, QPushButton)
@@ -30,12 +30,21 @@ class ZoomableGraphicsView(QGraphicsView):
     MIN_ZOOM = 0.25
     MAX_ZOOM = 4.0
     ZOOM_INCREMENT = 1.1  # 10% per wheel click
+    LOD_ZOOM = 0.4  # below this zoom the knots are drawn from the overview images of the ribbon
 
     def __init__(self, scene, parent=None):
         super().__init__(scene, parent)
         self.zoom_factor = 1.0
         self.panning = False
         self.pan_start_pos = QPoint()
+        self.tiles = None  # TileCache of the row blocks of batched and virtual ribbons
+        self.paint_tool = None  # one of PaintStroke.TOOLS, dragging with the left button paints knots
+        self.stroke = None  # PaintStroke in progress
+        self.stroke_pos = None  # scene position of the last mouse event of the stroke
+        self.band_start = None  # viewport position of the press of the select tool
+        self.select_row = None  # row of the last knot clicked with the select tool, Shift extends from it
+        self.highlight_hover = False  # highlight the thread under the mouse
+        self.highlight_pinned = False  # a thread highlighted with Ctrl+click stays until the next one
 
     def wheelEvent(self, event):
         """Handle mouse wheel for vertical scroll or zoom with Ctrl."""
@@ -72,6 +81,7 @@ class ZoomableGraphicsView(QGraphicsView):
 
             # Center on the scene position to keep it under cursor
             self.centerOn(scene_pos)
+            self.update_ribbon()
 
             event.accept()
         else:
@@ -85,17 +95,92 @@ class ZoomableGraphicsView(QGraphicsView):
         """Reset zoom to 1:1 and restore default view."""
         self.resetTransform()
         self.zoom_factor = 1.0
+        self.update_ribbon()
+
+    def set_tiled(self, tiled):
+        """Blit the row blocks from cached pixmaps instead of painting them for every frame."""
+        self.tiles = TileCache() if tiled else None
+        self.viewport().update()
+
+    def update_ribbon(self):
+        """Set the level of detail of the ribbon and create the items of a virtual ribbon for the rows in view."""
+        ribbon = getattr(self.scene(), "ribbon", None)
+        if ribbon is None:
+            return
+        ribbon.set_detail(self.zoom_factor >= self.LOD_ZOOM)
+        if not ribbon.virtual:
+            return
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        # half a viewport above and below, scrolling a little does not create items
+        margin = rect.height() / 2
+        ribbon.show_rows(rect.top() - margin, rect.bottom() + margin)
+
+    def drawForeground(self, painter, rect):
+        """Paint the row numbers of the ribbon in the exposed rect."""
+        ribbon = getattr(self.scene(), "ribbon", None)
+        if ribbon is not None:
+            ribbon.paint_labels(painter, rect)
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.update_ribbon()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_ribbon()
+
+    def knot_at(self, pos):
+        """Ribbon and knot under the viewport position pos, computed without item picking."""
+        ribbon = getattr(self.scene(), "ribbon", None)
+        if ribbon is None:
+            return None, None
+        co = ribbon.knot_at(self.mapToScene(pos))
+        return ribbon, None if co is None else ribbon.K[co[0]][co[1]]
 
     def mousePressEvent(self, event):
-        """Handle mouse press for panning with middle button."""
+        """Handle mouse press for panning with middle button and clicks on knots."""
         if event.button() == Qt.MouseButton.MiddleButton:
             self.panning = True
             self.pan_start_pos = event.pos()
             self.setCursor(Qt.CursorShape.ClosedHandCursor)
             event.accept()
+            return
+        if (event.button() == Qt.MouseButton.LeftButton and self.paint_tool != "select"
+                and event.modifiers() & Qt.KeyboardModifier.ControlModifier):
+            self.pin_highlight(event.pos())
+            event.accept()
+            return
+        ribbon, knot = self.knot_at(event.pos())
+        if self.paint_tool == "select" and event.button() == Qt.MouseButton.LeftButton:
+            self.band_start = event.pos()
+            super().mousePressEvent(event)  # QGraphicsView shows the rubber band
+        elif self.paint_tool is not None and event.button() == Qt.MouseButton.LeftButton and ribbon is not None:
+            self.stroke = PaintStroke(ribbon, self.paint_tool)
+            self.stroke_pos = self.mapToScene(event.pos())
+            if knot is not None:
+                self.stroke.add((knot.index,))
+            event.accept()
+        elif knot is not None:
+            self.scene().clicks.press(ribbon, knot, event.button())
+            event.accept()
         else:
             super().mousePressEvent(event)
 
+    def mouseDoubleClickEvent(self, event):
+        """Change the type of a double-clicked knot."""
+        if self.paint_tool is not None:
+            self.mousePressEvent(event)  # the second press of a double click starts a stroke too
+            return
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            event.accept()  # the first press toggled the highlight
+            return
+        ribbon, knot = self.knot_at(event.pos())
+        if knot is not None and event.button() != Qt.MouseButton.MiddleButton:
+            self.scene().clicks.double(ribbon, knot)
+            event.accept()
+        else:
+            super().mouseDoubleClickEvent(event)
+
     def mouseMoveEvent(self, event):
         """Handle mouse move for panning."""
         if self.panning:
@@ -111,30 +196,128 @@ class ZoomableGraphicsView(QGraphicsView):
                 self.verticalScrollBar().value() - delta.y()
             )
             event.accept()
+        elif self.stroke is not None:
+            # paint all knots between the last and this position, fast drags skip knots
+            pos = self.mapToScene(event.pos())
+            self.stroke.add(self.stroke.ribbon.knots_on_line(self.stroke_pos, pos))
+            self.stroke_pos = pos
+            event.accept()
         else:
+            if self.highlight_hover and not event.buttons():
+                self.hover_highlight(event.pos())
             super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
         """Handle mouse release to stop panning."""
         if event.button() == Qt.MouseButton.MiddleButton:
             self.panning = False
-            self.setCursor(Qt.CursorShape.ArrowCursor)
+            self.setCursor(Qt.CursorShape.CrossCursor if self.paint_tool else Qt.CursorShape.ArrowCursor)
             event.accept()
+        elif self.stroke is not None and event.button() == Qt.MouseButton.LeftButton:
+            stroke = self.stroke
+            self.stroke = None
+            stroke.finish()
+            event.accept()
+        elif self.band_start is not None and event.button() == Qt.MouseButton.LeftButton:
+            super().mouseReleaseEvent(event)
+            start = self.band_start
+            self.band_start = None
+            self.select_knots(start, event.pos(), event.modifiers())
         else:
             super().mouseReleaseEvent(event)
 
+    def select_knots(self, start, end, modifiers):
+        """
+        Select the knots in the rubber band from start to end, or for a click on a knot its
+        row, the rows from the last clicked one with Shift, its column with Ctrl or its
+        diagonal with Alt. A click beside the knots clears the selection.
+        """
+        ribbon, knot = self.knot_at(end)
+        if ribbon is None:
+            return
+        if (end - start).manhattanLength() >= QApplication.startDragDistance():
+            ribbon.select_rect(QRectF(self.mapToScene(start), self.mapToScene(end)).normalized())
+        elif knot is None:
+            ribbon.select(())
+        elif modifiers & Qt.KeyboardModifier.ControlModifier:
+            ribbon.select_column(knot.co[0])
+        elif modifiers & Qt.KeyboardModifier.AltModifier:
+            ribbon.select_diagonal(knot)
+        elif modifiers & Qt.KeyboardModifier.ShiftModifier and self.select_row is not None:
+            ribbon.select_rows(self.select_row, knot.co[1])
+        else:
+            self.select_row = knot.co[1]
+            ribbon.select_rows(self.select_row, self.select_row)
+
+    def thread_at(self, pos):
+        """Ribbon and index of the thread of the knot, exit or color bar rectangle at the viewport position pos."""
+        ribbon = getattr(self.scene(), "ribbon", None)
+        if ribbon is None:
+            return None, None
+        for item in self.items(pos):
+            if isinstance(item, ColorRect):
+                return ribbon, item.index
+        return ribbon, ribbon.thread_at(self.mapToScene(pos))
+
+    def pin_highlight(self, pos):
+        """Highlight the thread at pos, or end the highlight if it is shown already or there is no thread."""
+        ribbon, thread = self.thread_at(pos)
+        if ribbon is None:
+            return
+        if ribbon.highlight is not None and thread == ribbon.highlight.thread:
+            thread = None
+        ribbon.highlight_thread(thread)
+        self.highlight_pinned = thread is not None
+
+    def hover_highlight(self, pos):
+        """Highlight the thread at pos unless one is pinned with Ctrl+click."""
+        ribbon = getattr(self.scene(), "ribbon", None)
+        if ribbon is None:
+            return
+        if self.highlight_pinned and ribbon.highlight is not None and ribbon.highlight.thread is not None:
+            return
+        self.highlight_pinned = False  # a new ribbon has no pinned thread
+        if ribbon.worker is not None and ribbon.worker.busy():
+            return  # the path index is updated when the worker delivers, hovering does not wait for it
+        ribbon.highlight_thread(self.thread_at(pos)[1])
+
+    def set_highlight_hover(self, hover):
+        """Highlight the thread under the mouse while it moves."""
+        self.highlight_hover = hover
+        self.setMouseTracking(hover)
+        ribbon = getattr(self.scene(), "ribbon", None)
+        if not hover and not self.highlight_pinned and ribbon is not None:
+            ribbon.highlight_thread(None)
+
+    def set_paint_tool(self, tool):
+        """Paint knots with tool while dragging, "select" to select knots, None for clicks."""
+        self.paint_tool = tool
+        self.setDragMode(QGraphicsView.DragMode.RubberBandDrag if tool == "select"
+                         else QGraphicsView.DragMode.NoDrag)
+        self.setCursor(Qt.CursorShape.CrossCursor if tool else Qt.CursorShape.ArrowCursor)
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
 
         self.scene = QGraphicsScene(self)
+        self.scene.clicks = ClickDispatcher()  # kept for all ribbons of the scene
         self.view = ZoomableGraphicsView(self.scene)
         self.view.setRenderHint(QPainter.RenderHint.Antialiasing)
         self.view.setSizePolicy(QSizePolicy.Policy.Expanding,
                                 QSizePolicy.Policy.Expanding)
         self.R = None
         self.file_path = None
+        self.batched = False  # paint the knots with one item per block of rows
+        self.virtual = False  # create the row blocks only for the rows in view
+        self.background = False  # propagate knot edits on a worker thread
+        self.knot_pattern = None  # types and visibility of copied knots, see Ribbon.copy_selected
+
+        # keep the templates of the ribbon sizes in use on disk, reopening them is faster
+        cache = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+        if cache:
+            templates.directory = os.path.join(cache, "templates")
 
         # Create undo stack for undo/redo functionality
         self.undo_stack = QUndoStack(self)
@@ -238,6 +421,65 @@ class MainWindow(QMainWindow):
         self.redo_action.setEnabled(False)
         edit_menu.addAction(self.redo_action)
 
+        edit_menu.addSeparator()
+
+        # Apply single clicks on the press instead of after the double click interval
+        self.instant_action = QAction("&Instant Clicks", self)
+        self.instant_action.setCheckable(True)
+        self.instant_action.toggled.connect(self.set_instant_clicks)
+        edit_menu.addAction(self.instant_action)
+
+        # Drag over knots to set their type or visible thread, a stroke is one undo entry
+        paint_menu = edit_menu.addMenu("&Paint Tool")
+        self.paint_group = QActionGroup(self)
+        for tool, text in ((None, "&Off"), ("Nk", "&Normal Knots"), ("Rk", "&Reverse Knots"),
+                           ("left", "&Left Thread Visible"), ("right", "R&ight Thread Visible"),
+                           ("select", "&Select Knots")):
+            action = QAction(text, self)
+            action.setCheckable(True)
+            action.setChecked(tool is None)
+            action.triggered.connect(lambda checked, tool=tool: self.view.set_paint_tool(tool))
+            self.paint_group.addAction(action)
+            paint_menu.addAction(action)
+
+        # Region operations on the knots selected with the select tool, each is one undo entry
+        selection_menu = edit_menu.addMenu("&Selection")
+        for text, operation in (("Set &Normal Knots", lambda R: R.set_selected_type(Const.Nk)),
+                                ("Set &Reverse Knots", lambda R: R.set_selected_type(Const.Rk)),
+                                ("&Toggle Knot Types", lambda R: R.toggle_selected_type()),
+                                ("Show &Left Threads", lambda R: R.set_selected_visible(Const.LeftThrdVis)),
+                                ("Show R&ight Threads", lambda R: R.set_selected_visible(Const.RightThrdVis)),
+                                ("Toggle &Visible Threads", lambda R: R.toggle_selected_visible())):
+            action = QAction(text, self)
+            action.triggered.connect(lambda checked, operation=operation: self.edit_selection(operation))
+            selection_menu.addAction(action)
+        selection_menu.addSeparator()
+
+        copy_action = QAction("&Copy Knots", self)
+        copy_action.setShortcut(QKeySequence.StandardKey.Copy)
+        copy_action.triggered.connect(lambda: self.edit_selection(self.copy_knots))
+        selection_menu.addAction(copy_action)
+
+        paste_action = QAction("&Paste Knots", self)
+        paste_action.setShortcut(QKeySequence.StandardKey.Paste)
+        paste_action.triggered.connect(lambda: self.edit_selection(lambda R: R.paste_selected(self.knot_pattern)))
+        selection_menu.addAction(paste_action)
+
+    def edit_selection(self, operation):
+        """Call operation with the ribbon if there is one"""
+        if self.R is not None:
+            operation(self.R)
+
+    def copy_knots(self, R):
+        # kept by the window, so it can be pasted into another ribbon
+        pattern = R.copy_selected()
+        if pattern:
+            self.knot_pattern = pattern
+
+    def set_instant_clicks(self, instant):
+        """Toggle knots on the press, a following double click is undone together with the toggle"""
+        self.scene.clicks.instant = instant
+
     def new_file(self):
         # def new_file(self, checked=False):
         if self.R:  # is there already an active ribbon ?
@@ -253,7 +495,7 @@ class MainWindow(QMainWindow):
                     self.R.changed = False
             # Clear undo stack before clearing scene to avoid stale references
             self.undo_stack.clear()
-            self.scene.clear()
+            self.clear_scene()
 
         dialog = RibbonDialog(self)
 
@@ -285,10 +527,11 @@ class MainWindow(QMainWindow):
             # QMessageBox.warning(None, "Warning", "Type W not yet implemented !")
             # return ()
 
-        self.R = Ribbon(self.scene, width, length, type)
+        self.R = Ribbon(self.scene, width, length, type, self.batched, self.virtual)
 
         # Attach undo stack to ribbon for easy access from graphics items
         self.R.undo_stack = self.undo_stack
+        self.R.set_background(self.background)
 
         # Clear undo stack for new ribbon (fresh start)
         self.undo_stack.clear()
@@ -305,6 +548,7 @@ class MainWindow(QMainWindow):
 
         self.scene.setSceneRect(0, 0, self.R.cplW, self.R.cplL)
         self.setGeometry(300, 20, self.window_w, 1000)
+        self.view.update_ribbon()
 
         # Update undo/redo action states
         self._update_undo_actions()
@@ -332,10 +576,11 @@ class MainWindow(QMainWindow):
             saved_filename = data.get("filename", os.path.basename(path))
 
             # Create new ribbon with the saved dimensions
-            self.R = Ribbon(self.scene, width, length, ribbon_type)
+            self.R = Ribbon(self.scene, width, length, ribbon_type, self.batched, self.virtual)
 
             # Attach undo stack to ribbon
             self.R.undo_stack = self.undo_stack
+            self.R.set_background(self.background)
 
             # Restore saved state
             self.R.restore_from_dict(data)
@@ -348,6 +593,7 @@ class MainWindow(QMainWindow):
             self.window_h = int(self.R.cplL + 2 * self.window_edge)
             self.scene.setSceneRect(0, 0, self.R.cplW, self.R.cplL)
             self.setGeometry(300, 20, self.window_w, 800)
+            self.view.update_ribbon()
 
             # Update file path and window title
             self.file_path = path
@@ -363,6 +609,44 @@ class MainWindow(QMainWindow):
                 f"Could not open file: {str(e)}"
             )
 
+    def set_batched(self, batched):
+        """Switch between one graphics item per knot and batched painting of row blocks"""
+        self.batched = batched
+        self.rebuild_ribbon()
+
+    def set_virtual(self, virtual):
+        """Switch between items for all rows and items only for the rows in view"""
+        self.virtual = virtual
+        self.rebuild_ribbon()
+
+    def set_background(self, background):
+        """Propagate knot edits on a worker thread, the view stays responsive on long ribbons"""
+        self.background = background
+        if self.R is not None:
+            self.R.set_background(background)
+
+    def clear_scene(self):
+        # delete the items of the ribbon, the view finds no ribbon in the scene until a new one is made
+        if self.R is not None:
+            self.R.detach()
+        self.scene.clear()
+
+    def rebuild_ribbon(self):
+        # rebuild the current ribbon in the selected modes, the undo history refers to the old items
+        if self.R is None or (self.R.batched, self.R.virtual) == (self.batched or self.virtual, self.virtual):
+            return
+        data = self.R.to_dict()
+        changed = self.R.changed
+        self.undo_stack.clear()
+        self.clear_scene()
+        self.R = Ribbon(self.scene, self.R.w, self.R.l, self.R.type, self.batched, self.virtual)
+        self.R.undo_stack = self.undo_stack
+        self.R.set_background(self.background)
+        self.R.restore_from_dict(data)
+        self.R.changed = changed
+        self.view.update_ribbon()
+        self._update_undo_actions()
+
     def save(self):
         """Save the current ribbon pattern"""
         if self.R is None:
@@ -539,8 +823,27 @@ class MainWindow(QMainWindow):
                 scene_height_pdf
             )
 
-            # Render the scene
-            self.scene.render(painter, target=scene_target_rect, source=self.scene.sceneRect())
+            # Render the scene with the items of all rows, a virtual ribbon creates them first
+            self.R.sync()
+            self.R.set_detail(True)
+            self.R.show_rows(0, self.R.cplL)
+            # the selection and the highlight are not part of the pattern
+            overlays = [item for item in (self.R.selection_item, self.R.highlight)
+                        if item is not None and item.isVisible()]
+            for item in overlays:
+                item.hide()
+            source_rect = self.scene.sceneRect()
+            self.scene.render(painter, target=scene_target_rect, source=source_rect)
+            for item in overlays:
+                item.show()
+
+            # the row numbers are painted by the view, map them like the scene
+            painter.translate(scene_target_rect.topLeft())
+            painter.scale(scene_target_rect.width() / source_rect.width(),
+                          scene_target_rect.height() / source_rect.height())
+            painter.translate(-source_rect.topLeft())
+            self.R.paint_labels(painter, source_rect)
+            self.view.update_ribbon()
 
             painter.end()
 
@@ -690,6 +993,31 @@ def main():
     reset_zoom_action.triggered.connect(window.view.reset_zoom)
     reset_zoom_action.setShortcut("Ctrl+0")
 
+    batched_action = QAction("&Batched Painting")
+    batched_action.setCheckable(True)
+    view_menu.addAction(batched_action)
+    batched_action.toggled.connect(window.set_batched)
+
+    virtual_action = QAction("&Virtual Rows")
+    virtual_action.setCheckable(True)
+    view_menu.addAction(virtual_action)
+    virtual_action.toggled.connect(window.set_virtual)
+
+    tiles_action = QAction("&Tile Cache")
+    tiles_action.setCheckable(True)
+    view_menu.addAction(tiles_action)
+    tiles_action.toggled.connect(window.view.set_tiled)
+
+    background_action = QAction("Background &Propagation")
+    background_action.setCheckable(True)
+    view_menu.addAction(background_action)
+    background_action.toggled.connect(window.set_background)
+
+    highlight_action = QAction("&Highlight Thread on Hover")
+    highlight_action.setCheckable(True)
+    view_menu.addAction(highlight_action)
+    highlight_action.toggled.connect(window.view.set_highlight_hover)
+
     help_menu = window.menuBar().addMenu("&Help")
     help_action = QAction("&Help")
     help_menu.addAction(help_action)
@@ -1,19 +1,36 @@
 import math
-from enum import Enum, auto
+from collections import OrderedDict
+from types import MappingProxyType
 
-from PyQt6.QtCore import QRectF, QTimer, Qt
-from PyQt6.QtGui import QColor, QPen, QBrush, QPainterPath
-from PyQt6.QtWidgets import (QColorDialog, QGraphicsLineItem, QGraphicsPathItem,
-                             QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsSimpleTextItem)
+from PyQt6.QtCore import QLineF, QPointF, QRectF, QTimer, Qt
+from PyQt6.QtGui import (QColor, QPen, QBrush, QPainterPath, QPainterPathStroker, QImage, QPainter, QPixmap,
+                         QFont, QStaticText, QTransform)
+from PyQt6.QtWidgets import (QColorDialog, QGraphicsItem, QGraphicsLineItem, QGraphicsPathItem,
+                             QGraphicsRectItem, QGraphicsEllipseItem)
+
+from ribbon_layout import RibbonLayout
+from ribbon_model import (EDGE_L, EDGE_R, END, END_BOTH, END_LIKE_L, END_LIKE_R, NONE, Const, KnotRef, RibbonModel,
+                          templates)
+from ribbon_worker import PropagationWorker
 
 
 class Ribbon():
+    SPARE_BLOCKS = 8  # virtual mode: row blocks kept out of the scene after scrolling away
 
-    def __init__(self, scene, width, length, type):
+    def __init__(self, scene, width, length, type, batched=False, virtual=False):
         self.scene = scene
         # ✅ Attach this Ribbon instance to the scene
         if scene is not None:
+            # results of the worker of an old ribbon of the scene are dropped with its items
+            old = getattr(scene, "ribbon", None)
+            if old is not None:
+                old.detach()
             setattr(scene, "ribbon", self)
+            self.drop_tiles()  # the tiles of the blocks of an old ribbon
+            # one click timer for all items, a click pending on the items of an old ribbon is dropped
+            if getattr(scene, "clicks", None) is None:
+                setattr(scene, "clicks", ClickDispatcher())
+            scene.clicks.cancel()
             # print("✅ Ribbon registered to scene as 'scene.ribbon'")
         # store w and l as class variables
         self.w = width
@@ -32,6 +49,26 @@ class Ribbon():
         self.sqrt_2 = math.sqrt(2)
         self.changed = False
         self.undo_stack = None  # Will be set by MainWindow
+        # batched: one RowBlock item paints BLOCK_ROWS rows instead of items for each knot
+        # virtual: row blocks exist only for the rows shown by the view, see show_rows
+        self.virtual = virtual
+        self.batched = batched or virtual
+        self.blocks = []
+        self.spare_blocks = OrderedDict()  # blocks scrolled out of view, kept for reuse
+        # zoomed out the knot items are hidden and the KnotOverview is shown, see set_detail
+        self.detailed = True
+        self.overview = None
+        # the row numbers are painted by the view, see paint_labels
+        self.label_font = QFont()
+        self.label_font.setPointSize(18)
+        self.label_texts = {}  # row: QStaticText
+        # knots the region operations work on, outlined by a SelectionItem
+        self.selection = []
+        self.selection_item = None
+        # ThreadHighlight showing one thread above the dimmed ribbon, see highlight_thread
+        self.highlight = None
+        # PropagationWorker of the knot edits, None to propagate on the GUI thread, see set_background
+        self.worker = None
 
         # needed y-distance for color bar
         if self.type == "A":
@@ -58,827 +95,285 @@ class Ribbon():
         if self.thW == 0:
             self.thW = 1
         self.thW = int(self.thW)
-        self.color = my_Colors()
+        self.color = shared_colors
+
+        # pure data model with topology, knot types, visibility and thread colors
+        self.model = RibbonModel(self.w, self.l, self.type, palette=self.color.f, undefined=QColor("lightgrey"),
+                                 color_key=QColor.rgba)
+        self.model.propagate()
+        # QPen and QBrush of each color index of the model, created on first use
+        self.pens = {}
+        self.brushes = {}
 
         # generate relative knot point coordinates
         self.KnPnts = KnotPoints(self.Kd, self.Vd)
         self.make_empty_ribbon()
-        x = 0
-        for y in range(self.l):
-            self.K[x][y].edgeKL = True  # edge knot left
-        x = self.w - 1
-        for y in range(self.l):
-            self.K[x][y].edgeKR = True  # edge knot right
-
-        # define different ribbon types
-        match type:
-            case "L":
-                self.set_type_L()
-            case "R":
-                self.set_type_R()
-            case "M":
-                self.set_type_M()
-            case "A":
-                self.set_type_A()
-            case "W":
-                self.set_type_W()
-            case _:
-                print("Type Error !")
-                exit()
-
-        # # only for debugging
-        # for y in range(self.l):  # y .. index to the rows
-        #     for x in range(self.w):  # x .. index inside each row
-        #
-        #         if self.K[x][y].nKtoL:
-        #             coToL = f"nkToL:{self.K[x][y].nKtoL.co} "
-        #         else:
-        #             coToL = "no kKtoL "
-        #
-        #         if self.K[x][y].nKtoR:
-        #             coToR = f"nkToR:{self.K[x][y].nKtoR.co} "
-        #         else:
-        #             coToR = "no nKtoR "
-        #
-        #         if self.K[x][y].endK:
-        #             eKn = f"eKnType:{self.K[x][y].endKtype} "
-        #         else:
-        #             eKn = "no EndKnot "
-        #
-        #         Str = f"Knot:{self.K[x][y].co} KnType:{self.K[x][y].type} LeftThVis:{self.K[x][y].left_thread_vis} "
-        #         Str = Str + eKn + coToL + coToR
-        #
-        #         print(Str)
-        # # only for debugging
+
+        # draw the graphic items of the ribbon
+        self.draw_ribbon()
 
         self.draw_color_bar(type)
-        # print("**** Draw color bar completed !")
-        for i in range(width + 1):
-            CS = self.StartKnot_list[i]
-            color = CS.color
-            Kh = CS.Knot
-            direction = CS.direction
-            # color_name = self.color.print_color_key(color)
-            # print(f"Thread {i} color {color_name} 1st pass direction {direction}")
-            help = Kh.set_thread(color, direction, self.thW)
-        # run it 2 times to make sure all in colors are set.
-        for i in range(width + 1):
-            CS = self.StartKnot_list[i]
-            color = CS.color
-            Kh = CS.Knot
-            direction = CS.direction
-            # color_name = self.color.print_color_key(color)
-            help = Kh.set_thread(color, direction, self.thW)
         # print("Setup completed !")
-        self.row_labels()
-
-    def set_type_L(self):
-        self.make_knot_links(True, 0, self.w)
-        self.set_visible(0, self.w, Const.LeftThrdVis)
-
-        # set end knot types and next knot in one direction
-        self.set_end_knots(True, 0, self.w - 1)
-
-        self.cBx += 0.5 * self.Vd
-
-        for y in range(self.l):
-            for x in range(self.w):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (x + 2 * y)
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
-
-        # self.cplW = self.w * self.cBh * self.Vd + self.Rd + 2 * self.Ec
-        self.cplL = (self.w - 1) * self.Vd + (self.l - 1) * 2 * self.Vd + 2 * self.Kd + self.cBy
-        outline = QGraphicsRectItem(0, 0, self.cplW, self.cplL)
-        self.scene.addItem(outline)
-
-    def set_type_R(self):
-        self.make_knot_links(False, 0, self.w)
-        self.set_visible(0, self.w, Const.RightThrdVis)
-
-        # set end knot types and next knot in one direction
-        self.set_end_knots(False, 1, self.w)
-
-        self.cBx -= 0.5 * self.Vd
-
-        for y in range(self.l):
-            for x in range(self.w):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (self.w - 1 - x + 2 * y)
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
-
-        # self.cplW = self.w * self.cBh * self.Vd + self.Rd + 2 * self.Ec
-        self.cplL = (self.w - 1) * self.Vd + (self.l - 1) * 2 * self.Vd + 2 * self.Kd + self.cBy
-        outline = QGraphicsRectItem(0, 0, self.cplW, self.cplL)
-        self.scene.addItem(outline)
-
-    def set_type_M(self):
-
-        mid = self.w // 2
-
-        self.make_knot_links(True, 0, mid)
-        self.make_knot_links(False, mid + 1, self.w)
-        self.set_type(mid, Const.Rk)
-        self.set_visible(mid + 1, self.w, Const.RightThrdVis)
-        self.fix_middle_knot_links("M", mid)
-
-        # set end knot types and next knot in one direction
-        self.set_end_knots(True, 0, mid)
-        self.set_end_knots(False, mid + 1, self.w)
-
-        # likeTypeL direction
-        for y in range(self.l):
-            for x in range(self.w // 2 + 1):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (x + 2 * y)
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
-
-        # likeTypeR direction
-        for y in range(self.l):
-            for x in range(self.w // 2 + 1, self.w):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (self.w - 1 - x + 2 * y)
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
-
-        # self.cplW = self.w * self.cBh * self.Vd + self.Rd + 2 * self.Ec
-        self.cplL = (self.w - 1) / 2 * self.Vd + (self.l - 1) * 2 * self.Vd + 2 * self.Kd + self.cBy
-        outline = QGraphicsRectItem(0, 0, self.cplW, self.cplL)
-        self.scene.addItem(outline)
-
-    def set_type_A(self):
-
-        mid = self.w // 2
-
-        self.make_knot_links(False, 0, mid)
-        self.make_knot_links(True, mid + 1, self.w)
-        self.set_type(mid, Const.Rk)
-        self.set_visible(0, mid, Const.RightThrdVis)
-        self.fix_middle_knot_links("A", mid)
-
-        # set end knot types and next knot in one direction
-        self.set_end_knots(False, 1, mid + 1)
-        self.set_end_knots(True, mid, self.w - 1)
-        self.K[mid][self.l - 1].endKtype = Const.EndKnBoth
-
-        # likeTypeL direction
-        for y in range(self.l):
-            for x in range(mid, self.w):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (x + 2 * y)
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
-
-        # likeTypeR direction
-        for y in range(self.l):
-            for x in range(mid):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (self.w - 1 - x + 2 * y)
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
-
-        # self.cplW = self.w * self.cBh * self.Vd + self.Rd + 2 * self.Ec
-        self.cplL = (self.w - 1) * self.Vd + (self.l - 1) * 2 * self.Vd + 2 * self.Kd + self.cBy
-        outline = QGraphicsRectItem(0, 0, self.cplW, self.cplL)
-        self.scene.addItem(outline)
-
-    def set_type_W(self):
-
-        # w = 4 * d + 1 : 5, 9, 13, 17, 21, 25, 29, ...
-        # calculate x values  example w = 13 d = 3
-        d = int(self.w / 4)
-        # d = 3
-        x0 = 0  # x0 = 0
-        x1 = d  # x1 = 3
-        x2 = x1 + d  # x2 = 6
-        x3 = x2 + d  # x3 = 9
-        x4 = x3 + d  # x4 = 12
-
-        self.make_knot_links(True, x0, x1 + 1)  # 0 - 3
-        self.make_knot_links(False, x1, x2 + 1)  # 4 - 6
-        self.make_knot_links(True, x2, x3 + 1)  # 7 - 9
-        self.make_knot_links(False, x3, x4 + 1)  # 10 - 12
-        self.set_type(x1, Const.Rk)  # 3
-        self.set_type(x2, Const.Rk)  # 6
-        self.set_type(x3, Const.Rk)  # 9
-        self.set_visible(x0, x1 + 1, Const.LeftThrdVis)  # 0 - 3
-        self.set_visible(x1, x2 + 1, Const.RightThrdVis)  # 4 - 6
-        self.set_visible(x2, x3, Const.LeftThrdVis)  # 7 - 9
-        self.set_visible(x3 + 1, x4 + 1, Const.RightThrdVis)  # 10 - 12
-        self.fix_middle_knot_links("M", x1)  # 3 behaves like type M
-        self.fix_middle_knot_links("A", x2)  # 6 behaves like type A
-        self.fix_middle_knot_links("M", x3)  # 9 behaves like type M
-
-        # set endKtype and next knot in one direction
-        self.K[x1][self.l - 1].endKtype = Const.EndKnNone
-        self.set_end_knots(True, x0, x1)  # 0 - 3
-        self.set_end_knots(False, x1 + 1, x2 + 1)  # 4 - 5
-        self.set_end_knots(True, x2, x3)  # 7 - 9
-        self.K[x2][self.l - 1].endKtype = Const.EndKnBoth
-        self.K[x3][self.l - 1].endKtype = Const.EndKnNone
-        self.set_end_knots(False, x3 + 1, x4 + 1)  # 10 - 12
-
-        # likeTypeL direction
-        for y in range(self.l):
-            for x in range(x0, x1 + 1):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (2 * y - x0 + x)
-                # print(f"'{x}/{y}';{self.K[x][y].gco.x:.0f};{self.K[x][y].gco.y:.0f}")
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"endKtype {self.K[x][y].endKtype} gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
-
-        # likeTypeR direction
-        for y in range(self.l):
-            for x in range(x1 + 1, x2 + 1):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (2 * y + x2 - x)
-                # print(f"'{x}/{y}';{self.K[x][y].gco.x:.0f};{self.K[x][y].gco.y:.0f}")
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"endKtype {self.K[x][y].endKtype} gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
-
-        # likeTypeL direction
-        for y in range(self.l):
-            for x in range(x2 + 1, x3 + 1):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (2 * y - x2 + x)
-                # print(f"'{x}/{y}';{self.K[x][y].gco.x:.0f};{self.K[x][y].gco.y:.0f}")
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"endKtype {self.K[x][y].endKtype} gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
-
-        # reverse direction
-        for y in range(self.l):
-            for x in range(x3 + 1, x4 + 1):
-                self.K[x][y].gco.x = self.cBx + self.Ec + self.Vd * x
-                self.K[x][y].gco.y = self.cBy + self.Ec + self.Vd * (2 * y + x4 - x)
-                # print(f"'{x}/{y}';{self.K[x][y].gco.x:.0f};{self.K[x][y].gco.y:.0f}")
-                # print(f"likeTypeL, x {x} y {y}  strtK {self.K[x][y].strtK} endK {self.K[x][y].endK}, "
-                #       f"type {self.K[x][y].type} eKL {self.K[x][y].edgeKL} eKR {self.K[x][y].edgeKR} "
-                #       f"endKtype {self.K[x][y].endKtype} gco.x {self.K[x][y].gco.x:.0f} gco.y {self.K[x][y].gco.y:.0f}")
-                color = QColor("black")
-                self.K[x][y].draw_graphic_items(color, self.thW, self.Kd, self.scene)
 
+    def draw_ribbon(self):
+        # draw the knots of all ribbon types from the flat arrays of the layout
+        if self.type == "L":
+            self.cBx += 0.5 * self.Vd
+        elif self.type == "R":
+            self.cBx -= 0.5 * self.Vd
+        # the geometry constants are the same for all ribbons, so the layout is kept with the template,
+        # a layout of other constants, from a file written by an older version, is computed again
+        template = self.model.template
+        x0 = self.cBx + self.Ec
+        y0 = self.cBy + self.Ec
+        geometry = RibbonLayout.geometry_of(x0, y0, self.Vd, self.KnPnts)
+        if template.layout is None or template.layout.geometry != geometry:
+            template.layout = RibbonLayout(self.type, self.w, self.l, x0, y0, self.Vd, self.KnPnts)
+            templates.put(template)
+        self.layout = template.layout
+
+        if self.virtual:
+            # the blocks are created by show_rows
+            self.blocks = [None] * ((self.l + RowBlock.BLOCK_ROWS - 1) // RowBlock.BLOCK_ROWS)
+        elif self.batched:
+            for first in range(0, self.l, RowBlock.BLOCK_ROWS):
+                block = RowBlock(self, first, min(first + RowBlock.BLOCK_ROWS, self.l))
+                self.scene.addItem(block)
+                self.blocks.append(block)
+        else:
+            color = QColor("black")
+            K = self.K
+            l = self.l
+            for k in self.layout.knots():
+                K[k // l][k % l].draw_graphic_items(color, self.thW, self.Kd, self.scene)
+
+        # M and W ribbons start in the middle, their columns reach only half as deep
+        depth = (self.w - 1) / 2 if self.type in ("M", "W") else self.w - 1
         # self.cplW = self.w * self.cBh * self.Vd + self.Rd + 2 * self.Ec
-        self.cplL = (self.w - 1) / 2 * self.Vd + (self.l - 1) * 2 * self.Vd + 2 * self.Kd + self.cBy
+        self.cplL = depth * self.Vd + (self.l - 1) * 2 * self.Vd + 2 * self.Kd + self.cBy
         outline = QGraphicsRectItem(0, 0, self.cplW, self.cplL)
         self.scene.addItem(outline)
 
     def make_empty_ribbon(self):
-        self.K = [[Knot(self.scene, self.KnPnts) for _ in range(self.l)] for _ in range(self.w)]
-
-        # only for debug ?
-        for y in range(self.l):  # y .. index to the rows
-            for x in range(self.w):  # x .. index inside each row
-                self.K[x][y].co[0] = x
-                self.K[x][y].co[1] = y
-                # print(f"x {x}, y {y}, type {self.K[x][y].type} "
-                #       f"co[0] {self.K[x][y].co[0]} co[1] {self.K[x][y].co[1]}") # for debug
-
-        # set start and end knots
-        y = 0
-        for x in range(self.w):
-            self.K[x][y].strtK = True  # start knot
-        y = self.l - 1
-        for x in range(self.w):
-            self.K[x][y].endK = True  # end knot
-
-    def make_knot_links(self, likeTypeL, start, stop):
-        # at init all knot are type Nk
-        for y in range(self.l):  # y .. index to the rows
-            for x in range(start, stop):  # x .. index to columns
-                if not self.K[x][y].endK:
-                    if likeTypeL:
-                        nKtoR = Knot(self.scene, self.KnPnts)
-                        nKtoL = Knot(self.scene, self.KnPnts)
-                        if self.K[x][y].edgeKL:
-                            nKtoR = self.K[x + 1][y]
-                            nKtoL = self.K[x][y + 1]
-                            # print(f"Knot ; x {x} ; y {y} ; edgeKL ; "
-                            #       f"nKtoR: ; x {x+1} ; y {y} ; "
-                            #       f"nKtoL ; x {x} ; y {y+1} ")
-                        elif self.K[x][y].edgeKR:
-                            nKtoR = self.K[x][y + 1]
-                            nKtoL = self.K[x - 1][y + 1]
-                            # print(f"Knot ; x {x} ; y {y} ; edgeKR ; "
-                            #       f"nKtoR: ; x {x} ; y {y +1} ; "
-                            #       f"nKtoL ; x {x-1} ; y {y+1} ")
-                        else:
-                            nKtoR = self.K[x + 1][y]
-                            nKtoL = self.K[x - 1][y + 1]
-                            # print(f"Knot ; x {x} ; y {y} ; inner knot ; "
-                            #       f"nKtoR: ; x {x+1} y {y} ; "
-                            #       f"nKtoL ; x {x-1} y {y+1} ")
-                    else:  # reverse
-                        nKtoR = Knot(self.scene, self.KnPnts)
-                        nKtoL = Knot(self.scene, self.KnPnts)
-                        if self.K[x][y].edgeKL:
-                            nKtoR = self.K[x + 1][y + 1]
-                            nKtoL = self.K[x][y + 1]
-                            # print(f"Knot ; x {x} ; y {y} ; edgeKL ; "
-                            #       f"nKtoR: ; x {x+1} ; y {y} ; "
-                            #       f"nKtoL ; x {x} ; y {y+1} ")
-                        elif self.K[x][y].edgeKR:
-                            nKtoR = self.K[x][y + 1]
-                            nKtoL = self.K[x - 1][y]
-                            # print(f"Knot ; x {x} ; y {y} ; edgeKR ; "
-                            #       f"nKtoR: ; x {x+1} ; y {y} ; "
-                            #       f"nKtoL ; x {x-1} ; y {y} ")
-                        else:
-                            nKtoR = self.K[x + 1][y + 1]
-                            nKtoL = self.K[x - 1][y]
-                            # print(f"Knot ; x {x} ; y {y} ; inner knot ; "
-                            #       f"nKtoR: ; x {x+1} y {y} ; "
-                            #       f"nKtoL ; x {x-1} y {y} ")
-
-                    self.K[x][y].nKtoR = nKtoR
-                    self.K[x][y].nKtoL = nKtoL
-                    # print(f"Knot cox {self.K[x][y].co[0]} coy {self.K[x][y].co[1]} ; "
-                    #       f"nKtoR: cox {self.K[x][y].nKtoR.co[0]} coy {self.K[x][y].nKtoR.co[1]} ; "
-                    #       f"nKtoL: cox {self.K[x][y].nKtoL.co[0]} coy {self.K[x][y].nKtoL.co[1]}")
-
-    def fix_middle_knot_links(self, type, column):
-        x = column
-        for y in range(self.l):
-            # print(f" Knot x ; {self.K[x][y].co[0]} ; {self.K[x][y].co[1]}")
-            if not self.K[x][y].endK:
-                nKtoR = Knot(self.scene, self.KnPnts)
-                nKtoL = Knot(self.scene, self.KnPnts)
-                if type == "M":
-                    nKtoR = self.K[x + 1][y + 1]
-                    nKtoL = self.K[x - 1][y + 1]
-                elif type == "A":
-                    nKtoR = self.K[x + 1][y]
-                    nKtoL = self.K[x - 1][y]
-                else:
-                    print("No such type !")
-
-                self.K[x][y].nKtoR = nKtoR
-                self.K[x][y].nKtoL = nKtoL
-                # print(f" nKtoR  {self.K[x][y].nKtoR.co[0]} ; {self.K[x][y].nKtoR.co[1]} ; "
-                #       f"nKtoL {self.K[x][y].nKtoL.co[0]} ;  {self.K[x][y].nKtoL.co[1]}")
-
-    def set_end_knots(self, likeTypeL, start, stop):
-        y = self.l - 1
-        for x in range(start, stop):
-            if likeTypeL and not self.K[x][y].edgeKR:
-                # print(f" Knot x ; {self.K[x][y].co[0]} ; {self.K[x][y].co[1]}")
-                self.K[x][y].endKtype = Const.EndKnLikeTypeL
-                nKtoR = Knot(self.scene, self.KnPnts)
-                nKtoR = self.K[x + 1][y]
-                self.K[x][y].nKtoR = nKtoR
-            else:
-                # print(f" Knot x ; {self.K[x][y].co[0]} ; {self.K[x][y].co[1]}")
-                self.K[x][y].endKtype = Const.EndKnLikeTypeR
-                nKtoL = Knot(self.scene, self.KnPnts)
-                nKtoL = self.K[x - 1][y]
-                self.K[x][y].nKtoL = nKtoL
+        # one graphic knot for each knot of the model, created when a column is indexed
+        self.K = [KnotColumn(self, x) for x in range(self.w)]
 
     def toggle_type(self, column):
         # toggle between NK and Rk
-        x = column
-        for y in range(self.l):
-            if self.K[x][y].type == Const.Nk:
-                self.K[x][y].type = Const.Rk
-            else:
-                self.K[x][y].type = Const.Nk
+        self.model.toggle_type(column)
 
     def set_type(self, column, type):
-        # toggle between NK and Rk
-        x = column
-        for y in range(self.l):
-            self.K[x][y].type = type
+        self.model.set_type(column, type)
 
     def set_visible(self, start, stop, const):
-        for y in range(self.l):
-            for x in range(start, stop):
-                if const == Const.LeftThrdVis:
-                    self.K[x][y].left_thread_vis = True
-                elif const == Const.RightThrdVis:
-                    self.K[x][y].left_thread_vis = False
-                else:
-                    print("Error")
+        self.model.set_visible(start, stop, const)
 
     def draw_color_bar(self, type):
-        # preset available start colors
-        black = QColor("black")
-        red = QColor.fromRgb(255, 99, 71)
-        green = QColor.fromRgb(0, 255, 0)
-        blue = QColor.fromRgb(0, 191, 255)
-        grey = QColor("lightgrey")
-        darkgrey = QColor("darkgrey")
-        cyan = QColor("cyan")
-        magenta = QColor.fromRgb(238, 130, 238)
-        yellow = QColor("yellow")
-        f = [red, green, blue, black, cyan, magenta, yellow, darkgrey]
-        colors = []
-
-        outline = black
-        penO = QPen()
-        penO.setWidth(1)
-        penO.setColor(outline)
-
-        if type == "L" or type == "R":
-            j = 0
-            for i in range(self.w + 1):
-                color_name = self.color.print_color_key(f[j % 8])
-                # print(f"i {i} j {j} color {color_name}")
-                colors.append(f[j % 8])
-                j += 1
-        elif type == "M" or type == "A":  # type M or A
-            mid = self.w // 2
-            j = 0
-            for i in range(0, mid + 1):
-                color_name = self.color.print_color_key(f[j % 8])
-                # print(f"i {i} j {j} color {color_name}")
-                colors.append(f[j % 8])
-                j += 1
-            j = mid
-            for i in range(self.w + 1, mid + 1, -1):
-                color_name = self.color.print_color_key(f[j % 8])
-                # print(f"i {i} j {j} color {color_name}")
-                colors.append(f[j % 8])
-                j -= 1
-        elif type == "W":
-            pattern = []
-            d = int(self.w / 4)
-            x0 = 0
-            x1 = d
-            x2 = 2 * d
-            x3 = 3 * d
-            x4 = 4 * d
-
-            # set repeat pattern
-            # symmetric pattern
-            i = 0
-            pattern.append(f[i % 8])
-            pattern.append(f[i % 8])
-            for i in range(1, d):
-                pattern.append(f[i % 8])
-
-            # # use for unsymmetric pattern
-            # for i in range(d +1):
-            #     pattern.append(f[i % 8])
-
-            for i in range(0, x1 + 1):
-                colors.append(pattern[i])
-                # h = [f"r {colors[i].red()} g {colors[i].green()} b {colors[i].blue()}"]
-                # color_name = self.color.print_color_key(colors[i])
-                # print(f"j {i} color_name, {color_name}, rgb {h}")
-            j = d
-            for i in range(x1 + 1, x2 + 2):
-                colors.append(pattern[j])
-                j -= 1
-                # h = [f"r {colors[i].red()} g {colors[i].green()} b {colors[i].blue()}"]
-                # color_name = self.color.print_color_key(colors[i])
-                # print(f"j {i} color_name, {color_name}, rgb {h}")
-            j = 2
-            for i in range(x2 + 2, x3 + 1):
-                colors.append(pattern[j])
-                j += 1
-                # h = [f"r {colors[i].red()} g {colors[i].green()} b {colors[i].blue()}"]
-                # color_name = self.color.print_color_key(colors[i])
-                # print(f"j {i} color_name, {color_name}, rgb {h}")
-            j = d
-            for i in range(x3 + 1, x4 + 2):
-                colors.append(pattern[j])
-                j -= 1
-                # h = [f"r {colors[i].red()} g {colors[i].green()} b {colors[i].blue()}"]
-                # color_name = self.color.print_color_key(colors[i])
-                # print(f"j {i} color_name, {color_name}, rgb {h}")
-
-        # offset = 0  # offset of ColorSelect rectangles
-        for i in range(self.w + 1):
-            # rotate start colors
-            fill = colors[i]
-            hK = self.get_start_knot(i, fill)
-            nextKnot = hK["Knot"]
-            direction = hK["Direction"]
-            rect = hK["Rect"]
+        penO = shared_styles.pen(QColor("black"))
+
+        # displacement of ColorRects to the related start knot
+        rect_dis = {"left": self.dis_left, "left_high": self.dis_left_high, "none": self.dis_none,
+                    "right": self.dis_right, "right_high": self.dis_right_high}
+
+        for thread in self.model.threads:
+            i = thread.index
+            nextKnot = self.K[thread.knot // self.l][thread.knot % self.l]
+            ref = nextKnot.gco + rect_dis[thread.rect_pos]
+            rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
             rect.setPen(penO)
-            rect.setBrush(fill)
-            cRect = Vector()
+            rect.setBrush(self.brush(thread.c))
             cRect = self.center(rect)
-            cCircle = Vector()
-            cCircle = self.center(nextKnot.circle)
+            cCircle = nextKnot.gco + Vector(self.Kd / 2, self.Kd / 2)
             line = QGraphicsLineItem(cRect.x, cRect.y, cCircle.x, cCircle.y)
-            penL = QPen()
-            penL.setColor(fill)
-            penL.setWidth(self.thW)
-            line.setPen(penL)
+            line.setPen(self.pen(thread.c))
             self.scene.addItem(line)
-            StKnot = self.KnotList(self.scene, self.KnPnts)  # save start knot
-            StKnot.color = fill  # thread color
-            StKnot.Knot = hK["Knot"]  # start knot
-            StKnot.direction = hK["Direction"]  # start input direction
-            StKnot.line = line
+            StKnot = self.KnotList(thread, nextKnot, line, rect)  # save start knot
             self.StartKnot_list.append(StKnot)
-            # offset += self.Vd * self.cBh
             self.scene.addItem(rect)
 
-    def get_start_knot(self, i, fill):
-        nextKnot = Knot(self.scene, self.KnPnts)
-        Rect = None
-        hK = {"Knot": nextKnot, "Direction": Const.LeftIn, "Rect": Rect}
-        ref = Vector()
-        # hK = [Knot(self.scene, self.KnPnts), Const.LeftIn]  # help Knot and input direction
-        match self.type:
-            case "L":
-                if i == 0:
-                    hK["Knot"] = self.K[0][0]
-                    hK["Direction"] = Const.LeftIn
-                    self.K[0][0].color_in_left = fill
-                    ref = self.K[0][0].gco + self.dis_left
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[0][0], Const.LeftIn]  # left input
-                    # hK[0].color_in_left = fill
-                # k stays same, as knot has two inputs threads
-                elif i == 1:
-                    hK["Knot"] = self.K[0][0]
-                    hK["Direction"] = Const.RightIn
-                    self.K[0][0].color_in_right = fill
-                    ref = self.K[0][0].gco + self.dis_none
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[0][0], Const.RightIn]  # right input
-                    # hK[0].color_in_right = fill
+    def pen(self, c):
+        # thread pen of color index c, the color table of the model only grows
+        pen = self.pens.get(c)
+        if pen is None:
+            pen = self.pens[c] = shared_styles.pen(self.model.colors[c], self.thW)
+        return pen
+
+    def brush(self, c):
+        # knot fill of color index c
+        brush = self.brushes.get(c)
+        if brush is None:
+            brush = self.brushes[c] = shared_styles.brush(self.model.colors[c])
+        return brush
+
+    def update_rows(self, knots):
+        # batched mode: repaint the row blocks with the circles and exit segments of the knots
+        l = self.l
+        knots = list(knots)
+        self.update_overview(knots)
+        rows = {k % l for k in knots}
+        for i in {y // RowBlock.BLOCK_ROWS for y in rows} | {min(y + 1, l - 1) // RowBlock.BLOCK_ROWS for y in rows}:
+            # virtual mode: blocks out of view are painted when shown, their tiles are outdated
+            block = self.blocks[i] or self.spare_blocks.get(i)
+            if block is not None:
+                block.changed()
+
+    def show_rows(self, top, bottom):
+        # virtual mode: keep the row blocks of the rows between the scene y coordinates top and bottom
+        if not self.blocks or not self.detailed:
+            return
+        B = RowBlock.BLOCK_ROWS
+        rows = self.layout.rows_between(top, bottom, self.Kd)
+        # a block draws the segments of the row above it, so the block below the rows is needed too
+        wanted = range(rows.start // B, min(rows.stop // B + 1, len(self.blocks))) if rows else range(0)
+        for i, block in enumerate(self.blocks):
+            if block is not None and i not in wanted:
+                self.scene.removeItem(block)
+                self.blocks[i] = None
+                self.spare_blocks[i] = block
+                if len(self.spare_blocks) > self.SPARE_BLOCKS:
+                    self.drop_tiles(self.spare_blocks.popitem(last=False)[1])
+        for i in wanted:
+            if self.blocks[i] is not None:
+                continue
+            block = self.spare_blocks.pop(i, None)
+            if block is None:
+                block = RowBlock(self, i * B, min((i + 1) * B, self.l))
+            self.scene.addItem(block)
+            self.blocks[i] = block
+
+    def detach(self):
+        # the items are deleted with the scene: drop the worker results, pending clicks and tiles
+        # and the reference of the scene, so the view does not reach the deleted items
+        if self.worker is not None:
+            self.worker.cancel()
+        self.scene.clicks.cancel()
+        self.drop_tiles()
+        if getattr(self.scene, "ribbon", None) is self:
+            setattr(self.scene, "ribbon", None)
+
+    def drop_tiles(self, block=None):
+        # forget the tiles of block, or of all blocks, in the TileCaches of the views of the scene
+        for view in self.scene.views():
+            tiles = getattr(view, "tiles", None)
+            if tiles is not None:
+                if block is None:
+                    tiles.clear()
                 else:
-                    hK["Knot"] = self.K[i - 1][0]
-                    hK["Direction"] = Const.RightIn
-                    self.K[i - 1][0].color_in_left = fill
-                    ref = self.K[i - 1][0].gco + self.dis_none
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[i - 1][0], Const.RightIn]  # right input
-                    # hK[0].color_in_left = fill
-                return (hK)
-            case "R":
-                if i < self.w - 1:
-                    hK["Knot"] = self.K[i][0]
-                    hK["Direction"] = Const.LeftIn
-                    self.K[i][0].color_in_left = fill
-                    ref = self.K[i][0].gco + self.dis_none
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[i][0], Const.LeftIn]  # left input
-                    # hK[0].color_in_left = fill
-                elif i == self.w - 1:
-                    hK["Knot"] = self.K[self.w - 1][0]
-                    hK["Direction"] = Const.LeftIn
-                    self.K[i][0].color_in_left = fill
-                    ref = self.K[self.w - 1][0].gco + self.dis_none
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[self.w - 1][0], Const.LeftIn]  # left input
-                    # hK[0].color_in_left = fill
-                    # k stays same, as knot has two inputs threads
-                elif i == self.w:
-                    hK["Knot"] = self.K[self.w - 1][0]
-                    hK["Direction"] = Const.RightIn
-                    self.K[self.w - 1][0].color_in_right = fill
-                    ref = self.K[self.w - 1][0].gco + self.dis_right
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[self.w - 1][0], Const.RightIn]  # right input
-                    # hK[0].color_in_right = fill
-                return (hK)
-            case "M":
-                mid = int((self.w - 1) // 2)
-                # print(f"i {i}")
-                if i == 0:
-                    hK["Knot"] = self.K[0][0]
-                    hK["Direction"] = Const.LeftIn
-                    self.K[0][0].color_in_left = fill
-                    ref = self.K[0][0].gco + self.dis_left
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[0][0], Const.LeftIn]  # left input
-                    # hK[0].color_in_left = fill
-                elif i == 1:
-                    hK["Knot"] = self.K[0][0]
-                    hK["Direction"] = Const.RightIn
-                    ref = self.K[0][0].gco + self.dis_none
-                    self.K[0][0].color_in_right = fill
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[0][0], Const.RightIn]  # right input
-                    # hK[0].color_in_right = fill
-                elif i <= mid:
-                    hK["Knot"] = self.K[i - 1][0]
-                    hK["Direction"] = Const.RightIn
-                    ref = self.K[i - 1][0].gco + self.dis_none
-                    self.K[i - 1][0].color_in_right = fill
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[i - 1][0], Const.RightIn]  # right input
-                    # hK[0].color_in_right = fill
-                elif i < self.w - 1:
-                    hK["Knot"] = self.K[i][0]
-                    hK["Direction"] = Const.LeftIn
-                    ref = self.K[i][0].gco + self.dis_none
-                    self.K[i][0].color_in_left = fill
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[i][0], Const.LeftIn]  # left input
-                    # hK[0].color_in_left = fill
-                elif i == self.w - 1:
-                    hK["Knot"] = self.K[self.w - 1][0]
-                    hK["Direction"] = Const.LeftIn
-                    ref = self.K[self.w - 1][0].gco + self.dis_none
-                    self.K[self.w - 1][0].color_in_left = fill
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[self.w - 1][0], Const.LeftIn]  # left input
-                    # hK[0].color_in_left = fill
-                elif i == self.w:
-                    hK["Knot"] = self.K[self.w - 1][0]
-                    hK["Direction"] = Const.RightIn
-                    self.K[self.w - 1][0].color_in_right = fill
-                    ref = self.K[self.w - 1][0].gco + self.dis_right
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[self.w - 1][0], Const.RightIn]  # right input
-                    # hK[0].color_in_right = fill
-                return (hK)
-            case "A":
-                mid = int((self.w - 1) // 2)
-                # print(f"mid {mid} i {i}")
-                if i < mid:
-                    hK["Knot"] = self.K[i][0]
-                    hK["Direction"] = Const.LeftIn
-                    self.K[i][0].color_in_left = fill
-                    ref = self.K[i][0].gco + self.dis_left
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[i][0], Const.LeftIn]  # left input
-                    # hK[0].color_in_left = fill
-                elif i == mid:
-                    hK["Knot"] = self.K[mid][0]
-                    hK["Direction"] = Const.LeftIn
-                    self.K[i][0].color_in_left = fill
-                    ref = self.K[mid][0].gco + self.dis_left
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                elif i == mid + 1:
-                    hK["Knot"] = self.K[mid][0]
-                    hK["Direction"] = Const.RightIn
-                    self.K[i][0].color_in_right = fill
-                    ref = self.K[mid][0].gco + self.dis_right
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                elif i < self.w + 1:
-                    hK["Knot"] = self.K[i - 1][0]
-                    hK["Direction"] = Const.RightIn
-                    self.K[i - 1][0].color_in_right = fill
-                    ref = self.K[i - 1][0].gco + self.dis_right
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                    # hK = [self.K[i - 1][0], Const.RightIn]  # right input
-                    # hK[0].color_in_right = fill
-                return (hK)
-            case "W":
-                d = int(self.w / 4)
-                x0 = 0
-                x1 = d
-                x2 = 2 * d
-                x3 = 3 * d
-                x4 = 4 * d
-
-                if i == 0:
-                    x = 0
-                    hK["Knot"] = self.K[x][0]
-                    hK["Direction"] = Const.LeftIn
-                    ref = self.K[x][0].gco + self.dis_left
-                    self.K[x][0].color_in_left = fill
-                    # color_name = self.color.print_color_key(fill)
-                    # print(
-                    #     f"i == 0;                 i:{i} color:{color_name} K.co:{self.K[x][0].co} Dir:{hK["Direction"]}")
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                elif i == 1:
-                    x = 0
-                    hK["Knot"] = self.K[x][0]
-                    hK["Direction"] = Const.RightIn
-                    ref = self.K[x][0].gco + self.dis_none
-                    # color_name = self.color.print_color_key(fill)
-                    # print(
-                    #     f"i == 1;                 i:{i} color:{color_name} K.co:{self.K[x][0].co} Dir:{hK["Direction"]}")
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                elif i >= 2 and i <= x1:
-                    x = i - 1
-                    hK["Knot"] = self.K[x][0]
-                    hK["Direction"] = Const.RightIn
-                    ref = self.K[x][0].gco + self.dis_none
-                    self.K[x][0].color_in_right = fill
-                    # color_name = self.color.print_color_key(fill)
-                    # print(
-                    #     f"i >= 2 and i <= x1;     i:{i} color:{color_name} K.co:{self.K[x][0].co} Dir:{hK["Direction"]}")
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                if i > x1 and i < x2 + 1:
-                    x = i
-                    hK["Knot"] = self.K[x][0]
-                    hK["Direction"] = Const.LeftIn
-                    self.K[x][0].color_in_left = fill
-                    ref = self.K[x][0].gco + self.dis_left_high
-                    # color_name = self.color.print_color_key(fill)
-                    # print(
-                    #     f"i > x1 and i < x2 + 1;  i:{i} color:{color_name} K.co:{self.K[x][0].co} Dir:{hK["Direction"]}")
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                elif i >= x2 + 1 and i < x3 + 1:
-                    x = i - 1
-                    hK["Knot"] = self.K[x][0]
-                    hK["Direction"] = Const.RightIn
-                    self.K[x][0].color_in_right = fill
-                    ref = self.K[x][0].gco + self.dis_right_high
-                    # color_name = self.color.print_color_key(fill)
-                    # print(
-                    #     f"i >= x2 and i < x3 + 1; i:{i} color:{color_name} K.co:{self.K[x][0].co} Dir:{hK["Direction"]}")
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                elif i >= x3 and i < x4 + 1:
-                    x = i
-                    hK["Knot"] = self.K[x][0]
-                    hK["Direction"] = Const.LeftIn
-                    self.K[x][0].color_in_right = fill
-                    ref = self.K[x][0].gco + self.dis_none
-                    # color_name = self.color.print_color_key(fill)
-                    # print(
-                    #     f"i >= x3 and i < x4;     i:{i} color:{color_name} K.co:{self.K[x][0].co} Dir:{hK["Direction"]}")
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                elif i == x4 + 1:
-                    x = x4
-                    hK["Knot"] = self.K[x][0]
-                    hK["Direction"] = Const.RightIn
-                    ref = self.K[x][0].gco + self.dis_right
-                    # color_name = self.color.print_color_key(fill)
-                    # print(
-                    #     f"i == x4;                i:{i} color:{color_name} K.co:{self.K[x][0].co} Dir:{hK["Direction"]}")
-                    self.K[x][0].color_in_left = fill
-                    Rect = ColorRect.rect_45(ref.x, ref.y, self.Rd, self.Rd, i)
-                    hK["Rect"] = Rect
-                return (hK)
-
-    def set_thread_color(self, CS):
-        # CS color select
-        color = QColor()
-        color = CS.color
-        pen = QPen()
-        pen.setColor(color)
-        pen.setWidth(self.thW)
-        CS.line.setPen(pen)
-        CS.line.update()
-        knot = CS.nextKnot
-        if knot.type == "const.Nk":  # normal knot
-            if CS.left_in:
-                knot.color_in_left = color
-                knot.line_out_right.setPen(pen)
-                knot.line_out_right(update)
-            else:
-                knot.color_in_right = color
-                knot.line_out_left.setPen(pen)
-                knot.line_out_left(update)
-        else:  # reverse knot
-            if CS.left_in:
-                knot.color_in_left = color
-                knot.line_out_left.setPen(pen)
-                knot.line_out_left(update)
-            else:
-                knot.color_in_right = color
-                knot.line_out_right.setPen(pen)
-                knot.line_out_right(update)
+                    tiles.drop(block)
+
+    def set_detail(self, detailed):
+        # show the knot items or, zoomed out, the KnotOverview instead
+        if detailed == self.detailed:
+            return
+        self.detailed = detailed
+        if self.overview is None:
+            self.overview = KnotOverview(self)
+            self.scene.addItem(self.overview)
+        self.overview.setVisible(not detailed)
+        for item in self.vector_items():
+            item.setVisible(detailed)
+
+    def vector_items(self):
+        # the items of the knots in the scene, not the color bar
+        for column in self.K:
+            for knot in column.knots:
+                if knot is not None and knot.circle is not None:
+                    yield from (item for item in (knot.circle, knot.line_out_left, knot.line_out_right,
+                                                  knot.arc_out_left, knot.arc_out_right) if item is not None)
+        for block in self.blocks:
+            if block is not None:
+                yield block
+
+    def update_overview(self, knots):
+        # repaint the knots in the overview images when they are shown next
+        if self.overview is not None:
+            self.overview.update_knots(knots)
+
+    def paint_path(self, path, c):
+        # update the graphic items along a thread path of color index c traced by the model
+        self.refresh_highlight()
+        if self.batched:
+            self.update_rows(k for k, outDir, segment in path)
+            return
+        pen = self.pen(c)
+        for k, outDir, segment in path:
+            K = self.K[k // self.l][k % self.l]
+            K.set_knot_color()
+            if segment is not None:
+                item = K.out_item(outDir, segment)
+                item.setPen(pen)
+                item.setZValue(0.4)
+
+    def set_background(self, background):
+        # propagate the knot edits on a worker thread, the diff is painted when it arrives
+        if background and self.worker is None:
+            self.worker = PropagationWorker(self.model)
+            self.worker.delivered.connect(self.paint_diff)
+        elif not background and self.worker is not None:
+            self.worker.sync()
+            self.worker = None
+
+    def sync(self):
+        # paint the edits the worker has in progress, before the colors of the model are used directly
+        if self.worker is not None:
+            self.worker.sync()
+
+    def change_knot_type(self, knot, type):
+        # toggle Nk/Rk of knot and repaint only the items whose color changed
+        if self.worker is not None:
+            self.worker.change_knots({knot.index: type.value}, {})
+            return
+        knots, segments = self.model.change_knot_type(knot.index, type.value)
+        self.paint_diff(knots, segments)
+
+    def change_knots(self, types, visible):
+        # set types and visibility of several knots with one propagation and repaint the diff
+        if self.worker is not None:
+            self.worker.change_knots(types, visible)
+            return
+        knots, segments = self.model.change_knots(types, visible)
+        self.paint_diff(knots, segments)
+
+    def paint_diff(self, knots, segments):
+        # update the knot circles and exit segments of a diff returned by the model
+        self.refresh_highlight()
+        if self.batched:
+            self.update_rows(knots + [k for k, outDir, segment in segments])
+            return
+        l = self.l
+        for k in knots:
+            self.K[k // l][k % l].set_knot_color()
+        for k, outDir, segment in segments:
+            c = self.model.color_out_left[k] if outDir == Const.LeftOut else self.model.color_out_right[k]
+            item = self.K[k // l][k % l].out_item(outDir, segment)
+            item.setPen(self.pen(c))
+            item.setZValue(0.4)
+
+    def update_graphic_items(self):
+        # update all knot items from the state of the model
+        self.refresh_highlight()
+        if self.overview is not None:
+            self.overview.clear()
+        for block in self.blocks:
+            if block is not None:
+                block.changed()
+        for block in self.spare_blocks.values():
+            block.changed()
+        if self.batched:
+            return
+        for x in range(self.w):
+            for y in range(self.l):
+                self.K[x][y].update_graphic_items(self.thW)
+
+    def set_thread_color(self, index, color):
+        # recolor the thread of color bar position index along its path in the model index
+        CS = self.StartKnot_list[index]
+        self.sync()
+        path = self.model.set_thread_color(index, QColor(color))
+        c = CS.thread.c
+        CS.rect.setBrush(self.brush(c))
+        CS.line.setPen(self.pen(c))
+        self.paint_path(path, c)
 
     def center(self, item):
         # calculate center of rectangle or circle
@@ -892,129 +387,277 @@ class Ribbon():
         center.y = y + h / 2
         return (center)
 
+    def knot_at(self, scene_pos):
+        # column and row of the knot whose circle contains scene_pos or None, computed from the layout
+        k = self.layout.knot_at(scene_pos.x(), scene_pos.y(), self.Kd)
+        return None if k is None else (k // self.l, k % self.l)
+
+    def segment_shape(self, k, direction, segment):
+        # QLineF of an exit line or QPainterPath of an exit arc of knot k like in Knot.draw_graphic_items
+        layout = self.layout
+        kp = self.KnPnts
+        left = direction == Const.LeftOut
+        line = QLineF(*(layout.line_left if left else layout.line_right)[4 * k:4 * k + 4])
+        if segment == Const.line:
+            return line
+        ref = (layout.arc_left if left else layout.arc_right)[2 * k:2 * k + 2]
+        path = QPainterPath()
+        path.moveTo(line.p1())
+        path.arcTo(QRectF(ref[0], ref[1], layout.arc_side, layout.arc_side),
+                   kp.StartAngLft if left else kp.StartAngRgt, kp.SpanAng if left else -kp.SpanAng)
+        return path
+
+    def thread_at(self, scene_pos):
+        """
+        Index of the thread shown at scene_pos: the visible thread of a knot circle or the
+        thread of an exit line or arc within a thread width, None if there is none.
+        """
+        self.sync()
+        model = self.model
+        co = self.knot_at(scene_pos)
+        if co is not None:
+            k = co[0] * self.l + co[1]
+            return model.thread_at(k, Const.LeftIn if model.left_vis[k] else Const.RightIn)
+        # a segment runs from its knot to a knot of the next column, one of them is nearest
+        # to the segment or a neighbour of the nearest knot
+        k = self.layout.nearest_knot(scene_pos.x(), scene_pos.y(), self.Kd)
+        stroker = QPainterPathStroker()
+        stroker.setWidth(self.thW * 1.5)
+        x0, y0 = divmod(k, self.l)
+        for x in range(max(x0 - 1, 0), min(x0 + 2, self.w)):
+            for y in range(max(y0 - 1, 0), min(y0 + 2, self.l)):
+                kn = x * self.l + y
+                for direction in (Const.LeftOut, Const.RightOut):
+                    exit = model.exit_segment(kn, direction)
+                    if exit is None:
+                        continue
+                    shape = self.segment_shape(kn, direction, exit[1])
+                    if isinstance(shape, QLineF):
+                        path = QPainterPath(shape.p1())
+                        path.lineTo(shape.p2())
+                        shape = path
+                    if stroker.createStroke(shape).contains(scene_pos):
+                        return model.thread_leaving(kn, direction)
+        return None
+
+    def highlight_thread(self, index):
+        # show thread index above the dimmed ribbon, None to end the highlight
+        if self.highlight is None:
+            if index is None:
+                return
+            self.highlight = ThreadHighlight(self)
+            self.scene.addItem(self.highlight)
+        if index != self.highlight.thread:
+            self.sync()
+            self.highlight.set_thread(index)
+
+    def refresh_highlight(self):
+        # the path of the highlighted thread changes with the knot types
+        if self.highlight is not None and self.highlight.thread is not None:
+            self.highlight.set_thread(self.highlight.thread)
+
+    def knots_on_line(self, start, end):
+        # indices of the knots whose circles the line from scene point start to end passes
+        steps = max(1, math.ceil(QLineF(start, end).length() / (self.Kd / 4)))
+        knots = []
+        for i in range(steps + 1):
+            p = start + (end - start) * (i / steps)
+            k = self.layout.knot_at(p.x(), p.y(), self.Kd)
+            if k is not None and k not in knots:
+                knots.append(k)
+        return knots
+
+    def single_click(self, knot, button):
+        # resolved by the click dispatcher of the scene
+        if button == Qt.MouseButton.LeftButton:
+            # print(f"Left single-click on {knot.co}")
+            self.toggle_knot_color(knot)
+        elif button == Qt.MouseButton.RightButton:
+            # print(f"Right single-click on, co {knot.co}")
+            self.change_thread_direction(knot)
+        else:
+            print(f"Other button single-click at {knot.co[0]}, {knot.co[1]}")
+
+    def double_click(self, knot, fold):
+        # print(f"Knot Double-clicked on {knot.co}")
+        self.change_thread_direction(knot, fold)
+
+    def toggle_knot_color(self, knot):
+        self.changed = True
+        # Use undo command if undo system is initialized
+        if self.undo_stack is not None:
+            from undo_commands import ToggleKnotColorCommand
+            self.undo_stack.push(ToggleKnotColorCommand(self, knot.co, knot.left_thread_vis))
+        else:
+            self.set_knot_visible(knot, not knot.left_thread_vis)
+
+    def set_knot_visible(self, knot, visible):
+        # show the left (True) or right thread in the circle of knot
+        if self.worker is not None:
+            # the colors of the inputs are final when the worker delivers, the knot is painted then
+            self.change_knots({}, {knot.index: visible})
+            return
+        knot.left_thread_vis = visible
+        knot.set_knot_color()
+
+    def change_thread_direction(self, knot, fold=False):
+        # fold: the change is undone together with the toggle of the instant click before it
+        self.changed = True
+        # Use undo command if undo system is initialized
+        if self.undo_stack is not None:
+            from undo_commands import ChangeKnotTypeCommand
+            self.undo_stack.push(ChangeKnotTypeCommand(self, knot.co, fold))
+        else:
+            self.change_knot_type(knot, Const.Rk if knot.type == Const.Nk else Const.Nk)
+
+    def edit_knots(self, types, visible, text):
+        # apply new types and visibility of several knots as one undo entry with one propagation
+        model = self.model
+        types = {k: type for k, type in types.items() if model.knot_type[k] != type}
+        visible = {k: vis for k, vis in visible.items() if bool(model.left_vis[k]) != vis}
+        if not (types or visible):
+            return
+        self.changed = True
+        if self.undo_stack is not None:
+            from undo_commands import PaintKnotsCommand
+            self.undo_stack.push(PaintKnotsCommand(self, types, visible,
+                                                   {k: model.knot_type[k] for k in types},
+                                                   {k: bool(model.left_vis[k]) for k in visible}, text))
+        else:
+            self.change_knots(types, visible)
+
+    def select(self, knots):
+        # knot indices of the new selection, empty to clear it
+        self.selection = list(dict.fromkeys(knots))
+        if self.selection_item is None:
+            self.selection_item = SelectionItem(self)
+            self.scene.addItem(self.selection_item)
+        self.selection_item.set_knots(self.selection)
+
+    def select_rect(self, rect):
+        # knots with their center in the scene rect
+        self.select(self.layout.knots_in_rect(rect.left(), rect.top(), rect.right(), rect.bottom(), self.Kd))
+
+    def select_rows(self, first, last):
+        # knots of the rows first .. last, in any order
+        first, last = sorted((first, last))
+        self.select(self.layout.knots(first, last + 1))
+
+    def select_column(self, x):
+        self.select(range(x * self.l, (x + 1) * self.l))
+
+    def select_diagonal(self, knot):
+        # knots on the diagonal through knot crossing its row
+        self.select(self.layout.diagonal(knot.index, self.Kd))
+
+    def set_selected_type(self, type):
+        self.edit_knots({k: type.value for k in self.selection}, {}, "Set Knot Types")
+
+    def toggle_selected_type(self):
+        knot_type = self.model.knot_type
+        self.edit_knots({k: Const.Rk.value if knot_type[k] == Const.Nk.value else Const.Nk.value
+                         for k in self.selection}, {}, "Toggle Knot Types")
+
+    def set_selected_visible(self, const):
+        # const LeftThrdVis or RightThrdVis like set_visible
+        self.edit_knots({}, {k: const == Const.LeftThrdVis for k in self.selection}, "Set Visible Threads")
+
+    def toggle_selected_visible(self):
+        left_vis = self.model.left_vis
+        self.edit_knots({}, {k: not left_vis[k] for k in self.selection}, "Toggle Visible Threads")
+
+    def selection_origin(self):
+        # first column and first row of the selection
+        l = self.l
+        return min(k // l for k in self.selection), min(k % l for k in self.selection)
+
+    def copy_selected(self):
+        """Types and visibility of the selected knots keyed by (column, row) relative to the selection origin"""
+        if not self.selection:
+            return None
+        x0, y0 = self.selection_origin()
+        l = self.l
+        return {(k // l - x0, k % l - y0): (self.model.knot_type[k], bool(self.model.left_vis[k]))
+                for k in self.selection}
+
+    def paste_selected(self, pattern):
+        """Apply a pattern of copy_selected with its origin at the origin of the selection"""
+        if not self.selection or not pattern:
+            return
+        x0, y0 = self.selection_origin()
+        types = {}
+        visible = {}
+        for (dx, dy), (type, vis) in pattern.items():
+            x = x0 + dx
+            y = y0 + dy
+            if x < self.w and y < self.l:
+                types[x * self.l + y] = type
+                visible[x * self.l + y] = vis
+        self.edit_knots(types, visible, "Paste Knots")
+        self.select(types)
+
     def extract_KnPar(self):
-        All_KnPar = []
-        for x in range(self.w):
-            column = []
-            for y in range(self.l):
-                KnPar = {
-                    "co": self.K[x][y].co,
-                    "left_thread_vis": self.K[x][y].left_thread_vis,
-                    "type": self.K[x][y].type,
-                    "endK": self.K[x][y].endK
-                }
-                column.append(KnPar)
-            All_KnPar.append(column)
-        return All_KnPar
-
-    def row_labels(self):
-        for i in range(self.l):
-            x = 0
-            label_pos = Vector()
-            displacement = Vector()
+        self.sync()
+        return self.model.extract_KnPar()
+
+    def paint_labels(self, painter, rect):
+        # row numbers left and right of the rows in the scene rect, painted by the view over the items
+        if not self.detailed:
+            return
+        layout = self.layout
+        right = (self.w - 1) * self.l
+        painter.setFont(self.label_font)
+        painter.setPen(shared_styles.pen(QColor("black")))
+        for i in self.layout.rows_between(rect.top(), rect.bottom(), self.Kd):
+            text = self.label_texts.get(i)
+            if text is None:
+                text = self.label_texts[i] = QStaticText(str(i))
+                text.prepare(QTransform(), self.label_font)
             if i < 10:
-                displacement.x = -self.Vd * 0.55
+                dx = -self.Vd * 0.55
             elif i < 100:
-                displacement.x = -self.Vd * 0.9
+                dx = -self.Vd * 0.9
             else:
-                displacement.x = -self.Vd * 1.225
-            # displacement.y = -self.Vd
-            label_pos = self.K[0][i].gco + displacement
-            label = str(i)
-            row_label = my_text(label, label_pos)
-            self.scene.addItem(row_label)
-            x = self.w - 1
-            displacement.x = self.Vd * 1.35
-            # displacement.y = -self.Vd
-            label_pos = self.K[self.w - 1][i].gco + displacement
-            label = str(i)
-            row_label = my_text(label, label_pos)
-            self.scene.addItem(row_label)
+                dx = -self.Vd * 1.225
+            painter.drawStaticText(QPointF(layout.knot_x[i] + dx, layout.knot_y[i]), text)
+            painter.drawStaticText(QPointF(layout.knot_x[right + i] + self.Vd * 1.35, layout.knot_y[right + i]), text)
 
     def to_dict(self):
         """Extract all ribbon data for saving to file"""
-        return {
-            "ribbon": {
-                "width": self.w,
-                "length": self.l,
-                "type": self.type
-            },
-            "thread_colors": [
-                [sk.color.red(), sk.color.green(), sk.color.blue()]
-                for sk in self.StartKnot_list
-            ],
-            "knots": [[
-                {
-                    "type": self.K[x][y].type.name,
-                    "left_thread_vis": self.K[x][y].left_thread_vis
-                }
-                for y in range(self.l)
-            ] for x in range(self.w)]
-        }
+        return self.model.to_dict(lambda color: [color.red(), color.green(), color.blue()])
 
     def restore_from_dict(self, data):
         """Restore knot states and thread colors from saved data"""
-        # Restore thread colors
-        thread_colors = data.get("thread_colors", [])
-        for i, rgb in enumerate(thread_colors):
-            if i < len(self.StartKnot_list):
-                new_color = QColor(rgb[0], rgb[1], rgb[2])
-                self.StartKnot_list[i].color = new_color
-                # Update the color rectangle
-                color_rect = self.StartKnot_list[i].line.scene().items()
-                # Find and update the corresponding ColorRect
-                for item in color_rect:
-                    if isinstance(item, ColorRect) and hasattr(item, 'index') and item.index == i:
-                        item.setBrush(QBrush(new_color))
-                        item.color = new_color
-                        break
-
-        # Restore knot states
-        knots_data = data.get("knots", [])
-        for x in range(min(self.w, len(knots_data))):
-            for y in range(min(self.l, len(knots_data[x]))):
-                knot_data = knots_data[x][y]
-                type_str = knot_data.get("type", "Nk")
-                self.K[x][y].type = getattr(Const, type_str, Const.Nk)
-                self.K[x][y].left_thread_vis = knot_data.get("left_thread_vis", True)
-                # Restore coordinates if present
-                if "co" in knot_data:
-                    self.K[x][y].co = knot_data["co"]
-
-        # Recalculate all thread colors through the pattern
-        pen = QPen()
-        pen.setWidth(self.thW)
-        for i in range(len(self.StartKnot_list)):
-            CS = self.StartKnot_list[i]
-            color = CS.color
-            Kh = CS.Knot
-            direction = CS.direction
-            pen.setColor(color)
-            line = CS.line
-            line.setPen(pen)
-            Kh.set_thread(color, direction, self.thW)
-
-        # Run twice to ensure all colors propagate
-        for i in range(len(self.StartKnot_list)):
-            CS = self.StartKnot_list[i]
-            color = CS.color
-            Kh = CS.Knot
-            direction = CS.direction
-            pen.setColor(color)
-            line = CS.line
-            line.setPen(pen)
-            Kh.set_thread(color, direction, self.thW)
+        if self.worker is not None:
+            self.worker.cancel()  # the model is propagated again
+        self.model.restore_from_dict(data, lambda rgb: QColor(rgb[0], rgb[1], rgb[2]))
+
+        # Update the color bar and all knot items from the model
+        for CS in self.StartKnot_list:
+            CS.rect.setBrush(self.brush(CS.thread.c))
+            CS.rect.color = CS.color
+            CS.line.setPen(self.pen(CS.thread.c))
+        self.update_graphic_items()
 
     def get_ribbon(self):
         scene = self.scene()
         return getattr(scene, "ribbon", None) if scene else None
 
     class KnotList():
-        def __init__(self, scene, KnPnts):
-            self.color = QColor()
-            self.Knot = Knot(scene, KnPnts)
-            self.direction = Const.LeftIn
-            self.line = QGraphicsLineItem()
+        def __init__(self, thread, knot, line, rect):
+            self.thread = thread  # StartThread of the model
+            self.Knot = knot  # start knot
+            self.direction = thread.direction  # start input direction
+            self.line = line
+            self.rect = rect
+
+        @property
+        def color(self):
+            return self.thread.color
+
+        @color.setter
+        def color(self, color):
+            self.thread.color = color
 
 
 class Vector:  # vector
@@ -1050,30 +693,6 @@ class Vector:  # vector
         return (math.sqrt(a.x ** 2 + a.y ** 2))
 
 
-class Const(Enum):
-    LeftIn = auto()
-    RightIn = auto()
-    LeftOut = auto()
-    RightOut = auto()
-    # Knots inside ribbon
-    Nk = auto()  # Normal not, 0 start threads
-    Rk = auto()  # Reverse not, 0 start threads
-    # end knots
-    EndKnLikeTypeR = auto()  # End knot left up to right down
-    EndKnLikeTypeL = auto()  # End knot right up to left down
-    EndKnBoth = auto()  # End knot right up to left down and left up to right dow, for type A only
-    # EndKnNoLeft =auto()
-    # EndKnNoRight =auto()
-    EndKnNone = auto()
-    LeftThrdVis = auto()
-    RightThrdVis = auto()
-    undefined = auto()
-    NA = auto()  # not available
-    # line types
-    arc = auto()
-    line = auto()
-
-
 class KnotPoints():
     def __init__(self, Kd, Vd):
         Ddi = Vd / Kd  # Ddi made smaller in relation to Kd
@@ -1183,36 +802,55 @@ class KnotPoints():
         # ***************************************************************************************#
 
 
-class Knot():
-    def __init__(self, scene, kpts):
-        self.scene = scene
-        if scene is not None:
-            setattr(scene, "knot", self)
-            # print("✅ knot registered to scene as 'scene.knot'")
-        undefined = QColor("lightgrey")
-        self.co = [0, 0]  # knot coordinate
-        self.gco = Vector()  # geometric coordinate
-        self.left_thread_vis = True
-        # left thread visible
-        self.knot_color = None  # color of circle fill
-        self.strtK = False  # start knot
-        self.endK = False  # end knot
-        self.edgeKL = False  # edge knot left
-        self.edgeKR = False  # edge knot right
-        self.color_in_left = QColor("lightgrey")  # input thread from left, QColor
-        self.color_in_right = QColor("lightgrey")  # input thread from right, QColor
-        self.type = Const.Nk  # normal knot
-        self.endKtype = Const.undefined
-        self.nKtoL = None  # next knot to left
-        self.nKtoR = None  # next knot to right
+class KnotColumn():
+    # the Knots of column x, a long ribbon in virtual mode only needs the Knots that are clicked
+    __slots__ = ("ribbon", "x", "knots")
+
+    def __init__(self, ribbon, x):
+        self.ribbon = ribbon
+        self.x = x
+        self.knots = [None] * ribbon.l
+
+    def __getitem__(self, y):
+        knot = self.knots[y]
+        if knot is None:
+            knot = self.knots[y] = Knot(self.ribbon, self.x * self.ribbon.l + y)
+        return knot
+
+    def __len__(self):
+        return len(self.knots)
+
+
+class Knot(KnotRef):
+    # graphic items of one knot, the knot state is kept in the arrays of the ribbon model
+    __slots__ = ("ribbon", "circle", "line_out_left", "line_out_right", "arc_out_left", "arc_out_right")
+
+    def __init__(self, ribbon, index):
+        super().__init__(ribbon.model, index)
+        self.ribbon = ribbon
         self.circle = None  # QgraphicsItem
         # lines and arcs connect to the next knots
         self.line_out_left = None  # QgraphicsItem
         self.line_out_right = None  # QgraphicsItem
         self.arc_out_left = None  # QgraphicsItem
         self.arc_out_right = None  # QgraphicsItem
-        self.kp = kpts  # precalculated relative knot points in each knot
-        self.colors = my_Colors()
+
+    @property
+    def scene(self):
+        return self.ribbon.scene
+
+    @property
+    def gco(self):  # geometric coordinate
+        layout = self.ribbon.layout
+        return Vector(layout.knot_x[self.index], layout.knot_y[self.index])
+
+    @property
+    def kp(self):  # precalculated relative knot points in each knot
+        return self.ribbon.KnPnts
+
+    @property
+    def colors(self):  # shared palette of preset colors
+        return shared_colors
 
     def KnPar():
         # basic paramters of each knot for json storage
@@ -1223,59 +861,49 @@ class Knot():
         self.endK = False
 
     def draw_graphic_items(self, color, thW, Dc, scene):
-        c1 = QColor("black")
-        undefined = QColor("lightgrey")
-        pen1 = QPen(c1)
-        pen2 = QPen(undefined)
-        pen1.setWidth(thW)
-        pen2.setWidth(thW)
-        circle = KnotCircle(self.gco.x, self.gco.y, Dc, Dc, self)
-        pen = QPen(color)
-        pen.setWidth(1)
-        brush = QBrush(undefined)
-        circle.setBrush(brush)
-        circle.setPen(pen)
+        pen2 = self.ribbon.pen(0)  # undefined color
+        layout = self.ribbon.layout
+        k = self.index
+        circle = KnotCircle(layout.knot_x[k], layout.knot_y[k], Dc, Dc, self)
+        circle.setBrush(self.ribbon.brush(0))
+        circle.setPen(shared_styles.pen(color))
         scene.addItem(circle)
         self.circle = circle
+        left = layout.line_left[4 * k:4 * k + 4]  # top and bottom point of exit line
+        right = layout.line_right[4 * k:4 * k + 4]
         # normal knots and middle reverse knots
         if not self.endK and not (self.edgeKL or self.edgeKR):
-            self.line_out_right = self.draw_line(self.gco, self.kp.RgtThrTopPt, self.kp.RgtThrBotPt, pen2,
-                                                 Const.RightOut, scene)
-            self.line_out_left = self.draw_line(self.gco, self.kp.LftThrTopPt, self.kp.LftThrBotPt, pen2, Const.LeftOut,
-                                                scene)
+            self.draw_line(right, pen2, Const.RightOut, scene)
+            self.draw_line(left, pen2, Const.LeftOut, scene)
 
         # edge knots, arcs and lines for left edge
         if not self.endK and self.edgeKL:
-            self.line_out_right = self.draw_line(self.gco, self.kp.RgtThrTopPt, self.kp.RgtThrBotPt, pen2,
-                                                 Const.RightOut, scene)
-            self.draw_arc(self.gco, self.kp.LftThrTopPt, self.kp.RefPtArcLft, self.kp.ArcQuadSide, self.kp.StartAngLft,
+            self.draw_line(right, pen2, Const.RightOut, scene)
+            self.draw_arc(left, layout.arc_left[2 * k:2 * k + 2], layout.arc_side, self.kp.StartAngLft,
                           self.kp.SpanAng, pen2, Const.LeftOut, scene)
 
         # edge knots, arcs and lines for right edge
         if not self.endK and self.edgeKR:
-            self.line_out_right = self.draw_line(self.gco, self.kp.LftThrTopPt, self.kp.LftThrBotPt, pen2,
-                                                 Const.LeftOut, scene)
-            self.draw_arc(self.gco, self.kp.RgtThrTopPt, self.kp.RefPtArcRgt, self.kp.ArcQuadSide, self.kp.StartAngRgt,
+            self.draw_line(left, pen2, Const.LeftOut, scene)
+            self.draw_arc(right, layout.arc_right[2 * k:2 * k + 2], layout.arc_side, self.kp.StartAngRgt,
                           -self.kp.SpanAng, pen2, Const.RightOut, scene)
 
         # end knots
         if self.endK:
             if self.endKtype == Const.EndKnLikeTypeL:  # End knot with right exit thread
-                self.line_out_right = self.draw_line(self.gco, self.kp.RgtThrTopPt, self.kp.RgtThrBotPt, pen2,
-                                                     Const.RightOut, scene)
+                self.draw_line(right, pen2, Const.RightOut, scene)
             if self.endKtype == Const.EndKnLikeTypeR:  # End knot with left exit thread
-                self.line_out_left = self.draw_line(self.gco, self.kp.LftThrTopPt, self.kp.LftThrBotPt, pen2,
-                                                    Const.LeftOut, scene)
+                self.draw_line(left, pen2, Const.LeftOut, scene)
             if self.endKtype == Const.EndKnBoth:  # End knot with both exit threads
-                self.line_out_right = self.draw_line(self.gco, self.kp.RgtThrTopPt, self.kp.RgtThrBotPt, pen2,
-                                                     Const.RightOut, scene)
-                self.line_out_left = self.draw_line(self.gco, self.kp.LftThrTopPt, self.kp.LftThrBotPt, pen2,
-                                                    Const.LeftOut, scene)
-
-    def draw_line(self, gco, p1, p2, pen, direction, scene):
-        vStart = gco + p1  # calculate location vector of start point
-        vEnd = gco + p2  # calculate location vector of end point
-        line = QGraphicsLineItem(vStart.x, vStart.y, vEnd.x, vEnd.y)
+                self.draw_line(right, pen2, Const.RightOut, scene)
+                self.draw_line(left, pen2, Const.LeftOut, scene)
+
+        # take over the colors already propagated in the model
+        self.update_graphic_items(thW)
+
+    def draw_line(self, points, pen, direction, scene):
+        # points: x, y of start and end point
+        line = QGraphicsLineItem(*points)
         line.setPen(pen)
         if direction == Const.LeftOut:
             self.line_out_left = line
@@ -1284,12 +912,11 @@ class Knot():
         scene.addItem(line)
         return (line)
 
-    def draw_arc(self, gco, startPt, refPtArc, dia, strAng, spanAng, pen, direction, scene):
-        vRef = gco + refPtArc  # calculate location vector of arc reference point
-        vStart = gco + startPt  # calculate location vector of arc start point
+    def draw_arc(self, points, ref, dia, strAng, spanAng, pen, direction, scene):
+        # points: start point of the arc first, ref: reference point of the arc rectangle
         QPpath = QPainterPath()
-        QPpath.moveTo(vStart.x, vStart.y)  # set start point of arc
-        rect = QRectF(vRef.x, vRef.y, dia, dia)  # reference rectangele for arc circle
+        QPpath.moveTo(points[0], points[1])  # set start point of arc
+        rect = QRectF(ref[0], ref[1], dia, dia)  # reference rectangele for arc circle
         QPpath.arcTo(rect, strAng, spanAng)
         path = QGraphicsPathItem()
         path.setPath(QPpath)
@@ -1300,229 +927,60 @@ class Knot():
             self.arc_out_right = path
         scene.addItem(path)
 
+    def out_item(self, outDir, segment):
+        # graphic item of the exit line or arc in direction outDir
+        if segment == Const.arc:
+            return self.arc_out_left if outDir == Const.LeftOut else self.arc_out_right
+        return self.line_out_left if outDir == Const.LeftOut else self.line_out_right
+
+    def update_graphic_items(self, thW):
+        # set circle fill and exit thread colors from the color indices of the model
+        model = self.model
+        k = self.index
+        if model.knot_color[k] != NONE:
+            self.circle.setBrush(self.ribbon.brush(model.knot_color[k]))
+            self.circle.setZValue(0.3)
+        for outDir, c in ((Const.LeftOut, model.color_out_left[k]), (Const.RightOut, model.color_out_right[k])):
+            if c == NONE:
+                continue
+            for item in (self.out_item(outDir, Const.line), self.out_item(outDir, Const.arc)):
+                if item is not None:
+                    item.setPen(self.ribbon.pen(c))
+                    item.setZValue(0.4)
+
     def set_thread(self, color, direction, thW):
-        inDir = direction
-        color_name = self.colors.print_color_key(color)
-        h = self.next_direction(inDir, color, thW)
-        if h["Stop"]:
-            return ()
-        nxtKnot = h["nxtKnot"]
-        nxtDir = h["nxtDir"]
-        # print(f"set_thread, Knt co:{self.co}, Knt type:{self.type}, nxtKnt co:{nxtKnot.co}, direction:{nxtDir}, color:{color_name}")
-        nxtKnot.set_thread(color, nxtDir, thW)
+        c = self.model.color_index(color)
+        self.ribbon.paint_path(self.model.set_thread(self.index, c, direction), c)
 
     def set_knot_color(self):
-        if self.left_thread_vis:
-            color = self.color_in_left
-        else:  # right_thread_visible
-            color = self.color_in_right
-        self.knot_color = color
-        color_in_left_name = self.colors.print_color_key(self.color_in_left)
-        color_in_right_name = self.colors.print_color_key(self.color_in_right)
-        color_name = self.colors.print_color_key(color)
-        # print(f"set_knot_color, co: {self.co}, left_thread_vis: {self.left_thread_vis}, "
-        #       f"color_in_left {color_in_left_name} color_in_right {color_in_right_name} "
-        #       f"new_knot_color: {color_name}")
-        self.circle.setBrush(color)
+        c = self.model.set_knot_color(self.index)
+        if self.circle is None:  # batched mode
+            self.ribbon.update_rows((self.index,))
+            return
+        self.ribbon.update_overview((self.index,))
+        self.circle.setBrush(self.ribbon.brush(c))
         self.circle.setZValue(0.3)
 
-    def next_direction(self, direction, color, thW):
-        p_color = self.colors.print_color_key(color)
-        # print(f"next_direction_in, co {self.co} type {self.type} , "
-        #       f"color {p_color}, direction {direction}")
-        inDir_actualKnot = direction
-        inDir_nKnot = direction
-        # nKnot = Knot(self.scene, self.kp)
-        pen = QPen(color)
-        pen.setWidth(thW)
-        rDat = {"Stop": False}
-
-        # set input color in Knot
-        if inDir_actualKnot == Const.LeftIn:
-            self.color_in_left = color
-        else:
-            self.color_in_right = color
-
-        self.set_knot_color()
-
-        if not self.endK:  # inner knot
-            h = self.next_no_end_knot(inDir_actualKnot, pen)
-        elif self.endK:  # end knot
-            h = self.next_end_knot(inDir_actualKnot, pen)
-
-        # print(f"next_direction_out, co {nKnot.co} type {nKnot.type} , "
-        #               f"color {p_color}, direction {inDir_nKnot}")
-        #         rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-        #         return (rDat)
-        return (h)
-
-    def change_knot_type(self, direction):
-        nKnot = Knot(self.scene, self.kp)
-        if self.type == Const.Nk:
-            if direction == Const.LeftIn:
-                outDir_actualKnot = Const.RightOut
-                inDir_nKnot = Const.LeftIn
-                nKnot = self.nKtoR
-            elif direction == Const.RightIn:
-                outDir_actualKnot = Const.LeftOut
-                inDir_nKnot = Const.RightIn
-                nKnot = self.nKtoL
-        elif self.type == Const.Rk:
-            if direction == Const.LeftIn:
-                outDir_actualKnot = Const.LeftOut
-                inDir_nKnot = Const.RightIn
-                nKnot = self.nKtoL
-            elif direction == Const.RightIn:
-                outDir_actualKnot = Const.RightOut
-                inDir_nKnot = Const.LeftIn
-                nKnot = self.nKtoR
-        rDat = {"nKnot": nKnot, "inDir_nKnot": inDir_nKnot, "outDir_actualKnot": outDir_actualKnot}
-        return (rDat)
-
-    def next_end_knot(self, inDir, pen):
-        h = self.change_knot_type(inDir)
-        inDir_nKnot = h["inDir_nKnot"]
-        outDir_actualKnot = h["outDir_actualKnot"]
-        nKnot = h["nKnot"]
-        color = pen.color()
-        p_color = self.colors.print_color_key(color)
-        # print(f"next_end_knot, co {self.co} type {self.type} , "
-        #       f"color {p_color}, direction {inDir}")
-        # return next endK and input direction to next endK
-        nKnot = Knot(self.scene, self.kp)
-        if self.edgeKR:
-            if outDir_actualKnot == Const.LeftOut:
-                if self.nKtoL is None:
-                    rDat = {"Stop": True}
-                    return (rDat)
-                else:
-                    nKnot = self.nKtoL
-                    self.line_out_left.setPen(pen)
-                    self.line_out_left.setZValue(0.4)
-                    rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-                    return (rDat)
-            elif outDir_actualKnot == Const.RightOut:
-                if self.nKtoR is None:
-                    rDat = {"Stop": True}
-                    return (rDat)
-                else:
-                    nKnot = self.nKtoR
-                    self.line_out_right.setPen(pen)
-                    self.right.setZValue(0.4)
-                    rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-                    return (rDat)
-        elif self.edgeKL:
-            if outDir_actualKnot == Const.RightOut:
-                if self.nKtoR is None:
-                    rDat = {"Stop": True}
-                    return (rDat)
-                else:
-                    nKnot = self.nKtoR
-                    self.line_out_right.setPen(pen)
-                    self.line_out_right.setZValue(0.4)
-                    rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-                    return (rDat)
-            elif outDir_actualKnot == Const.LeftOut:
-                if self.nKtoL is None:
-                    rDat = {"Stop": True}
-                    return (rDat)
-                elif self.nKtoR is None:
-                    rDat = {"Stop": True}
-                    return (rDat)
-                else:
-                    nKnot = self.nKtoR
-                    self.line_out_left.setPen(pen)
-                    self.left.setZValue(0.4)
-                    rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-                    return (rDat)
-        else:
-            if self.endKtype == Const.EndKnLikeTypeR:
-                if outDir_actualKnot == Const.LeftOut:
-                    nKnot = self.nKtoL
-                    self.line_out_left.setPen(pen)
-                    self.line_out_left.setZValue(0.4)
-                    rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-                    return (rDat)
-                elif outDir_actualKnot == Const.RightOut:
-                    rDat = {"Stop": True}
-            elif self.endKtype == Const.EndKnLikeTypeL:
-                if outDir_actualKnot == Const.RightOut:
-                    nKnot = self.nKtoR
-                    self.line_out_right.setPen(pen)
-                    self.line_out_right.setZValue(0.4)
-                    rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-                    return (rDat)
-                elif outDir_actualKnot == Const.LeftOut:
-                    rDat = {"Stop": True}
-            elif self.endKtype == Const.EndKnBoth:
-                if outDir_actualKnot == Const.RightOut:
-                    nKnot = self.nKtoR
-                    self.line_out_right.setPen(pen)
-                    self.line_out_right.setZValue(0.4)
-                    rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-                elif outDir_actualKnot == Const.LeftOut:
-                    nKnot = self.nKtoL
-                    self.line_out_left.setPen(pen)
-                    self.line_out_left.setZValue(0.4)
-                    rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-                else:
-                    rDat = {"Stop": True}
-            else:
-                rDat = {"Stop": True}
-
-        return (rDat)
-
-    def next_no_end_knot(self, direction, pen):
-        h = self.change_knot_type(direction)
-        inDir_nKnot = h["inDir_nKnot"]
-        outDir_actualKnot = h["outDir_actualKnot"]
-        nKnot = h["nKnot"]
-        color = pen.color()
-        p_color = self.colors.print_color_key(color)
-        # print(f"next_not_end_knot, co {self.co} type {self.type} , "
-        #       f"color {p_color}, direction {direction}")
-        # set color to next knot and set next input direction
-        # check for arcs
-        if self.edgeKR and (nKnot == self.nKtoR) and (outDir_actualKnot == Const.RightOut):
-            self.arc_out_right.setPen(pen)
-            self.arc_out_right.setZValue(0.4)
-            inDir_nKnot = Const.RightIn
-        elif self.edgeKL and (nKnot == self.nKtoL) and (outDir_actualKnot == Const.LeftOut):
-            self.arc_out_left.setPen(pen)
-            self.arc_out_left.setZValue(0.4)
-            inDir_nKnot = Const.LeftIn
-        else:  # no arcs, only lines
-            if outDir_actualKnot == Const.RightOut:
-                self.line_out_right.setPen(pen)
-                self.line_out_right.setZValue(0.4)
-            elif outDir_actualKnot == Const.LeftOut:
-                self.line_out_left.setPen(pen)
-                self.line_out_left.setZValue(0.4)
-
-        if inDir_nKnot == Const.LeftIn:
-            nKnot.color_in_left = color
-        elif inDir_nKnot == Const.RightIn:
-            nKnot.color_in_right = color
-        # print(f"next_direction_out, co {nKnot.co} type {nKnot.type} , "
-        #       f"color {p_color}, direction {inDir_nKnot}")
-        rDat = {"Stop": False, "nxtKnot": nKnot, "nxtDir": inDir_nKnot}
-        return (rDat)
-
 
 class my_Colors():
+    # preset available start colors, use the shared instance shared_colors and do not modify it
+    __slots__ = ("black", "red", "green", "blue", "grey", "darkgrey", "cyan", "magenta", "yellow", "f", "f_d")
+
     def __init__(self):
         # preset available start colors
-        self.black = QColor("black")
-        self.red = QColor.fromRgb(255, 99, 71)
-        self.green = QColor.fromRgb(0, 255, 0)
-        self.blue = QColor.fromRgb(0, 191, 255)
-        self.grey = QColor("lightgrey")
-        self.darkgrey = QColor("darkgrey")
-        self.cyan = QColor("cyan")
-        self.magenta = QColor.fromRgb(238, 130, 238)
-        self.yellow = QColor("yellow")
-        self.f = [self.red, self.green, self.blue, self.black, self.cyan, self.magenta, self.yellow, self.darkgrey]
-        self.f_d = {
+        init = object.__setattr__
+        init(self, "black", QColor("black"))
+        init(self, "red", QColor.fromRgb(255, 99, 71))
+        init(self, "green", QColor.fromRgb(0, 255, 0))
+        init(self, "blue", QColor.fromRgb(0, 191, 255))
+        init(self, "grey", QColor("lightgrey"))
+        init(self, "darkgrey", QColor("darkgrey"))
+        init(self, "cyan", QColor("cyan"))
+        init(self, "magenta", QColor.fromRgb(238, 130, 238))
+        init(self, "yellow", QColor("yellow"))
+        init(self, "f", (self.red, self.green, self.blue, self.black, self.cyan, self.magenta, self.yellow,
+                         self.darkgrey))
+        init(self, "f_d", MappingProxyType({
             "red": self.red,
             "green": self.green,
             "blue": self.blue,
@@ -1531,142 +989,636 @@ class my_Colors():
             "magenta": self.magenta,
             "yellow": self.yellow,
             "darkgrey": self.darkgrey
-        }
+        }))
 
-    def print_color_key(self, color: QColor):
-        color_name = [k for k, v in self.f_d.items() if v == color]
-        # print(f"print_color_name, {color_name}")
-        return (color_name)
+    def __setattr__(self, name, value):
+        raise AttributeError("my_Colors is immutable")
 
 
-class my_text(QGraphicsSimpleTextItem):
-    def __init__(self, text, pos, size=18, color=QColor("black")):
-        super().__init__(text)
-        font = self.font()
-        font.setPointSize(size)
-        self.setFont(font)
-        self.setBrush(color)
-        self.setX(pos.x)
-        self.setY(pos.y)
+shared_colors = my_Colors()  # one palette for all ribbons and knots
 
 
-class SceneObjectBase:
-    """Base class for all custom scene items."""
+class StyleCache():
+    """
+    One QPen per (color, width, style) and one QBrush per color for all items of the scene.
 
-    def get_ribbon(self):
-        scene = self.scene()
-        return getattr(scene, "ribbon", None) if scene else None
+    The pens and brushes are shared, never modify one that was returned. hits and misses
+    count the lookups, a miss creates the pen or brush.
+    """
+    __slots__ = ("pens", "brushes", "hits", "misses")
 
+    def __init__(self):
+        self.pens = {}
+        self.brushes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def pen(self, color, width=1, style=Qt.PenStyle.SolidLine):
+        key = (color.rgba(), width, style)
+        pen = self.pens.get(key)
+        if pen is None:
+            self.misses += 1
+            pen = self.pens[key] = QPen(color)
+            pen.setWidthF(width)
+            pen.setStyle(style)
+        else:
+            self.hits += 1
+        return pen
+
+    def brush(self, color):
+        key = color.rgba()
+        brush = self.brushes.get(key)
+        if brush is None:
+            self.misses += 1
+            brush = self.brushes[key] = QBrush(color)
+        else:
+            self.hits += 1
+        return brush
 
-class KnotCircle(QGraphicsEllipseItem, SceneObjectBase):
-    def __init__(self, x, y, w, h, knot, parent=None):
-        super().__init__(x, y, w, h, parent)
-        self.knot = knot
-        self.setFlag(QGraphicsEllipseItem.GraphicsItemFlag.ItemIsSelectable, True)
+    def clear(self):
+        self.pens.clear()
+        self.brushes.clear()
+        self.hits = 0
+        self.misses = 0
 
-        self.click_timer = QTimer()
-        self.click_timer.setSingleShot(True)
-        self.click_timer.timeout.connect(self._on_single_click_timeout)  # connect ONCE
 
-        self._last_button = None  # store which mouse button was pressed
+shared_styles = StyleCache()  # pens and brushes of all ribbons
 
-        # Cross-version constants (PyQt5 vs PyQt6)
-        self._Left = getattr(Qt, "LeftButton", getattr(Qt.MouseButton, "LeftButton", 1))
-        self._Right = getattr(Qt, "RightButton", getattr(Qt.MouseButton, "RightButton", 2))
 
-    def mousePressEvent(self, event):
-        # remember which button was clicked and start the single-click timer
-        self._last_button = event.button()
-        # print("Mouse pressed")
-        self.click_timer.start(300)  # wait to see if a double-click happens
-        event.accept()
+class SceneObjectBase:
+    """Base class for all custom scene items."""
 
-    def mouseDoubleClickEvent(self, event):
-        # cancel the pending single-click
-        if self.click_timer.isActive():
-            self.click_timer.stop()
+    def get_ribbon(self):
+        scene = self.scene()
+        return getattr(scene, "ribbon", None) if scene else None
 
-        # print(f"Knot Double-clicked on {self.knot.co}")
+    def get_clicks(self):
+        return self.scene().clicks
 
-        event.accept()
 
-        self.change_thread_direction()
+class ClickDispatcher():
+    """
+    Tells single from double clicks on a scene with one timer.
 
-        # reset the stored button after handling
-        self._last_button = None
+    Presses and double clicks are passed with a handler and a target: the view passes the
+    Ribbon and the clicked knot, a ColorRect itself and None. When no double click follows
+    within INTERVAL ms, handler.single_click(target, button) is called, otherwise
+    handler.double_click(target, fold). Ribbon puts one dispatcher on its scene.
 
-    def _on_single_click_timeout(self):
-        """Called by QTimer.timeout with no args."""
-        btn = self._last_button
-        self._last_button = None  # reset
+    With instant set, single_click is called on the press already. A double click after an
+    instant left click is passed with fold True, the handler folds its action into the one
+    of the single click. After an instant right click the double click is ignored, its
+    action was done on the press.
+    """
+    INTERVAL = 300  # ms
 
-        # If something weird happened (e.g., double-click already consumed it), bail
-        if btn is None:
+    def __init__(self):
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+        self.pending = None  # (handler, target, button) of the last press
+        self.instant = False
+        self.done = False  # single_click of the pending press was called on the press
+
+    def press(self, handler, target, button):
+        # a press on another target first completes the single click waiting for the timer
+        if self.pending is not None and self.pending[:2] != (handler, target):
+            self.flush()
+        self.pending = (handler, target, button)
+        self.done = self.instant
+        if self.instant:
+            handler.single_click(target, button)
+        self.timer.start(self.INTERVAL)  # wait to see if a double-click happens
+
+    def double(self, handler, target):
+        # cancel the pending single click
+        pending = self.pending
+        done = self.done and pending is not None and pending[:2] == (handler, target)
+        self.cancel()
+        if not done:
+            handler.double_click(target, False)
+        elif pending[2] == Qt.MouseButton.LeftButton:
+            handler.double_click(target, True)
+
+    def flush(self):
+        pending = self.pending
+        done = self.done
+        self.cancel()
+        if pending is not None and not done:
+            handler, target, button = pending
+            handler.single_click(target, button)
+
+    def cancel(self):
+        self.timer.stop()
+        self.pending = None
+        self.done = False
+
+
+class PaintStroke():
+    """
+    Knots painted by dragging the mouse over them with a paint tool.
+
+    tool is one of TOOLS: "Nk" and "Rk" set the knot type, "left" and "right" the visible
+    thread. The knots touched are applied with Ribbon.change_knots at most once per FRAME
+    ms, so a thread is propagated once per frame however many of its knots were painted.
+    finish() pushes the whole stroke as one PaintKnotsCommand.
+    """
+    TOOLS = ("Nk", "Rk", "left", "right")
+    FRAME = 16  # ms
+
+    def __init__(self, ribbon, tool):
+        self.ribbon = ribbon
+        self.tool = tool
+        self.touched = set()
+        self.types = {}  # new values of the stroke
+        self.visible = {}
+        self.old_types = {}
+        self.old_visible = {}
+        self.pending = ({}, {})  # types and visible not applied yet
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    def add(self, knots):
+        model = self.ribbon.model
+        for k in knots:
+            if k in self.touched:
+                continue
+            self.touched.add(k)
+            if self.tool in ("Nk", "Rk"):
+                type = Const[self.tool].value
+                if model.knot_type[k] != type:
+                    self.old_types[k] = model.knot_type[k]
+                    self.types[k] = self.pending[0][k] = type
+            else:
+                vis = self.tool == "left"
+                if bool(model.left_vis[k]) != vis:
+                    self.old_visible[k] = bool(model.left_vis[k])
+                    self.visible[k] = self.pending[1][k] = vis
+        if not self.timer.isActive() and (self.pending[0] or self.pending[1]):
+            self.timer.start(self.FRAME)
+
+    def flush(self):
+        self.timer.stop()
+        types, visible = self.pending
+        if types or visible:
+            self.pending = ({}, {})
+            self.ribbon.change_knots(types, visible)
+
+    def finish(self):
+        self.flush()
+        if not (self.types or self.visible):
             return
+        ribbon = self.ribbon
+        ribbon.changed = True
+        if ribbon.undo_stack is not None:
+            from undo_commands import PaintKnotsCommand
+            ribbon.undo_stack.push(PaintKnotsCommand(ribbon, self.types, self.visible, self.old_types,
+                                                     self.old_visible, applied=True))
 
-        # Normalize button comparisons across PyQt5/6
-        try:
-            is_left = (btn == self._Left)
-            is_right = (btn == self._Right)
-        except Exception:
-            # Some environments pass ints; fall back to int compare
-            is_left = int(btn) == int(self._Left)
-            is_right = int(btn) == int(self._Right)
-
-        if is_left:
-            self._do_single_left_click()
-        elif is_right:
-            self._do_single_right_click()
-        else:
-            print(f"Other button single-click at {self.knot.co[0]}, {self.knot.co[1]}")
-
-    def _do_single_left_click(self):
-        # print(f"Left single-click on {self.knot.co}")
-        self.toggle_knot_color()
-
-    def _do_single_right_click(self):
-        # print(f"Right single-click on, co {self.knot.co}")
-        self.change_thread_direction()
 
-    # def handle_right_click(self):
-    #     # Placeholder for your context menu or other right-click behavior
-    #     print("Right-click: open context menu / do something else.")
-
-    def toggle_knot_color(self):
-        R = self.get_ribbon()
-
-        # Use undo command if undo system is initialized
-        if hasattr(R, 'undo_stack') and R.undo_stack is not None:
-            from undo_commands import ToggleKnotColorCommand
-            cmd = ToggleKnotColorCommand(R, self.knot.co, self.knot.left_thread_vis)
-            R.undo_stack.push(cmd)
-            R.changed = True
-        else:
-            # Fallback if undo system not initialized
-            R.changed = True
-            self.knot.left_thread_vis = not self.knot.left_thread_vis
-            self.knot.set_knot_color()
+class KnotCircle(QGraphicsEllipseItem):
+    # clicks on the circle are resolved by the view with Ribbon.knot_at
+    def __init__(self, x, y, w, h, knot, parent=None):
+        super().__init__(x, y, w, h, parent)
+        self.knot = knot
+        self.setFlag(QGraphicsEllipseItem.GraphicsItemFlag.ItemIsSelectable, True)
 
-    def change_thread_direction(self):
-        R = self.get_ribbon()
 
-        # Use undo command if undo system is initialized
-        if hasattr(R, 'undo_stack') and R.undo_stack is not None:
-            from undo_commands import ChangeKnotTypeCommand
-            cmd = ChangeKnotTypeCommand(R, self.knot.co)
-            R.undo_stack.push(cmd)
-            R.changed = True
-        else:
-            # Fallback if undo system not initialized
-            R.changed = True
-            # toggle knot type
-            if self.knot.type == Const.Nk:
-                self.knot.type = Const.Rk
+class RowBlock(QGraphicsItem):
+    """
+    Paints the circles of the knots in rows first .. last - 1 in one call.
+
+    Used by the batched mode of Ribbon instead of a KnotCircle, lines and arcs per knot.
+    A block also paints the exit segments of the row above it and of its rows but the
+    last, so the threads are always drawn above the circles they end in. The colors are
+    read from the arrays of the model at paint time, so a change only needs an update() of
+    the block.
+    """
+    BLOCK_ROWS = 16
+    TILE = 256  # pixels, side of the tiles in a TileCache
+
+    def __init__(self, ribbon, first, last, parent=None):
+        super().__init__(parent)
+        self.ribbon = ribbon
+        self.first = first
+        self.last = last
+        self.version = 0  # counts the changes, tiles of older versions are painted again
+        self.rect = QRectF(*ribbon.layout.rows_rect(max(first - 1, 0), last, ribbon.Kd, ribbon.thW))
+        self.outline = shared_styles.pen(QColor("black"))
+        self.make_segments()
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)  # exposedRect for tiles
+        self.setZValue(0.3)  # above the color bar lines like the knot circles
+
+    def make_segments(self):
+        # exit lines and arcs of the knots like in Knot.draw_graphic_items, in painting order
+        R = self.ribbon
+        layout = R.layout
+        kp = R.KnPnts
+        l = R.l
+        self.knots = list(layout.knots(self.first, self.last))
+        # rows of the segments, the last block draws the segments of the last row too
+        first = max(self.first - 1, 0)
+        last = self.last if self.last == l else self.last - 1
+        self.segments = []  # (knot index, left exit, QLineF or QPainterPath)
+        # the flags and end types are read from the model, no Knot is created for the block
+        flags = R.model.flags
+        end_type = R.model.end_type
+        for k in layout.knots(first, last):
+            f = flags[k]
+            left = QLineF(*layout.line_left[4 * k:4 * k + 4])
+            right = QLineF(*layout.line_right[4 * k:4 * k + 4])
+            if not f & END and not f & (EDGE_L | EDGE_R):
+                self.segments += [(k, False, right), (k, True, left)]
+            if not f & END and f & EDGE_L:
+                self.segments += [(k, False, right),
+                                  (k, True, self.arc(left, layout.arc_left[2 * k:2 * k + 2], kp.StartAngLft,
+                                                     kp.SpanAng))]
+            if not f & END and f & EDGE_R:
+                self.segments += [(k, True, left),
+                                  (k, False, self.arc(right, layout.arc_right[2 * k:2 * k + 2], kp.StartAngRgt,
+                                                      -kp.SpanAng))]
+            if f & END:
+                if end_type[k] == END_LIKE_L:
+                    self.segments.append((k, False, right))
+                if end_type[k] == END_LIKE_R:
+                    self.segments.append((k, True, left))
+                if end_type[k] == END_BOTH:
+                    self.segments += [(k, False, right), (k, True, left)]
+
+    def arc(self, line, ref, strAng, spanAng):
+        path = QPainterPath()
+        path.moveTo(line.p1())
+        path.arcTo(QRectF(ref[0], ref[1], self.ribbon.layout.arc_side, self.ribbon.layout.arc_side),
+                   strAng, spanAng)
+        return path
+
+    def boundingRect(self):
+        return self.rect
+
+    def changed(self):
+        self.version += 1
+        self.update()
+
+    def paint(self, painter, option, widget=None):
+        # a view with a TileCache blits the block from square pixmaps of TILE pixels for its zoom
+        tiles = getattr(widget.parent(), "tiles", None) if widget is not None else None
+        if tiles is None:
+            self.paint_knots(painter)
+            return
+        # the tiles are blitted at whole pixels, they keep the fraction of the block position
+        transform = painter.worldTransform()
+        device = transform.mapRect(self.rect)
+        exposed = transform.mapRect(option.exposedRect) & device
+        x = math.floor(device.x())
+        y = math.floor(device.y())
+        zoom = (round(transform.m11(), 4), round(device.x() - x, 2), round(device.y() - y, 2))
+        T = self.TILE
+        painter.save()
+        painter.resetTransform()
+        for j in range(int((exposed.top() - y) // T), int((exposed.bottom() - y) // T) + 1):
+            for i in range(int((exposed.left() - x) // T), int((exposed.right() - x) // T) + 1):
+                pixmap = tiles.get(self, zoom + (i, j))
+                if pixmap is None:
+                    pixmap = self.render_tile(painter, transform.m11(), device.x() - x - i * T,
+                                              device.y() - y - j * T)
+                    tiles.put(self, zoom + (i, j), pixmap)
+                painter.drawPixmap(x + i * T, y + j * T, pixmap)
+        painter.restore()
+
+    def render_tile(self, painter, scale, dx, dy):
+        # tile with the top left corner of the block at dx, dy
+        ratio = painter.device().devicePixelRatioF()
+        pixmap = QPixmap(math.ceil(self.TILE * ratio), math.ceil(self.TILE * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        tile = QPainter(pixmap)
+        tile.setRenderHints(painter.renderHints())
+        tile.translate(dx, dy)
+        tile.scale(scale, scale)
+        tile.translate(-self.rect.topLeft())
+        self.paint_knots(tile, tile.worldTransform().inverted()[0].mapRect(QRectF(0, 0, self.TILE, self.TILE)))
+        tile.end()
+        return pixmap
+
+    def paint_knots(self, painter, rect=None):
+        # rect: only the knots whose items can reach into it are painted
+        R = self.ribbon
+        model = R.model
+        layout = R.layout
+        Kd = R.Kd
+        knots = self.knots
+        segments = self.segments
+        if rect is not None:
+            # an exit segment reaches at most 2 Vd from the corner of its knot circle
+            x0 = rect.left() - Kd - 2 * R.Vd
+            x1 = rect.right() + 2 * R.Vd
+            y0 = rect.top() - Kd - 2 * R.Vd
+            y1 = rect.bottom() + 2 * R.Vd
+            knot_x = layout.knot_x
+            knot_y = layout.knot_y
+            knots = [k for k in knots if x0 <= knot_x[k] <= x1 and y0 <= knot_y[k] <= y1]
+            segments = [s for s in segments if x0 <= knot_x[s[0]] <= x1 and y0 <= knot_y[s[0]] <= y1]
+        # circles first, the colored threads are drawn above all circles like in item mode
+        painter.setPen(self.outline)
+        for k in knots:
+            c = model.knot_color[k]
+            painter.setBrush(R.brush(0 if c == NONE else c))
+            painter.drawEllipse(QRectF(layout.knot_x[k], layout.knot_y[k], Kd, Kd))
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        for k, left, segment in segments:
+            c = model.color_out_left[k] if left else model.color_out_right[k]
+            painter.setPen(R.pen(0 if c == NONE else c))
+            if isinstance(segment, QLineF):
+                painter.drawLine(segment)
             else:
-                self.knot.type = Const.Nk
-
-            self.knot.set_thread(self.knot.color_in_right, Const.RightIn, R.thW)
-            self.knot.set_thread(self.knot.color_in_left, Const.LeftIn, R.thW)
+                painter.drawPath(segment)
+
+
+class ThreadHighlight(QGraphicsItem):
+    """
+    Overlay that dims the ribbon and paints one thread above it.
+
+    The path comes from the path index of the model, so showing a thread costs a walk
+    along its ports and no tracing. The exits and the circles of the knots it passes are
+    drawn in the thread color, only those in the exposed rect are painted.
+    """
+    DIM = QColor(255, 255, 255, 190)
+
+    def __init__(self, ribbon, parent=None):
+        super().__init__(parent)
+        self.ribbon = ribbon
+        self.thread = None  # index of the highlighted thread
+        self.knots = []
+        self.segments = []  # (knot index, QLineF or QPainterPath)
+        self.pen = None  # shared pens in the thread color
+        self.outline = None
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)
+        self.setZValue(0.9)  # above the knots, below the selection
+        self.setVisible(False)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.ribbon.cplW, self.ribbon.cplL)
+
+    def set_thread(self, index):
+        self.thread = index
+        self.setVisible(index is not None)
+        self.update()
+        if index is None:
+            return
+        R = self.ribbon
+        path = R.model.thread_path(index)
+        self.knots = [k for k, outDir, segment in path]
+        self.segments = [(k, R.segment_shape(k, outDir, segment)) for k, outDir, segment in path[:-1]]
+        color = R.model.colors[R.model.threads[index].c]
+        self.pen = shared_styles.pen(color, R.thW * 1.5)
+        self.outline = shared_styles.pen(color, R.thW / 2)
+
+    def paint(self, painter, option, widget=None):
+        R = self.ribbon
+        layout = R.layout
+        model = R.model
+        Kd = R.Kd
+        rect = option.exposedRect
+        painter.fillRect(rect, self.DIM)
+        # an exit segment reaches at most 2 Vd from the corner of its knot circle
+        x0 = rect.left() - Kd - 2 * R.Vd
+        x1 = rect.right() + 2 * R.Vd
+        y0 = rect.top() - Kd - 2 * R.Vd
+        y1 = rect.bottom() + 2 * R.Vd
+        knot_x = layout.knot_x
+        knot_y = layout.knot_y
+        painter.setPen(self.outline)
+        for k in self.knots:
+            if x0 <= knot_x[k] <= x1 and y0 <= knot_y[k] <= y1:
+                c = model.knot_color[k]
+                painter.setBrush(R.brush(0 if c == NONE else c))
+                painter.drawEllipse(QRectF(knot_x[k], knot_y[k], Kd, Kd))
+        painter.setPen(self.pen)
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        for k, segment in self.segments:
+            if x0 <= knot_x[k] <= x1 and y0 <= knot_y[k] <= y1:
+                if isinstance(segment, QLineF):
+                    painter.drawLine(segment)
+                else:
+                    painter.drawPath(segment)
+
+
+class SelectionItem(QGraphicsItem):
+    """Outlines of the selected knots of a ribbon, only the rows in the exposed rect are painted."""
+
+    def __init__(self, ribbon, parent=None):
+        super().__init__(parent)
+        self.ribbon = ribbon
+        self.knots = set()
+        self.rect = QRectF()
+        self.outline = shared_styles.pen(QColor(0, 120, 215), ribbon.thW / 2, Qt.PenStyle.DashLine)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)
+        self.setZValue(1)
+
+    def set_knots(self, knots):
+        self.prepareGeometryChange()
+        self.knots = set(knots)
+        if not self.knots:
+            self.rect = QRectF()
+            return
+        layout = self.ribbon.layout
+        xs = [layout.knot_x[k] for k in self.knots]
+        ys = [layout.knot_y[k] for k in self.knots]
+        m = self.outline.widthF()
+        Kd = self.ribbon.Kd
+        self.rect = QRectF(min(xs) - m, min(ys) - m, max(xs) - min(xs) + Kd + 2 * m, max(ys) - min(ys) + Kd + 2 * m)
+        self.update()
+
+    def boundingRect(self):
+        return self.rect
+
+    def paint(self, painter, option, widget=None):
+        ribbon = self.ribbon
+        layout = ribbon.layout
+        Kd = ribbon.Kd
+        rect = option.exposedRect
+        rows = layout.rows_between(rect.top(), rect.bottom(), Kd)
+        painter.setPen(self.outline)
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        for k in layout.knots(rows.start, rows.stop):
+            if k in self.knots:
+                painter.drawEllipse(QRectF(layout.knot_x[k], layout.knot_y[k], Kd, Kd))
+
+
+class TileCache():
+    """
+    Square pixmaps of the row blocks for each zoom of a view, within a memory budget.
+
+    A tile of a block is rendered once per zoom and then blitted when the view is scrolled.
+    A change of the block increases its version, only the tiles of the changed blocks are
+    painted again. The least recently used tiles are dropped first.
+    """
+    __slots__ = ("budget", "tiles", "size", "hits", "misses")
+
+    def __init__(self, budget=64 * 1024 * 1024):
+        self.budget = budget  # bytes
+        self.tiles = OrderedDict()  # (block, zoom and tile): (version, pixmap)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, block, zoom):
+        key = (block, zoom)
+        entry = self.tiles.get(key)
+        if entry is None or entry[0] != block.version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.tiles.move_to_end(key)
+        return entry[1]
+
+    def put(self, block, zoom, pixmap):
+        key = (block, zoom)
+        old = self.tiles.pop(key, None)
+        if old is not None:
+            self.size -= self.bytes(old[1])
+        self.tiles[key] = (block.version, pixmap)
+        self.size += self.bytes(pixmap)
+        while self.size > self.budget and len(self.tiles) > 1:
+            version, dropped = self.tiles.popitem(last=False)[1]
+            self.size -= self.bytes(dropped)
+
+    def drop(self, block):
+        # forget the tiles of a block that is deleted
+        for key in [key for key in self.tiles if key[0] is block]:
+            self.size -= self.bytes(self.tiles.pop(key)[1])
+
+    @staticmethod
+    def bytes(pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def clear(self):
+        self.tiles.clear()
+        self.size = 0
+
+
+class KnotOverview(QGraphicsItem):
+    """
+    Images of the knot colors drawn instead of the knot items when the view is zoomed out.
+
+    The knots lie on a grid of cells with side Vd, knot (x, y) in column x and row
+    base + step * x + 2 * y like in the layout. The image of level 1 has one pixel per cell,
+    the finer levels are scaled from it and show each knot as a disc of LEVELS pixels, the
+    level is chosen by the zoom of the painter. An image is made on its first use, after
+    that only the knots passed to update_knots are repainted.
+    """
+    LEVELS = (1, 2, 4, 8)  # pixels per cell
+
+    def __init__(self, ribbon, parent=None):
+        super().__init__(parent)
+        self.ribbon = ribbon
+        layout = ribbon.layout
+        Vd = layout.Vd
+        self.x0 = min(layout.knot_x)
+        self.y0 = min(layout.knot_y)
+        self.columns = round((max(layout.knot_x) - self.x0) / Vd) + 1
+        self.rows = round((max(layout.knot_y) - self.y0) / Vd) + 1
+        # cell of knot (x, y) is column_cell[x], row_cell[x] + 2 * y
+        l = ribbon.l
+        self.column_cell = [round((layout.knot_x[x * l] - self.x0) / Vd) for x in range(ribbon.w)]
+        self.row_cell = [round((layout.knot_y[x * l] - self.y0) / Vd) for x in range(ribbon.w)]
+        # the cells are centered on the knot circles
+        offset = (ribbon.Kd - Vd) / 2
+        self.rect = QRectF(self.x0 + offset, self.y0 + offset, self.columns * Vd, self.rows * Vd)
+        self.images = {}  # pixels per cell: QImage
+        self.dirty = set()  # knots changed since the images were painted
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)
+        self.setZValue(0.3)
+        self.setVisible(False)
+
+    def boundingRect(self):
+        return self.rect
+
+    def update_knots(self, knots):
+        self.dirty.update(knots)
+        if self.isVisible():
+            self.update()
+
+    def clear(self):
+        # all knots changed, the images are rendered again when needed
+        self.images.clear()
+        self.dirty.clear()
+        self.update()
+
+    def image(self, size):
+        image = self.images.get(size)
+        if image is None:
+            if size == 1:
+                image = QImage(self.columns, self.rows, QImage.Format.Format_ARGB32_Premultiplied)
+                image.fill(Qt.GlobalColor.transparent)
+                model = self.ribbon.model
+                l = self.ribbon.l
+                # NONE is -1 and gets the undefined color of the last entry
+                rgba = [color.rgba() for color in model.colors] + [model.colors[0].rgba()]
+                for x in range(self.ribbon.w):
+                    column = self.column_cell[x]
+                    row = self.row_cell[x]
+                    for y, c in enumerate(model.knot_color[x * l:(x + 1) * l]):
+                        image.setPixel(column, row + 2 * y, rgba[c])
+            else:
+                # the cells of level 1 scaled up and cut to discs
+                image = self.image(1).scaled(self.columns * size, self.rows * size)
+                painter = QPainter(image)
+                painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_DestinationIn)
+                painter.fillRect(image.rect(), self.disc(size))
+                painter.end()
+            self.images[size] = image
+        return image
+
+    def disc(self, size):
+        # brush with one opaque disc per cell of size pixels
+        tile = QImage(size, size, QImage.Format.Format_ARGB32_Premultiplied)
+        tile.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(tile)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QColor("black"))
+        painter.drawEllipse(QRectF(0, 0, size, size))
+        painter.end()
+        return QBrush(tile)
+
+    def paint_knots(self, image, size, knots):
+        model = self.ribbon.model
+        l = self.ribbon.l
+        colors = model.colors
+        knot_color = model.knot_color
+        cells = [(self.column_cell[k // l], self.row_cell[k // l] + 2 * (k % l),
+                  colors[0 if knot_color[k] == NONE else knot_color[k]]) for k in knots]
+        if size == 1:
+            for x, y, color in cells:
+                image.setPixel(x, y, color.rgba())
+            return
+        painter = QPainter(image)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        for x, y, color in cells:
+            painter.fillRect(x * size, y * size, size, size, color)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_DestinationIn)
+        disc = self.disc(size)
+        for x, y, color in cells:
+            painter.fillRect(x * size, y * size, size, size, disc)
+        painter.end()
+
+    def paint(self, painter, option, widget=None):
+        if self.dirty:
+            for size, image in self.images.items():
+                self.paint_knots(image, size, self.dirty)
+            self.dirty.clear()
+        # the smallest level with at least as many pixels per cell as on the screen
+        Vd = self.ribbon.Vd
+        scale = Vd * painter.worldTransform().m11()
+        size = next((size for size in self.LEVELS if size >= scale), self.LEVELS[-1])
+        exposed = option.exposedRect & self.rect
+        f = size / Vd
+        source = QRectF((exposed.x() - self.rect.x()) * f, (exposed.y() - self.rect.y()) * f,
+                        exposed.width() * f, exposed.height() * f)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.drawImage(exposed, self.image(size), source)
 
 
 class ColorRect(QGraphicsRectItem, SceneObjectBase):
@@ -1674,9 +1626,6 @@ class ColorRect(QGraphicsRectItem, SceneObjectBase):
         super().__init__(x, y, w, h, parent)
         self.index = index
         self.setFlag(QGraphicsRectItem.GraphicsItemFlag.ItemIsSelectable, True)
-        self.click_timer = QTimer()
-        self.click_timer.setSingleShot(True)
-        self.click_timer.timeout.connect(self.select_new_color)
 
     @classmethod
     def rect_45(cls, x, y, w, h, index, parent=None):
@@ -1702,18 +1651,21 @@ class ColorRect(QGraphicsRectItem, SceneObjectBase):
         return (center_x, center_y)
 
     def mousePressEvent(self, event):
-        # Start timer for single click
-        # to avoid double event for double-click
-        self.click_timer.start(300)  # ms
+        # the color dialog opens when no double click follows
+        self.get_clicks().press(self, None, event.button())
         event.accept()
 
     def mouseDoubleClickEvent(self, event):
-        # Cancel pending single-click action
-        if self.click_timer.isActive():
-            self.click_timer.stop()
         # print(f"Color Rect Double-clicked on {self.index}")
+        self.get_clicks().double(self, None)
         event.accept()
 
+    def single_click(self, target, button):
+        self.select_new_color()
+
+    def double_click(self, target, fold):
+        pass
+
     def select_new_color(self):
         brush = self.brush()
         old_color = brush.color()
@@ -1736,16 +1688,5 @@ class ColorRect(QGraphicsRectItem, SceneObjectBase):
             R.changed = True
         else:
             # Fallback if undo system not initialized
-            self.setBrush(new_color)
-            # print(f"New color selected: {new_color.name()}")
             R.changed = True
-            CS = R.StartKnot_list[self.index]
-            CS.color = new_color
-            Kh = getattr(CS, "Knot", None)
-            direction = getattr(CS, "direction", None)
-            Kh.set_thread(new_color, direction, R.thW)
-            line = getattr(CS, "line", None)
-            pen = QPen()
-            pen.setColor(new_color)
-            pen.setWidth(R.thW)
-            line.setPen(pen)
+            R.set_thread_color(self.index, new_color)
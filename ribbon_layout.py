@@ -0,0 +1,180 @@
+"""
+Layout of the graphic items of a ribbon.
+
+RibbonLayout computes the position of every knot circle, exit line and edge arc of a
+ribbon in one pass over the columns and keeps them in flat arrays indexed by the knot
+index k = x * l + y, like the arrays of the RibbonModel. It does not depend on Qt, the
+view draws its items from the arrays and exporters can read them without walking the
+scene.
+"""
+
+import math
+from array import array
+
+
+def column_groups(type, w):
+    """
+    Columns of a ribbon type in drawing order as (start, stop, base, step).
+
+    Knot (x, y) of a group lies base + step * x + 2 * y knot distances below the top.
+    """
+    match type:
+        case "L":
+            return [(0, w, 0, 1)]
+        case "R":
+            return [(0, w, w - 1, -1)]
+        case "M":
+            mid = w // 2
+            return [(0, mid + 1, 0, 1), (mid + 1, w, w - 1, -1)]
+        case "A":
+            mid = w // 2
+            return [(mid, w, 0, 1), (0, mid, w - 1, -1)]
+        case "W":
+            # w = 4 * d + 1 : 5, 9, 13, 17, 21, 25, 29, ...
+            d = int(w / 4)
+            x1 = d
+            x2 = x1 + d
+            x3 = x2 + d
+            x4 = x3 + d
+            return [(0, x1 + 1, 0, 1), (x1 + 1, x2 + 1, x2, -1),
+                    (x2 + 1, x3 + 1, -x2, 1), (x3 + 1, x4 + 1, x4, -1)]
+        case _:
+            raise ValueError(f"Unknown ribbon type {type!r}")
+
+
+class RibbonLayout():
+    """
+    Flat coordinate arrays of all knots of a ribbon.
+
+    x0, y0 is the top left corner of the circle of knot (0, 0) without column offset, Vd
+    the knot distance and kp the KnotPoints with the item points relative to a knot.
+    knot_x, knot_y hold the top left corner of each knot circle. line_left and line_right
+    hold 4 values per knot: top and bottom point of the exit line, the top point is also
+    the start of an edge arc. arc_left and arc_right hold the top left corner of the
+    reference square of the arc, its side is arc_side. geometry holds the values the
+    coordinates were computed from, see geometry_of.
+    """
+    __slots__ = ("type", "w", "l", "Vd", "groups", "geometry", "knot_x", "knot_y", "line_left", "line_right",
+                 "arc_left", "arc_right", "arc_side")
+
+    def __init__(self, type, width, length, x0, y0, Vd, kp):
+        self.type = type
+        self.w = width
+        self.l = length
+        self.Vd = Vd
+        self.groups = column_groups(type, width)
+        self.geometry = self.geometry_of(x0, y0, Vd, kp)
+        n = width * length
+        self.knot_x = array("d", [0.0]) * n
+        self.knot_y = array("d", [0.0]) * n
+        self.line_left = array("d", [0.0]) * (4 * n)
+        self.line_right = array("d", [0.0]) * (4 * n)
+        self.arc_left = array("d", [0.0]) * (2 * n)
+        self.arc_right = array("d", [0.0]) * (2 * n)
+        self.arc_side = kp.ArcQuadSide
+
+        l = length
+        rows = range(l)
+        for start, stop, base, step in self.groups:
+            for x in range(start, stop):
+                gx = x0 + Vd * x
+                ys = [y0 + Vd * (base + step * x + 2 * y) for y in rows]
+                k = x * l
+                self.knot_x[k:k + l] = array("d", [gx]) * l
+                self.knot_y[k:k + l] = array("d", ys)
+                for points, out in (((kp.LftThrTopPt, kp.LftThrBotPt), self.line_left),
+                                    ((kp.RgtThrTopPt, kp.RgtThrBotPt), self.line_right)):
+                    top, bot = points
+                    out[4 * k:4 * (k + l)] = array("d", [v for gy in ys for v in (
+                        gx + top.x, gy + top.y, gx + bot.x, gy + bot.y)])
+                for ref, out in ((kp.RefPtArcLft, self.arc_left), (kp.RefPtArcRgt, self.arc_right)):
+                    out[2 * k:2 * (k + l)] = array("d", [v for gy in ys for v in (gx + ref.x, gy + ref.y)])
+
+    @staticmethod
+    def geometry_of(x0, y0, Vd, kp):
+        # the values the coordinates depend on besides type and size, as a tuple of numbers
+        points = (kp.LftThrTopPt, kp.LftThrBotPt, kp.RgtThrTopPt, kp.RgtThrBotPt, kp.RefPtArcLft, kp.RefPtArcRgt)
+        return (x0, y0, Vd, kp.ArcQuadSide) + tuple(v for point in points for v in (point.x, point.y))
+
+    def knots(self, first=0, last=None):
+        # knot indices of rows first .. last - 1 in drawing order, row by row within each column group
+        l = self.l
+        rows = range(first, l if last is None else last)
+        for start, stop, base, step in self.groups:
+            for y in rows:
+                for x in range(start, stop):
+                    yield x * l + y
+
+    def nearest_knot(self, px, py, Kd):
+        """Index of the knot whose circle of diameter Kd has its center nearest to the point px, py"""
+        l = self.l
+        r = Kd / 2
+        column = min(max(round((px - r - self.knot_x[0]) / self.Vd), 0), self.w - 1)
+        best = None
+        best_d2 = math.inf
+        # the rows of neighbouring columns are shifted by Vd, check them too
+        for x in range(max(column - 1, 0), min(column + 2, self.w)):
+            k0 = x * l
+            row = min(max(round((py - r - self.knot_y[k0]) / (2 * self.Vd)), 0), l - 1)
+            for y in range(max(row - 1, 0), min(row + 2, l)):
+                k = k0 + y
+                d2 = (px - r - self.knot_x[k]) ** 2 + (py - r - self.knot_y[k]) ** 2
+                if d2 <= best_d2:
+                    best = k
+                    best_d2 = d2
+        return best
+
+    def knot_at(self, px, py, Kd):
+        """Index of the knot whose circle of diameter Kd contains the point px, py or None"""
+        r = Kd / 2
+        k = self.nearest_knot(px, py, Kd)
+        if (px - r - self.knot_x[k]) ** 2 + (py - r - self.knot_y[k]) ** 2 <= r * r:
+            return k
+        return None
+
+    def rows_between(self, top, bottom, Kd):
+        # range of the rows with a knot circle of diameter Kd between the y coordinates top and bottom
+        tops = [self.knot_y[x * self.l] for x in range(self.w)]
+        first = math.ceil((top - max(tops) - Kd) / (2 * self.Vd))
+        last = math.floor((bottom - min(tops)) / (2 * self.Vd))
+        return range(max(first, 0), min(last + 1, self.l))
+
+    def knots_in_rect(self, left, top, right, bottom, Kd):
+        # indices of the knots whose circle of diameter Kd has its center in the rect
+        r = Kd / 2
+        rows = self.rows_between(top, bottom, Kd)
+        return [k for k in self.knots(rows.start, rows.stop)
+                if left <= self.knot_x[k] + r <= right and top <= self.knot_y[k] + r <= bottom]
+
+    def diagonal(self, k, Kd):
+        # indices of the knots on the 45 degree line through the center of knot k crossing its row
+        l = self.l
+        x = k // l
+        step = next(step for start, stop, base, step in self.groups if start <= x < stop)
+        r = Kd / 2
+        cx = self.knot_x[k] + r
+        cy = self.knot_y[k] + r
+        knots = []
+        for column in range(self.w):
+            px = self.knot_x[column * l] + r
+            kn = self.knot_at(px, cy - step * (px - cx), Kd)
+            if kn is not None:
+                knots.append(kn)
+        return knots
+
+    def rows_rect(self, first, last, Kd, margin):
+        # x, y, width, height around all items of the knots in rows first .. last - 1
+        l = self.l
+        side = self.arc_side
+        xs = []
+        ys = []
+        for x in range(self.w):
+            for k in range(x * l + first, x * l + last):
+                xs += (self.knot_x[k], self.knot_x[k] + Kd, self.line_left[4 * k + 2],
+                       self.line_right[4 * k + 2], self.arc_left[2 * k], self.arc_right[2 * k] + side)
+                ys += (self.knot_y[k], self.knot_y[k] + Kd, self.line_left[4 * k + 3],
+                       self.line_right[4 * k + 3], self.arc_left[2 * k + 1] + side,
+                       self.arc_right[2 * k + 1] + side)
+        x0 = min(xs) - margin
+        y0 = min(ys) - margin
+        return x0, y0, max(xs) + margin - x0, max(ys) + margin - y0
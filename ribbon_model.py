@@ -0,0 +1,1482 @@
+"""
+Headless data model of a ribbon.
+
+RibbonModel owns the knot topology, the knot types, the thread visibility and
+the propagated thread colors. It does not depend on Qt, so batch jobs can build
+a ribbon or restore it from a .rbn file and read the resulting knot colors
+without creating a QGraphicsScene. The Ribbon class in ribbon.py is the view
+layer, it draws the graphics items from the state of the model.
+
+The knot state is kept in flat arrays (structure of arrays) instead of one
+object per knot; KnotRef gives attribute access to a single knot. Colors are
+stored as given by the caller in a small color table and referenced by index:
+the default palette uses (r, g, b) tuples, the view passes QColor objects.
+"""
+
+import copy
+import json
+import os
+import re
+import sys
+from array import array
+from collections import OrderedDict
+from enum import Enum, auto
+from itertools import repeat
+from operator import le, rshift
+
+
+class Const(Enum):
+    LeftIn = auto()
+    RightIn = auto()
+    LeftOut = auto()
+    RightOut = auto()
+    # Knots inside ribbon
+    Nk = auto()  # Normal not, 0 start threads
+    Rk = auto()  # Reverse not, 0 start threads
+    # end knots
+    EndKnLikeTypeR = auto()  # End knot left up to right down
+    EndKnLikeTypeL = auto()  # End knot right up to left down
+    EndKnBoth = auto()  # End knot right up to left down and left up to right dow, for type A only
+    # EndKnNoLeft =auto()
+    # EndKnNoRight =auto()
+    EndKnNone = auto()
+    LeftThrdVis = auto()
+    RightThrdVis = auto()
+    undefined = auto()
+    NA = auto()  # not available
+    # line types
+    arc = auto()
+    line = auto()
+
+
+# preset available start colors as (r, g, b), same order as my_Colors.f in ribbon.py
+# red, green, blue, black, cyan, magenta, yellow, darkgrey
+PALETTE = [(255, 99, 71), (0, 255, 0), (0, 191, 255), (0, 0, 0),
+           (0, 255, 255), (238, 130, 238), (255, 255, 0), (169, 169, 169)]
+UNDEFINED = (211, 211, 211)  # lightgrey, color of not yet colored threads
+
+NONE = -1  # no knot or no color in the index arrays
+NK = Const.Nk.value
+RK = Const.Rk.value
+END_LIKE_L = Const.EndKnLikeTypeL.value
+END_LIKE_R = Const.EndKnLikeTypeR.value
+END_BOTH = Const.EndKnBoth.value
+
+# bits of RibbonModel.flags
+START = 1  # start knot
+END = 2  # end knot
+EDGE_L = 4  # edge knot left
+EDGE_R = 8  # edge knot right
+
+# bits of RouteTable.out_seg
+OUT_LEFT = 1  # thread leaves the knot on the left exit, else on the right exit
+ARC = 2  # exit segment is an arc, else a line
+
+
+class KnotRef():
+    """Thin proxy with the attributes of a single knot, backed by the arrays of the model."""
+    __slots__ = ("model", "index")
+
+    def __init__(self, model, index):
+        self.model = model
+        self.index = index  # x * l + y
+
+    @property
+    def co(self):  # knot coordinate
+        return list(divmod(self.index, self.model.l))
+
+    @property
+    def type(self):  # Nk normal knot, Rk reverse knot
+        return Const(self.model.knot_type[self.index])
+
+    @type.setter
+    def type(self, type):
+        self.model.set_knot_type(self.index, type.value)
+
+    @property
+    def left_thread_vis(self):
+        return bool(self.model.left_vis[self.index])
+
+    @left_thread_vis.setter
+    def left_thread_vis(self, visible):
+        self.model.left_vis[self.index] = visible
+
+    @property
+    def endKtype(self):
+        return Const(self.model.end_type[self.index])
+
+    @property
+    def strtK(self):  # start knot
+        return bool(self.model.flags[self.index] & START)
+
+    @property
+    def endK(self):  # end knot
+        return bool(self.model.flags[self.index] & END)
+
+    @property
+    def edgeKL(self):  # edge knot left
+        return bool(self.model.flags[self.index] & EDGE_L)
+
+    @property
+    def edgeKR(self):  # edge knot right
+        return bool(self.model.flags[self.index] & EDGE_R)
+
+    @property
+    def nKtoL(self):  # next knot to left
+        return self.model.knot_ref(self.model.nKtoL[self.index])
+
+    @property
+    def nKtoR(self):  # next knot to right
+        return self.model.knot_ref(self.model.nKtoR[self.index])
+
+    @property
+    def color_in_left(self):  # input thread from left
+        return self.model.color(self.model.color_in_left[self.index])
+
+    @color_in_left.setter
+    def color_in_left(self, color):
+        self.model.color_in_left[self.index] = self.model.color_index(color)
+
+    @property
+    def color_in_right(self):  # input thread from right
+        return self.model.color(self.model.color_in_right[self.index])
+
+    @color_in_right.setter
+    def color_in_right(self, color):
+        self.model.color_in_right[self.index] = self.model.color_index(color)
+
+    @property
+    def color_out_left(self):  # color of left exit line or arc, None if no thread passed yet
+        return self.model.color(self.model.color_out_left[self.index])
+
+    @property
+    def color_out_right(self):  # color of right exit line or arc, None if no thread passed yet
+        return self.model.color(self.model.color_out_right[self.index])
+
+    @property
+    def knot_color(self):  # color of circle fill
+        return self.model.color(self.model.knot_color[self.index])
+
+    def set_knot_color(self):
+        return self.model.color(self.model.set_knot_color(self.index))
+
+
+class StartThread():
+    """Thread entering the ribbon from the color bar."""
+
+    def __init__(self, model, index, knot, direction, rect_pos, c):
+        self.model = model
+        self.index = index  # position in the color bar
+        self.knot = knot  # index of the start knot
+        self.direction = direction  # start input direction
+        self.rect_pos = rect_pos  # side of the color bar rectangle: left, left_high, none, right, right_high
+        self.c = c  # index of the thread color
+
+    @property
+    def color(self):
+        return self.model.colors[self.c]
+
+    @color.setter
+    def color(self, color):
+        self.c = self.model.color_index(color)
+
+
+class RouteTable():
+    """
+    Routing rules of a ribbon topology compiled into flat tables.
+
+    An input of knot k is addressed as port 2 * k (left input) or 2 * k + 1 (right input).
+    For a thread entering port p of a knot of type Nk (e = 2 * p) or Rk (e = 2 * p + 1),
+    next_port[e] is the port it enters at the next knot or NONE if it ends, out_seg[e]
+    holds the OUT_LEFT and ARC bits of the exit segment. order lists the knots in
+    dependency order. The table only depends on type, width and length of the ribbon, so
+    it can be shared by all engines and models of the same topology.
+    """
+    __slots__ = ("next_port", "out_seg", "order")
+
+    def __init__(self, model):
+        n = model.w * model.l
+        self.next_port = next_port = array("i", [NONE]) * (4 * n)
+        self.out_seg = out_seg = bytearray(4 * n)
+        exit = model.exit
+        for k in range(n):
+            for left_out in (True, False):
+                step = exit(k, left_out)
+                if step is None:
+                    continue
+                # a normal knot passes the thread to the other side, a reverse knot keeps the side
+                port = 2 * k + left_out  # input of Nk knots leaving on this side
+                e_nk = 2 * port
+                e_rk = 2 * (port ^ 1) + 1
+                next_port[e_nk] = next_port[e_rk] = step[0]
+                out_seg[e_nk] = out_seg[e_rk] = step[1]
+        self.order = array("i", model.knot_order())
+
+
+class RowPermutations():
+    """
+    Thread order of a ribbon as product of row permutations.
+
+    The w + 1 threads enter each row of knots at its entry ports, the ports fed from the
+    row above or from the color bar. Ordered by port they are the slots of the row. Inside
+    the row the knot types only permute the slots before the threads enter the next row, in
+    the last row they end at w + 1 different ports. A segment tree of the composed row
+    permutations answers which thread enters a knot with O(log l) compositions of w + 1
+    slots plus a walk along one row, and gives the thread order at the bottom directly.
+    A knot type edit only marks its row, the next query updates the leaves of the marked
+    rows and their log l parents, so edits cost nothing while nobody asks.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.routes = model.routes or model.compile_routes()
+        w = model.w
+        l = model.l
+        n = w * l
+        next_port = self.routes.next_port
+        # row of the knot feeding each port, the links do not depend on the knot types
+        fed_from = array("i", [NONE]) * (2 * n)
+        for e in range(4 * n):
+            if next_port[e] != NONE:
+                fed_from[next_port[e]] = (e >> 2) % l
+        starts = {2 * t.knot + (t.direction != Const.LeftIn): t.index for t in model.threads}
+
+        self.entry = []  # entry ports of each row in slot order
+        self.slot_of = array("h", [NONE]) * (2 * n)  # slot of each entry port
+        for y in range(l):
+            ports = array("i")
+            for x in range(w):
+                for port in (2 * (x * l + y), 2 * (x * l + y) + 1):
+                    row = fed_from[port]
+                    if row == NONE and port in starts or row != NONE and row != y:
+                        self.slot_of[port] = len(ports)
+                        ports.append(port)
+            if len(ports) != w + 1:
+                raise ValueError(f"Row {y} has {len(ports)} entry ports, expected {w + 1}")
+            self.entry.append(ports)
+        self.slot_thread = [starts[port] for port in self.entry[0]]  # thread in each top slot
+        self.dirty = set()  # rows with knot type edits since the last query
+
+        self.size = 1
+        while self.size < l:
+            self.size *= 2
+        identity = array("i", range(w + 1))
+        self.tree = [identity] * (2 * self.size)
+        for y in range(l):
+            self.tree[self.size + y] = self.row_permutation(y)
+        for i in range(self.size - 1, 0, -1):
+            self.tree[i] = self.compose(self.tree[2 * i], self.tree[2 * i + 1])
+
+    @staticmethod
+    def compose(upper, lower):
+        # permutation of upper rows followed by lower rows
+        return array("i", [lower[j] for j in upper])
+
+    def walk_row(self, port, y):
+        # follow a thread inside row y, returns its last port in the row and the next port
+        l = self.model.l
+        next_port = self.routes.next_port
+        knot_type = self.model.knot_type
+        while True:
+            nPort = next_port[2 * port + (knot_type[port >> 1] == RK)]
+            if nPort == NONE or (nPort >> 1) % l != y:
+                return port, nPort
+            port = nPort
+
+    def row_permutation(self, y):
+        # slot in the next row, or rank of the end port in the last row, of each slot of row y
+        perm = array("i", [NONE]) * len(self.entry[y])
+        ends = []
+        for j, port in enumerate(self.entry[y]):
+            port, nPort = self.walk_row(port, y)
+            if nPort == NONE:
+                ends.append((port, j))
+            else:
+                perm[j] = self.slot_of[nPort]
+        for rank, (port, j) in enumerate(sorted(ends)):
+            perm[j] = rank
+        return perm
+
+    def row_changed(self, y):
+        # a knot type of row y changed, its permutation is updated on the next query
+        self.dirty.add(y)
+
+    def refresh(self):
+        # update the permutations of the changed rows
+        for y in self.dirty:
+            self.update_row(y)
+        self.dirty.clear()
+
+    def update_row(self, y):
+        # recompute the permutation of row y after a knot type change
+        i = self.size + y
+        self.tree[i] = self.row_permutation(y)
+        i //= 2
+        while i:
+            self.tree[i] = self.compose(self.tree[2 * i], self.tree[2 * i + 1])
+            i //= 2
+
+    def prefix(self, y):
+        # slot at row y of the thread in each top slot, composed from rows 0 .. y - 1
+        self.refresh()
+        perm = array("i", range(len(self.slot_thread)))
+        lo = self.size
+        hi = self.size + y
+        lower = []
+        while lo < hi:
+            if lo & 1:
+                perm = self.compose(perm, self.tree[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                lower.append(self.tree[hi])
+            lo //= 2
+            hi //= 2
+        for node in reversed(lower):
+            perm = self.compose(perm, node)
+        return perm
+
+    def slot_threads(self, y):
+        # thread index in each slot of row y
+        threads = [NONE] * len(self.slot_thread)
+        for top, slot in enumerate(self.prefix(y)):
+            threads[slot] = self.slot_thread[top]
+        return threads
+
+    def thread_at(self, k, direction):
+        # index of the thread entering knot k from direction, None if there is none
+        y = k % self.model.l
+        port = 2 * k + (direction != Const.LeftIn)
+        threads = self.slot_threads(y)
+        if self.slot_of[port] != NONE:
+            return threads[self.slot_of[port]]
+        # port inside the row, find the slot whose thread passes it
+        next_port = self.routes.next_port
+        knot_type = self.model.knot_type
+        l = self.model.l
+        for j, p in enumerate(self.entry[y]):
+            while True:
+                p = next_port[2 * p + (knot_type[p >> 1] == RK)]
+                if p == NONE or (p >> 1) % l != y:
+                    break
+                if p == port:
+                    return threads[j]
+        return None
+
+    def color_at(self, k, direction):
+        # color index of the thread entering knot k from direction, NONE if there is none
+        i = self.thread_at(k, direction)
+        return NONE if i is None else self.model.threads[i].c
+
+    def bottom_order(self):
+        """Thread indices in the order of the ports where they end in the last row"""
+        self.refresh()
+        order = [NONE] * len(self.slot_thread)
+        for top, rank in enumerate(self.tree[1]):
+            order[rank] = self.slot_thread[top]
+        return order
+
+
+class RibbonTemplate():
+    """
+    Everything of a new ribbon that only depends on (type, width, length).
+
+    Holds the knot links, end knot types and flags, the default knot types and
+    visibility, the start knot and palette index of each thread, the compiled RouteTable
+    and the layout of the view (set by the view on first use). New models copy the
+    default knot types and visibility and share the rest, which is never modified.
+    """
+    __slots__ = ("key", "knot_type", "left_vis", "end_type", "flags", "nKtoL", "nKtoR",
+                 "starts", "routes", "layout")
+    ARRAYS = ("knot_type", "left_vis", "end_type", "flags", "nKtoL", "nKtoR")
+    TYPECODES = "bBhHiIlLqQfd"  # typecodes accepted in a file
+
+    def __init__(self, model):
+        self.key = (model.type, model.w, model.l)
+        self.knot_type = model.knot_type[:]
+        self.left_vis = model.left_vis[:]
+        self.end_type = model.end_type
+        self.flags = model.flags
+        self.nKtoL = model.nKtoL
+        self.nKtoR = model.nKtoR
+        indices = model.color_indices()
+        self.starts = [model.get_start_knot(i) + (indices[i],) for i in range(model.w + 1)]
+        self.routes = RouteTable(model)
+        self.layout = None
+
+    def apply(self, model):
+        model.knot_type = self.knot_type[:]
+        model.left_vis = self.left_vis[:]
+        model.end_type = self.end_type
+        model.flags = self.flags
+        model.nKtoL = self.nKtoL
+        model.nKtoR = self.nKtoR
+        model.routes = self.routes
+
+    def dump(self, file):
+        """
+        Write the template to a binary file as plain data: one line of JSON with the
+        scalars and the names, typecodes and lengths of the arrays, then the raw bytes of
+        the arrays in that order.
+        """
+        arrays = [(name, getattr(self, name)) for name in self.ARRAYS]
+        arrays += [("routes." + name, getattr(self.routes, name)) for name in RouteTable.__slots__]
+        layout = None
+        if self.layout is not None:
+            layout = {}
+            for name in type(self.layout).__slots__:
+                value = getattr(self.layout, name)
+                if isinstance(value, array):
+                    arrays.append(("layout." + name, value))
+                else:
+                    layout[name] = value
+        header = {
+            "key": list(self.key),
+            "byteorder": sys.byteorder,
+            "starts": [[knot, direction.name, rect_pos, c] for knot, direction, rect_pos, c in self.starts],
+            "layout": layout,
+            "arrays": [[name, value.typecode if isinstance(value, array) else "bytes", len(value)]
+                       for name, value in arrays],
+        }
+        file.write(json.dumps(header).encode() + b"\n")
+        for name, value in arrays:
+            file.write(value.tobytes() if isinstance(value, array) else bytes(value))
+
+    @classmethod
+    def load(cls, file, key):
+        """
+        Read a template written by dump, None if it is not the one of key. Raises
+        ValueError, KeyError or TypeError if the file is damaged or its links are invalid.
+        """
+        header = json.loads(file.readline())
+        if tuple(header["key"]) != key or header["byteorder"] != sys.byteorder:
+            return None
+        n = key[1] * key[2]
+        values = {}
+        for name, typecode, length in header["arrays"]:
+            if typecode == "bytes":
+                value = bytearray(file.read(length))
+            elif typecode in cls.TYPECODES:
+                value = array(typecode)
+                value.frombytes(file.read(length * value.itemsize))
+            else:
+                raise ValueError(f"Unknown typecode {typecode!r}")
+            if len(value) != length or length % n:
+                raise ValueError(f"Array {name} has a wrong length")
+            values[name] = value
+
+        template = cls.__new__(cls)
+        template.key = key
+        for name in cls.ARRAYS:
+            setattr(template, name, values[name])
+        template.starts = [(knot, Const[direction], rect_pos, c) for knot, direction, rect_pos, c in header["starts"]]
+        template.routes = RouteTable.__new__(RouteTable)
+        for name in RouteTable.__slots__:
+            setattr(template.routes, name, values["routes." + name])
+        template.layout = None
+        if header["layout"] is not None:
+            from ribbon_layout import RibbonLayout
+            layout = RibbonLayout.__new__(RibbonLayout)
+            for name in RibbonLayout.__slots__:
+                setattr(layout, name, values["layout." + name] if "layout." + name in values
+                        else header["layout"][name])
+            layout.groups = [tuple(group) for group in layout.groups]
+            layout.geometry = tuple(layout.geometry)
+            template.layout = layout
+        template.check()
+        return template
+
+    def check(self):
+        """
+        Raise ValueError unless the knot order is a permutation of the knots and every knot
+        link and route goes to a knot later in that order, so every thread ends.
+        """
+        n = self.key[1] * self.key[2]
+        routes = self.routes
+        if (any(len(getattr(self, name)) != n for name in self.ARRAYS) or len(routes.order) != n
+                or len(routes.next_port) != 4 * n or len(routes.out_seg) != 4 * n):
+            raise ValueError("Arrays do not fit the ribbon size")
+        order = routes.order
+        if min(order) < 0 or max(order) >= n or len(set(order)) != n:
+            raise ValueError("Knot order is not a permutation")
+        # position of each knot in the order, NONE (-1) reads the last entry, which is after all knots
+        position = array("i", [n]) * (n + 1)
+        for i, k in enumerate(order):
+            position[k] = i
+        # the comparisons run in map and any, a Python loop over the routes costs as much as building them
+        for links in (self.nKtoL, self.nKtoR):
+            if min(links) < NONE or max(links) >= n or any(map(le, map(position.__getitem__, links), position)):
+                raise ValueError("Invalid knot link")
+        next_port = routes.next_port
+        # a normal and a reverse knot send the threads leaving on the same side to the same port
+        if min(next_port) < NONE or max(next_port) >= 2 * n or next_port[0::4] != next_port[3::4] \
+                or next_port[1::4] != next_port[2::4]:
+            raise ValueError("Invalid route")
+        for ports in (next_port[0::4], next_port[1::4]):
+            if any(map(le, map(position.__getitem__, map(rshift, ports, repeat(1))), position)):
+                raise ValueError("Invalid route")
+        for knot, direction, rect_pos, c in self.starts:
+            if not 0 <= knot < n or direction not in (Const.LeftIn, Const.RightIn):
+                raise ValueError(f"Invalid start knot {knot}")
+
+
+class TemplateCache():
+    """
+    RibbonTemplates by (type, width, length), the least recently used are dropped first.
+
+    If directory is set, templates are also written to and read from files there, so the
+    sizes used before are instant after a restart too. The files hold plain data, see
+    RibbonTemplate.dump. They are a cache only, a missing or damaged file is a miss and
+    a failed write is ignored. A write deletes the files of other versions and, above
+    disk_size bytes, the files used least recently.
+    """
+    VERSION = 4  # part of the file names, increase when RibbonTemplate changes
+    FILE_NAME = re.compile(r"v\d+_[A-Z]_\d+x\d+\.tpl")  # names of the files of all versions
+
+    def __init__(self, size=16, directory=None, disk_size=64 << 20):
+        self.size = size
+        self.directory = directory
+        self.disk_size = disk_size
+        self.templates = OrderedDict()
+
+    def path(self, key):
+        type, width, length = key
+        return os.path.join(self.directory, f"v{self.VERSION}_{type}_{width}x{length}.tpl")
+
+    def get(self, type, width, length):
+        key = (type, width, length)
+        template = self.templates.get(key)
+        if template is not None:
+            self.templates.move_to_end(key)
+        elif self.directory:
+            path = self.path(key)
+            try:
+                with open(path, "rb") as file:
+                    template = RibbonTemplate.load(file, key)
+                if template is not None:
+                    os.utime(path)  # the modification time orders the files by use
+            except (OSError, ValueError, KeyError, TypeError):  # a missing or damaged file is just a cache miss
+                template = None
+            if template is not None:
+                self.remember(template)
+        return template
+
+    def put(self, template):
+        # remember template and write it to the directory, returns the template
+        self.remember(template)
+        if self.directory:
+            path = self.path(template.key)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path + ".tmp", "wb") as file:
+                    template.dump(file)
+                os.replace(path + ".tmp", path)
+            except OSError:
+                pass
+            self.prune(path)
+        return template
+
+    def prune(self, keep=None):
+        # delete the files of other versions and the least recently used ones above disk_size, except keep
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        prefix = f"v{self.VERSION}_"
+        files = []
+        for name in names:
+            if not self.FILE_NAME.fullmatch(name):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if name.startswith(prefix):
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+        total = sum(size for mtime, size, path in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.disk_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def remember(self, template):
+        self.templates[template.key] = template
+        self.templates.move_to_end(template.key)
+        while len(self.templates) > self.size:
+            self.templates.popitem(last=False)
+
+    def clear(self):
+        self.templates.clear()
+
+
+templates = TemplateCache()  # shared by all models
+
+
+class RibbonModel():
+    # The knot (x, y) is stored at index x * l + y of the flat arrays knot_type, left_vis,
+    # end_type, flags, nKtoL and nKtoR and of the color arrays. Colors are indices into the
+    # color table self.colors, its first entry is the undefined color.
+
+    def __init__(self, width, length, type, palette=None, undefined=UNDEFINED, color_key=None):
+        self.w = width
+        self.l = length
+        self.type = type
+        self.palette = PALETTE if palette is None else palette
+        # color_key maps a color to a hashable key, colors with the same key share an index
+        self.color_key = (lambda color: color) if color_key is None else color_key
+        self.colors = [undefined]  # color table
+        self.color_ids = {self.color_key(undefined): 0}  # color key -> index in color table
+        self.threads = []  # StartThread for each color bar position
+        self.routes = None  # compiled RouteTable, see compile_routes
+        self.paths = None  # ports passed by each thread, see thread_paths
+        self.rows = None  # RowPermutations of the threads, see row_permutations
+        self.port_thread = None  # index of the thread entering each port
+
+        self.make_empty_ribbon()
+
+        # the topology of a ribbon size seen before is copied from its template
+        self.template = templates.get(type, width, length)
+        if self.template is not None:
+            self.template.apply(self)
+        else:
+            # define different ribbon types
+            match type:
+                case "L":
+                    self.set_type_L()
+                case "R":
+                    self.set_type_R()
+                case "M":
+                    self.set_type_M()
+                case "A":
+                    self.set_type_A()
+                case "W":
+                    self.set_type_W()
+                case _:
+                    raise ValueError(f"Unknown ribbon type {type!r}")
+            self.template = templates.put(RibbonTemplate(self))
+            self.routes = self.template.routes
+
+        self.make_start_threads()
+
+    @classmethod
+    def from_dict(cls, data, make_color=tuple, palette=None, undefined=UNDEFINED, color_key=None):
+        """Build a propagated model from the content of a .rbn file"""
+        ribbon_data = data.get("ribbon", {})
+        model = cls(ribbon_data.get("width", 5), ribbon_data.get("length", 10),
+                    ribbon_data.get("type", "L"), palette, undefined, color_key)
+        model.restore_from_dict(data, make_color)
+        return model
+
+    def idx(self, x, y):
+        return x * self.l + y
+
+    def knot(self, x, y):
+        return KnotRef(self, x * self.l + y)
+
+    def knot_ref(self, k):
+        return None if k == NONE else KnotRef(self, k)
+
+    def color(self, c):
+        return None if c == NONE else self.colors[c]
+
+    def color_index(self, color):
+        # index of color in the color table, unknown colors are appended
+        key = self.color_key(color)
+        c = self.color_ids.get(key)
+        if c is None:
+            c = self.color_ids[key] = len(self.colors)
+            self.colors.append(color)
+        return c
+
+    def set_type_L(self):
+        self.make_knot_links(True, 0, self.w)
+        self.set_visible(0, self.w, Const.LeftThrdVis)
+
+        # set end knot types and next knot in one direction
+        self.set_end_knots(True, 0, self.w - 1)
+
+    def set_type_R(self):
+        self.make_knot_links(False, 0, self.w)
+        self.set_visible(0, self.w, Const.RightThrdVis)
+
+        # set end knot types and next knot in one direction
+        self.set_end_knots(False, 1, self.w)
+
+    def set_type_M(self):
+        mid = self.w // 2
+
+        self.make_knot_links(True, 0, mid)
+        self.make_knot_links(False, mid + 1, self.w)
+        self.set_type(mid, Const.Rk)
+        self.set_visible(mid + 1, self.w, Const.RightThrdVis)
+        self.fix_middle_knot_links("M", mid)
+
+        # set end knot types and next knot in one direction
+        self.set_end_knots(True, 0, mid)
+        self.set_end_knots(False, mid + 1, self.w)
+
+    def set_type_A(self):
+        mid = self.w // 2
+
+        self.make_knot_links(False, 0, mid)
+        self.make_knot_links(True, mid + 1, self.w)
+        self.set_type(mid, Const.Rk)
+        self.set_visible(0, mid, Const.RightThrdVis)
+        self.fix_middle_knot_links("A", mid)
+
+        # set end knot types and next knot in one direction
+        self.set_end_knots(False, 1, mid + 1)
+        self.set_end_knots(True, mid, self.w - 1)
+        self.end_type[self.idx(mid, self.l - 1)] = END_BOTH
+
+    def set_type_W(self):
+        # w = 4 * d + 1 : 5, 9, 13, 17, 21, 25, 29, ...
+        # calculate x values  example w = 13 d = 3
+        d = int(self.w / 4)
+        x0 = 0  # x0 = 0
+        x1 = d  # x1 = 3
+        x2 = x1 + d  # x2 = 6
+        x3 = x2 + d  # x3 = 9
+        x4 = x3 + d  # x4 = 12
+
+        self.make_knot_links(True, x0, x1 + 1)  # 0 - 3
+        self.make_knot_links(False, x1, x2 + 1)  # 4 - 6
+        self.make_knot_links(True, x2, x3 + 1)  # 7 - 9
+        self.make_knot_links(False, x3, x4 + 1)  # 10 - 12
+        self.set_type(x1, Const.Rk)  # 3
+        self.set_type(x2, Const.Rk)  # 6
+        self.set_type(x3, Const.Rk)  # 9
+        self.set_visible(x0, x1 + 1, Const.LeftThrdVis)  # 0 - 3
+        self.set_visible(x1, x2 + 1, Const.RightThrdVis)  # 4 - 6
+        self.set_visible(x2, x3, Const.LeftThrdVis)  # 7 - 9
+        self.set_visible(x3 + 1, x4 + 1, Const.RightThrdVis)  # 10 - 12
+        self.fix_middle_knot_links("M", x1)  # 3 behaves like type M
+        self.fix_middle_knot_links("A", x2)  # 6 behaves like type A
+        self.fix_middle_knot_links("M", x3)  # 9 behaves like type M
+
+        # set endKtype and next knot in one direction
+        y = self.l - 1
+        self.end_type[self.idx(x1, y)] = Const.EndKnNone.value
+        self.set_end_knots(True, x0, x1)  # 0 - 3
+        self.set_end_knots(False, x1 + 1, x2 + 1)  # 4 - 5
+        self.set_end_knots(True, x2, x3)  # 7 - 9
+        self.end_type[self.idx(x2, y)] = END_BOTH
+        self.end_type[self.idx(x3, y)] = Const.EndKnNone.value
+        self.set_end_knots(False, x3 + 1, x4 + 1)  # 10 - 12
+
+    def make_empty_ribbon(self):
+        n = self.w * self.l
+        self.knot_type = array("B", [NK]) * n
+        self.left_vis = array("B", [1]) * n
+        self.end_type = array("B", [Const.undefined.value]) * n
+        self.flags = array("B", [0]) * n
+        self.nKtoL = array("i", [NONE]) * n  # index of next knot to left
+        self.nKtoR = array("i", [NONE]) * n  # index of next knot to right
+        self.color_in_left = array("h", [0]) * n  # input thread from left
+        self.color_in_right = array("h", [0]) * n  # input thread from right
+        self.color_out_left = array("h", [NONE]) * n  # left exit line or arc, NONE if no thread passed yet
+        self.color_out_right = array("h", [NONE]) * n  # right exit line or arc, NONE if no thread passed yet
+        self.knot_color = array("h", [NONE]) * n  # color of circle fill
+
+        l = self.l
+        for x in range(self.w):
+            self.flags[x * l] |= START  # start knot
+            self.flags[x * l + l - 1] |= END  # end knot
+        for y in range(l):
+            self.flags[y] |= EDGE_L  # edge knot left
+            self.flags[(self.w - 1) * l + y] |= EDGE_R  # edge knot right
+
+    def make_knot_links(self, likeTypeL, start, stop):
+        # at init all knot are type Nk
+        l = self.l
+        for y in range(l):  # y .. index to the rows
+            for x in range(start, stop):  # x .. index to columns
+                k = x * l + y
+                f = self.flags[k]
+                if not f & END:
+                    if likeTypeL:
+                        if f & EDGE_L:
+                            nKtoR = (x + 1) * l + y
+                            nKtoL = x * l + y + 1
+                        elif f & EDGE_R:
+                            nKtoR = x * l + y + 1
+                            nKtoL = (x - 1) * l + y + 1
+                        else:
+                            nKtoR = (x + 1) * l + y
+                            nKtoL = (x - 1) * l + y + 1
+                    else:  # reverse
+                        if f & EDGE_L:
+                            nKtoR = (x + 1) * l + y + 1
+                            nKtoL = x * l + y + 1
+                        elif f & EDGE_R:
+                            nKtoR = x * l + y + 1
+                            nKtoL = (x - 1) * l + y
+                        else:
+                            nKtoR = (x + 1) * l + y + 1
+                            nKtoL = (x - 1) * l + y
+
+                    self.nKtoR[k] = nKtoR
+                    self.nKtoL[k] = nKtoL
+
+    def fix_middle_knot_links(self, type, column):
+        x = column
+        l = self.l
+        for y in range(l):
+            k = x * l + y
+            if not self.flags[k] & END:
+                if type == "M":
+                    self.nKtoR[k] = (x + 1) * l + y + 1
+                    self.nKtoL[k] = (x - 1) * l + y + 1
+                elif type == "A":
+                    self.nKtoR[k] = (x + 1) * l + y
+                    self.nKtoL[k] = (x - 1) * l + y
+                else:
+                    raise ValueError(f"No such middle knot type {type!r}")
+
+    def set_end_knots(self, likeTypeL, start, stop):
+        y = self.l - 1
+        for x in range(start, stop):
+            k = self.idx(x, y)
+            if likeTypeL and not self.flags[k] & EDGE_R:
+                self.end_type[k] = END_LIKE_L
+                self.nKtoR[k] = self.idx(x + 1, y)
+            else:
+                self.end_type[k] = END_LIKE_R
+                self.nKtoL[k] = self.idx(x - 1, y)
+
+    def toggle_type(self, column):
+        # toggle between NK and Rk
+        self.paths = self.rows = None
+        for k in range(column * self.l, (column + 1) * self.l):
+            self.knot_type[k] = RK if self.knot_type[k] == NK else NK
+
+    def set_type(self, column, type):
+        self.paths = self.rows = None
+        for k in range(column * self.l, (column + 1) * self.l):
+            self.knot_type[k] = type.value
+
+    def set_visible(self, start, stop, const):
+        if const == Const.LeftThrdVis:
+            visible = 1
+        elif const == Const.RightThrdVis:
+            visible = 0
+        else:
+            raise ValueError(f"No visibility constant {const}")
+        for k in range(start * self.l, stop * self.l):
+            self.left_vis[k] = visible
+
+    def color_indices(self):
+        # palette index of the default color of each thread in the color bar
+        indices = []
+        if self.type == "L" or self.type == "R":
+            for i in range(self.w + 1):
+                indices.append(i % 8)
+        elif self.type == "M" or self.type == "A":
+            mid = self.w // 2
+            j = 0
+            for i in range(0, mid + 1):
+                indices.append(j % 8)
+                j += 1
+            j = mid
+            for i in range(self.w + 1, mid + 1, -1):
+                indices.append(j % 8)
+                j -= 1
+        elif self.type == "W":
+            d = int(self.w / 4)
+            x1 = d
+            x2 = 2 * d
+            x3 = 3 * d
+            x4 = 4 * d
+
+            # symmetric repeat pattern
+            pattern = [0, 0]
+            for i in range(1, d):
+                pattern.append(i % 8)
+
+            for i in range(0, x1 + 1):
+                indices.append(pattern[i])
+            j = d
+            for i in range(x1 + 1, x2 + 2):
+                indices.append(pattern[j])
+                j -= 1
+            j = 2
+            for i in range(x2 + 2, x3 + 1):
+                indices.append(pattern[j])
+                j += 1
+            j = d
+            for i in range(x3 + 1, x4 + 2):
+                indices.append(pattern[j])
+                j -= 1
+        return indices
+
+    def make_start_threads(self):
+        self.threads = []
+        for i, (knot, direction, rect_pos, color) in enumerate(self.template.starts):
+            c = self.color_index(self.palette[color])
+            self.threads.append(StartThread(self, i, knot, direction, rect_pos, c))
+
+    def get_start_knot(self, i):
+        # index of start knot, input direction and color bar position of thread i
+        l = self.l
+        match self.type:
+            case "L":
+                if i == 0:
+                    return 0, Const.LeftIn, "left"
+                # k stays same, as knot has two inputs threads
+                elif i == 1:
+                    return 0, Const.RightIn, "none"
+                else:
+                    return (i - 1) * l, Const.RightIn, "none"
+            case "R":
+                if i < self.w:
+                    return i * l, Const.LeftIn, "none"
+                # k stays same, as knot has two inputs threads
+                else:
+                    return (self.w - 1) * l, Const.RightIn, "right"
+            case "M":
+                mid = int((self.w - 1) // 2)
+                if i == 0:
+                    return 0, Const.LeftIn, "left"
+                elif i == 1:
+                    return 0, Const.RightIn, "none"
+                elif i <= mid:
+                    return (i - 1) * l, Const.RightIn, "none"
+                elif i < self.w:
+                    return i * l, Const.LeftIn, "none"
+                else:
+                    return (self.w - 1) * l, Const.RightIn, "right"
+            case "A":
+                mid = int((self.w - 1) // 2)
+                if i <= mid:
+                    return i * l, Const.LeftIn, "left"
+                elif i == mid + 1:
+                    return mid * l, Const.RightIn, "right"
+                else:
+                    return (i - 1) * l, Const.RightIn, "right"
+            case "W":
+                d = int(self.w / 4)
+                x1 = d
+                x2 = 2 * d
+                x3 = 3 * d
+                x4 = 4 * d
+
+                if i == 0:
+                    return 0, Const.LeftIn, "left"
+                elif i == 1:
+                    return 0, Const.RightIn, "none"
+                elif i <= x1:
+                    return (i - 1) * l, Const.RightIn, "none"
+                elif i < x2 + 1:
+                    return i * l, Const.LeftIn, "left_high"
+                elif i < x3 + 1:
+                    return (i - 1) * l, Const.RightIn, "right_high"
+                elif i < x4 + 1:
+                    return i * l, Const.LeftIn, "none"
+                else:
+                    return x4 * l, Const.RightIn, "right"
+
+    def compile_routes(self):
+        """Compile the routing rules of the ribbon into a RouteTable, cached in self.routes"""
+        self.routes = RouteTable(self)
+        return self.routes
+
+    def knot_order(self):
+        """
+        Knot indices in dependency order: every knot comes after all knots that link to it.
+
+        Links only run along a row or down to the next row and never back, so the graph is
+        acyclic. Raises ValueError if the links are broken.
+        """
+        n = self.w * self.l
+        nKtoL = self.nKtoL
+        nKtoR = self.nKtoR
+        pending = array("B", [0]) * n  # number of links into each knot
+        for k in range(n):
+            if nKtoL[k] != NONE:
+                pending[nKtoL[k]] += 1
+            if nKtoR[k] != NONE:
+                pending[nKtoR[k]] += 1
+        order = [k for k in range(n) if not pending[k]]
+        for k in order:  # order grows while we walk it
+            for nKnot in (nKtoL[k], nKtoR[k]):
+                if nKnot != NONE:
+                    pending[nKnot] -= 1
+                    if not pending[nKnot]:
+                        order.append(nKnot)
+        if len(order) != n:
+            raise ValueError("Knot links contain a cycle")
+        return order
+
+    def exit(self, k, left_out):
+        """
+        Where a thread leaving knot k on the left (left_out) or right exit goes next.
+
+        Returns (port at the next knot, out_seg bits) or None if the thread ends at k. Used
+        to compile the RouteTable, the engines walk the table.
+        """
+        f = self.flags[k]
+        nKnot = self.nKtoL[k] if left_out else self.nKtoR[k]
+        if f & END:
+            # end knots pass the thread along the last row only
+            if f & (EDGE_L | EDGE_R):
+                if nKnot == NONE:
+                    return None
+            else:
+                eType = self.end_type[k]
+                if eType == END_LIKE_R:
+                    if not left_out:
+                        return None
+                elif eType == END_LIKE_L:
+                    if left_out:
+                        return None
+                elif eType != END_BOTH:
+                    return None
+        elif f & EDGE_R and not left_out:  # arc at the right edge to the right input
+            return 2 * nKnot + 1, ARC
+        elif f & EDGE_L and left_out:  # arc at the left edge to the left input
+            return 2 * nKnot, OUT_LEFT | ARC
+        # a line from the left exit enters the next knot at its right input and vice versa
+        return 2 * nKnot + left_out, OUT_LEFT if left_out else 0
+
+    def propagate(self):
+        """
+        Propagate the start colors of all threads through the ribbon in one sweep.
+
+        Knots are visited in dependency order, so both inputs of a knot are final when it is
+        reached and each input, output and knot color is written exactly once. This gives the
+        same result as following every thread with set_thread.
+        """
+        routes = self.routes or self.compile_routes()
+        next_port = routes.next_port
+        out_seg = routes.out_seg
+        knot_type = self.knot_type
+        left_vis = self.left_vis
+        color_in_left = self.color_in_left
+        color_in_right = self.color_in_right
+        color_out_left = self.color_out_left
+        color_out_right = self.color_out_right
+        knot_color = self.knot_color
+        # inputs reached by a thread, others keep their color like in set_thread
+        fed = bytearray(2 * self.w * self.l)
+        for thread in self.threads:
+            if thread.direction == Const.LeftIn:
+                color_in_left[thread.knot] = thread.c
+                fed[2 * thread.knot] = 1
+            else:
+                color_in_right[thread.knot] = thread.c
+                fed[2 * thread.knot + 1] = 1
+
+        for k in routes.order:
+            port = 2 * k
+            if not (fed[port] or fed[port + 1]):
+                continue
+            knot_color[k] = color_in_left[k] if left_vis[k] else color_in_right[k]
+            rk = knot_type[k] == RK
+            for port in (port, port + 1):
+                if not fed[port]:
+                    continue
+                e = 2 * port + rk
+                nPort = next_port[e]
+                if nPort == NONE:
+                    continue
+                c = color_in_right[k] if port & 1 else color_in_left[k]
+                if out_seg[e] & OUT_LEFT:
+                    color_out_left[k] = c
+                else:
+                    color_out_right[k] = c
+                fed[nPort] = 1
+                if nPort & 1:
+                    color_in_right[nPort >> 1] = c
+                else:
+                    color_in_left[nPort >> 1] = c
+
+    def set_thread(self, k, c, direction):
+        """
+        Follow a thread of color index c entering knot k from direction down to its end.
+
+        Returns the visited path as a list of (knot index, out direction, segment type). The
+        last entry is the knot where the thread stops, with out direction and segment None.
+        """
+        routes = self.routes or self.compile_routes()
+        next_port = routes.next_port
+        out_seg = routes.out_seg
+        knot_type = self.knot_type
+        left_vis = self.left_vis
+        color_in_left = self.color_in_left
+        color_in_right = self.color_in_right
+        color_out_left = self.color_out_left
+        color_out_right = self.color_out_right
+        knot_color = self.knot_color
+        line = Const.line
+        arc = Const.arc
+        path = []
+        port = 2 * k + (direction != Const.LeftIn)
+        while True:
+            # set input color and knot color
+            k = port >> 1
+            if port & 1:
+                color_in_right[k] = c
+            else:
+                color_in_left[k] = c
+            knot_color[k] = color_in_left[k] if left_vis[k] else color_in_right[k]
+
+            e = 2 * port + (knot_type[k] == RK)
+            port = next_port[e]
+            if port == NONE:
+                break
+            seg = out_seg[e]
+            if seg & OUT_LEFT:
+                color_out_left[k] = c
+                path.append((k, Const.LeftOut, arc if seg & ARC else line))
+            else:
+                color_out_right[k] = c
+                path.append((k, Const.RightOut, arc if seg & ARC else line))
+
+        path.append((k, None, None))
+        return path
+
+    def trace(self, port):
+        # ports a thread entering port passes, following the route table
+        routes = self.routes or self.compile_routes()
+        next_port = routes.next_port
+        knot_type = self.knot_type
+        ports = array("i")
+        while port != NONE:
+            ports.append(port)
+            port = next_port[2 * port + (knot_type[port >> 1] == RK)]
+        return ports
+
+    def thread_paths(self):
+        """
+        Index of the thread paths: the list of ports each thread passes, in order.
+
+        Built on first use and kept up to date by set_knot_type. self.port_thread maps
+        each port back to the index of its thread, NONE if no thread enters it.
+        """
+        if self.paths is None:
+            self.port_thread = array("h", [NONE]) * (2 * self.w * self.l)
+            self.paths = []
+            for thread in self.threads:
+                ports = self.trace(2 * thread.knot + (thread.direction != Const.LeftIn))
+                for port in ports:
+                    self.port_thread[port] = thread.index
+                self.paths.append(ports)
+        return self.paths
+
+    def row_permutations(self):
+        # RowPermutations of the threads, built on first use and kept up to date by set_knot_type
+        if self.rows is None:
+            self.rows = RowPermutations(self)
+        return self.rows
+
+    def thread_at(self, k, direction):
+        # index of the thread entering knot k from direction, None if there is none
+        self.thread_paths()
+        i = self.port_thread[2 * k + (direction != Const.LeftIn)]
+        return None if i == NONE else i
+
+    def exit_segment(self, k, direction):
+        """
+        Input port of knot k whose thread leaves on the exit direction (LeftOut or RightOut)
+        and the segment type of that exit, None if no thread leaves there.
+        """
+        routes = self.routes or self.compile_routes()
+        rk = self.knot_type[k] == RK
+        for port in (2 * k, 2 * k + 1):
+            e = 2 * port + rk
+            if routes.next_port[e] != NONE and bool(routes.out_seg[e] & OUT_LEFT) == (direction == Const.LeftOut):
+                return port, Const.arc if routes.out_seg[e] & ARC else Const.line
+        return None
+
+    def thread_leaving(self, k, direction):
+        # index of the thread leaving knot k on the exit direction, None if there is none
+        exit = self.exit_segment(k, direction)
+        if exit is None:
+            return None
+        self.thread_paths()
+        i = self.port_thread[exit[0]]
+        return None if i == NONE else i
+
+    def thread_path(self, i):
+        """Path of thread i as list of (knot index, out direction, segment type) like set_thread"""
+        ports = self.thread_paths()[i]
+        out_seg = self.routes.out_seg
+        knot_type = self.knot_type
+        path = []
+        for port in ports[:-1]:
+            k = port >> 1
+            seg = out_seg[2 * port + (knot_type[k] == RK)]
+            path.append((k, Const.LeftOut if seg & OUT_LEFT else Const.RightOut,
+                         Const.arc if seg & ARC else Const.line))
+        path.append((ports[-1] >> 1, None, None))
+        return path
+
+    def set_knot_type(self, k, type):
+        """Set the type value of knot k and update the thread paths passing it"""
+        if self.knot_type[k] == type:
+            return
+        self.knot_type[k] = type
+        if self.rows is not None:
+            self.rows.row_changed(k % self.l)
+        if self.paths is None:
+            return
+        # the threads entering k swap their tails, cut both before tracing them again
+        port_thread = self.port_thread
+        cut = []
+        for port in (2 * k, 2 * k + 1):
+            i = port_thread[port]
+            if i != NONE:
+                ports = self.paths[i]
+                pos = ports.index(port)
+                for p in ports[pos + 1:]:
+                    port_thread[p] = NONE
+                del ports[pos:]
+                cut.append((i, port))
+        for i, port in cut:
+            tail = self.trace(port)
+            for p in tail:
+                port_thread[p] = i
+            self.paths[i].extend(tail)
+
+    def change_knot_type(self, k, type):
+        """
+        Set the type value of knot k and propagate the two threads entering it again.
+
+        Only the new tails of the two threads are walked and the walk stops where the
+        colors already match, as all ports behind a port of the right color have it too.
+        Returns the diff (knots, segments): indices of knots with a new fill color and
+        (knot index, out direction, segment type) of exit segments with a new color.
+        """
+        paths = self.thread_paths()
+        knots = []
+        segments = []
+        if self.knot_type[k] == type:
+            return knots, segments
+        self.set_knot_type(k, type)
+        next_port = self.routes.next_port
+        out_seg = self.routes.out_seg
+        knot_type = self.knot_type
+        color_in_left = self.color_in_left
+        color_in_right = self.color_in_right
+        color_out_left = self.color_out_left
+        color_out_right = self.color_out_right
+        port_thread = self.port_thread
+        dirty = []  # knots with a new input color
+        for port in (2 * k, 2 * k + 1):
+            i = port_thread[port]
+            if i == NONE:
+                continue
+            c = self.threads[i].c
+            ports = paths[i]
+            for port in ports[ports.index(port):]:
+                kn = port >> 1
+                if kn != k:  # the inputs of k itself do not change
+                    color_in = color_in_right if port & 1 else color_in_left
+                    if color_in[kn] == c:
+                        break  # the rest of the tail has this color already
+                    color_in[kn] = c
+                    dirty.append(kn)
+                e = 2 * port + (knot_type[kn] == RK)
+                if next_port[e] == NONE:
+                    break
+                seg = out_seg[e]
+                color_out = color_out_left if seg & OUT_LEFT else color_out_right
+                if color_out[kn] != c:
+                    color_out[kn] = c
+                    segments.append((kn, Const.LeftOut if seg & OUT_LEFT else Const.RightOut,
+                                     Const.arc if seg & ARC else Const.line))
+        knot_color = self.knot_color
+        left_vis = self.left_vis
+        for kn in dirty:
+            c = color_in_left[kn] if left_vis[kn] else color_in_right[kn]
+            if knot_color[kn] != c:
+                knot_color[kn] = c
+                knots.append(kn)
+        return knots, segments
+
+    def change_knots(self, types, visible, cancel=None):
+        """
+        Set the type and left_vis values of several knots and propagate the changed threads once.
+
+        types and visible map knot indices to the new values. Each thread entering a knot of
+        a new type is walked once from the first of these knots on its path, however many of
+        its knots change. Returns the diff (knots, segments) like change_knot_type.
+
+        cancel is a threading.Event checked between the steps of a worker thread. When it is
+        set, None is returned and the model is left half done, it has to be dropped.
+        """
+        paths = self.thread_paths()
+        port_thread = self.port_thread
+        knot_type = self.knot_type
+        entered = {}  # thread index: ports where it enters a knot of a new type
+        for k, type in types.items():
+            if cancel is not None and cancel.is_set():
+                return None
+            if knot_type[k] == type:
+                continue
+            self.set_knot_type(k, type)
+            for port in (2 * k, 2 * k + 1):
+                i = port_thread[port]
+                if i != NONE:
+                    entered.setdefault(i, []).append(port)
+        next_port = self.routes.next_port
+        out_seg = self.routes.out_seg
+        color_in_left = self.color_in_left
+        color_in_right = self.color_in_right
+        color_out_left = self.color_out_left
+        color_out_right = self.color_out_right
+        dirty = set(visible)  # knots with a new input color or visibility
+        segments = []
+        for i, ports in entered.items():
+            if cancel is not None and cancel.is_set():
+                return None
+            c = self.threads[i].c
+            path = paths[i]
+            # a later change before a port may have routed the thread away from it, the first
+            # port still on the path is where its colors start to differ
+            first = min(path.index(port) for port in ports if port_thread[port] == i)
+            for port in path[first:]:
+                kn = port >> 1
+                color_in = color_in_right if port & 1 else color_in_left
+                if color_in[kn] != c:
+                    color_in[kn] = c
+                    dirty.add(kn)
+                e = 2 * port + (knot_type[kn] == RK)
+                if next_port[e] == NONE:
+                    break
+                seg = out_seg[e]
+                color_out = color_out_left if seg & OUT_LEFT else color_out_right
+                if color_out[kn] != c:
+                    color_out[kn] = c
+                    segments.append((kn, Const.LeftOut if seg & OUT_LEFT else Const.RightOut,
+                                     Const.arc if seg & ARC else Const.line))
+        knot_color = self.knot_color
+        left_vis = self.left_vis
+        for k, vis in visible.items():
+            left_vis[k] = vis
+        knots = []
+        for kn in dirty:
+            c = color_in_left[kn] if left_vis[kn] else color_in_right[kn]
+            if knot_color[kn] != c:
+                knot_color[kn] = c
+                knots.append(kn)
+        return knots, segments
+
+    def copy(self):
+        """
+        Copy with its own knot state, colors and path index, used to propagate on a worker thread.
+
+        Topology, routes, threads and color table are shared, they must not change while
+        the copy is in use.
+        """
+        model = copy.copy(self)
+        for name in ("knot_type", "left_vis", "color_in_left", "color_in_right", "color_out_left",
+                     "color_out_right", "knot_color"):
+            setattr(model, name, getattr(self, name)[:])
+        if self.paths is not None:
+            model.paths = [ports[:] for ports in self.paths]
+            model.port_thread = self.port_thread[:]
+        model.rows = None
+        return model
+
+    def set_thread_color(self, i, color):
+        """
+        Give thread i a new color and write it along its indexed path, no routing needed.
+
+        Returns the path of the thread like set_thread.
+        """
+        thread = self.threads[i]
+        thread.color = color
+        c = thread.c
+        path = self.thread_path(i)
+        left_vis = self.left_vis
+        color_in_left = self.color_in_left
+        color_in_right = self.color_in_right
+        knot_color = self.knot_color
+        for port in self.paths[i]:
+            k = port >> 1
+            if port & 1:
+                color_in_right[k] = c
+            else:
+                color_in_left[k] = c
+            knot_color[k] = color_in_left[k] if left_vis[k] else color_in_right[k]
+        for k, outDir, segment in path[:-1]:
+            if outDir == Const.LeftOut:
+                self.color_out_left[k] = c
+            else:
+                self.color_out_right[k] = c
+        return path
+
+    def set_knot_color(self, k):
+        if self.left_vis[k]:
+            c = self.color_in_left[k]
+        else:  # right_thread_visible
+            c = self.color_in_right[k]
+        self.knot_color[k] = c
+        return c
+
+    def extract_KnPar(self):
+        All_KnPar = []
+        for x in range(self.w):
+            column = []
+            for y in range(self.l):
+                knot = self.knot(x, y)
+                KnPar = {
+                    "co": knot.co,
+                    "left_thread_vis": knot.left_thread_vis,
+                    "type": knot.type,
+                    "endK": knot.endK
+                }
+                column.append(KnPar)
+            All_KnPar.append(column)
+        return All_KnPar
+
+    def to_dict(self, rgb=list):
+        """Extract all ribbon data for saving to file, rgb converts a color to [r, g, b]"""
+        l = self.l
+        return {
+            "ribbon": {
+                "width": self.w,
+                "length": self.l,
+                "type": self.type
+            },
+            "thread_colors": [rgb(thread.color) for thread in self.threads],
+            "knots": [[
+                {
+                    "type": Const(self.knot_type[x * l + y]).name,
+                    "left_thread_vis": bool(self.left_vis[x * l + y])
+                }
+                for y in range(self.l)
+            ] for x in range(self.w)]
+        }
+
+    def restore_from_dict(self, data, make_color=tuple):
+        """Restore knot states and thread colors from saved data and propagate the colors"""
+        # Restore thread colors
+        thread_colors = data.get("thread_colors", [])
+        for i, rgb in enumerate(thread_colors):
+            if i < len(self.threads):
+                self.threads[i].color = make_color(rgb)
+
+        # Restore knot states, knot coordinates follow from the position in the file
+        self.paths = self.rows = None
+        knots_data = data.get("knots", [])
+        for x in range(min(self.w, len(knots_data))):
+            for y in range(min(self.l, len(knots_data[x]))):
+                knot_data = knots_data[x][y]
+                k = self.idx(x, y)
+                type_str = knot_data.get("type", "Nk")
+                self.knot_type[k] = getattr(Const, type_str, Const.Nk).value
+                self.left_vis[k] = bool(knot_data.get("left_thread_vis", True))
+
+        # Recalculate all thread colors through the pattern
+        self.propagate()
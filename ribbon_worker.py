@@ -0,0 +1,115 @@
+"""
+Propagation of knot edits on a worker thread.
+
+PropagationWorker keeps the propagation of knot type and visibility edits off the GUI
+thread. The edits are written to the knot types and visibility of the model at once,
+the thread colors are computed on a copy of the model by a PropagationJob running on
+the global QThreadPool. A new edit cancels the job in progress and starts a new one for
+all edits not delivered yet. The last job hands its colors and path index back to the
+model on the GUI thread and the diff of changed knot and segment colors is emitted, so
+the view repaints only what changed.
+"""
+
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class PropagationJob(QRunnable):
+    # one propagation of the edits of a PropagationWorker on a copy of its model
+
+    def __init__(self, worker, generation, model, types, visible):
+        super().__init__()
+        self.worker = worker
+        self.generation = generation
+        self.model = model
+        self.types = types
+        self.visible = visible
+        self.cancel = threading.Event()
+
+    def compute(self):
+        # diff (knots, segments) of the edits, None if the job was cancelled
+        return self.model.change_knots(self.types, self.visible, self.cancel)
+
+    def run(self):
+        diff = self.compute()
+        if diff is not None:
+            # queued to the GUI thread, the worker lives there
+            self.worker.finished.emit(self.generation, self.model, diff)
+
+
+class PropagationWorker(QObject):
+    """
+    Propagates the knot edits of a model on a thread of the global QThreadPool.
+
+    delivered(knots, segments) is emitted on the GUI thread with the diff of the colors
+    after the model took over the result. Until then the colors and the path index of the
+    model are those before the edits in progress, call sync() before using them.
+    """
+    finished = pyqtSignal(int, object, object)  # generation, model copy, diff
+    delivered = pyqtSignal(object, object)  # knots, segments
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.base = {}  # knot: (type, left_vis) of the colors of the model, for knots with edits in progress
+        self.job = None
+        self.generation = 0
+        self.finished.connect(self.deliver)
+
+    def busy(self):
+        return self.job is not None
+
+    def change_knots(self, types, visible):
+        # write the edits to the model and propagate them with the ones in progress
+        model = self.model
+        for k in types.keys() | visible.keys():
+            self.base.setdefault(k, (model.knot_type[k], model.left_vis[k]))
+        for k, type in types.items():
+            model.knot_type[k] = type
+        for k, vis in visible.items():
+            model.left_vis[k] = vis
+        QThreadPool.globalInstance().start(self.new_job())
+
+    def new_job(self):
+        # cancel the job in progress and make one for all edits, on a copy with the colors of the model
+        if self.job is not None:
+            self.job.cancel.set()
+        self.generation += 1
+        model = self.model
+        copy = model.copy()
+        for k, (type, vis) in self.base.items():
+            copy.knot_type[k] = type
+            copy.left_vis[k] = vis
+        self.job = PropagationJob(self, self.generation, copy,
+                                  {k: model.knot_type[k] for k in self.base},
+                                  {k: bool(model.left_vis[k]) for k in self.base})
+        return self.job
+
+    def sync(self):
+        # finish the edits in progress on this thread
+        if self.job is not None:
+            job = self.new_job()
+            self.deliver(job.generation, job.model, job.compute())
+
+    def cancel(self):
+        # drop the edits in progress, the model is changed by other means
+        if self.job is not None:
+            self.job.cancel.set()
+            self.job = None
+            self.generation += 1
+            self.base.clear()
+
+    def deliver(self, generation, copy, diff):
+        if generation != self.generation:
+            return  # result of a cancelled job
+        self.job = None
+        self.base.clear()
+        model = self.model
+        for name in ("color_in_left", "color_in_right", "color_out_left", "color_out_right", "knot_color"):
+            setattr(model, name, getattr(copy, name))
+        model.paths = copy.paths
+        model.port_thread = copy.port_thread
+        model.rows = None  # rebuilt on first use
+        knots, segments = diff
+        self.delivered.emit(knots, segments)
@@ -0,0 +1,266 @@
+"""
+The single sweep of RibbonModel.propagate gives the same colors as following every
+thread twice the way the first version of the editor did. That engine walked the knot
+links, flags and end types knot by knot, so the reference does not use the RouteTable.
+"""
+
+import os
+import random
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ribbon_model import (  # noqa: E402
+    EDGE_L, EDGE_R, END, END_BOTH, END_LIKE_L, END_LIKE_R, NK, NONE, RK, Const, RibbonModel)
+
+COLORS = ("color_in_left", "color_in_right", "color_out_left", "color_out_right", "knot_color")
+
+SIZES = [("L", w, l) for w in (2, 3, 5, 8) for l in (1, 2, 7, 20)]
+SIZES += [("R", w, l) for w in (2, 3, 5, 8) for l in (1, 2, 7, 20)]
+SIZES += [(t, w, l) for t in ("M", "A") for w in (3, 5, 7, 11) for l in (1, 2, 7, 20)]
+SIZES += [("W", w, l) for w in (5, 9, 13) for l in (1, 2, 7, 20)]
+
+
+def next_knot(model, k, left_out):
+    # knot the thread leaving k on the left (left_out) or right exit enters, NONE if it stops at k
+    f = model.flags[k]
+    nKtoL = model.nKtoL[k]
+    nKtoR = model.nKtoR[k]
+    if not f & END:
+        return nKtoL if left_out else nKtoR
+    if f & EDGE_R:
+        return nKtoL if left_out else nKtoR
+    if f & EDGE_L:
+        if not left_out:
+            return nKtoR
+        return NONE if nKtoL == NONE else nKtoR
+    end_type = model.end_type[k]
+    if end_type == END_BOTH or end_type == (END_LIKE_R if left_out else END_LIKE_L):
+        return nKtoL if left_out else nKtoR
+    return NONE
+
+
+def follow_thread(model, k, c, direction):
+    # the engine of the first version: set the colors along the thread entering knot k from direction
+    while True:
+        left_in = direction == Const.LeftIn
+        if left_in:
+            model.color_in_left[k] = c
+        else:
+            model.color_in_right[k] = c
+        model.knot_color[k] = model.color_in_left[k] if model.left_vis[k] else model.color_in_right[k]
+        # a normal knot passes the thread to the other side, a reverse knot keeps the side
+        left_out = left_in != (model.knot_type[k] == NK)
+        nKnot = next_knot(model, k, left_out)
+        if nKnot == NONE:
+            return
+        if left_out:
+            model.color_out_left[k] = c
+        else:
+            model.color_out_right[k] = c
+        f = model.flags[k]
+        if not f & END and f & EDGE_R and not left_out:
+            direction = Const.RightIn  # arc around the right edge
+        elif not f & END and f & EDGE_L and left_out:
+            direction = Const.LeftIn  # arc around the left edge
+        else:
+            direction = Const.RightIn if left_out else Const.LeftIn
+        k = nKnot
+
+
+def double_pass(model):
+    for _ in range(2):
+        for thread in model.threads:
+            follow_thread(model, thread.knot, thread.c, thread.direction)
+
+
+def random_models(type, width, length, seed):
+    # two models with the same random knot types, visibility and thread colors
+    rnd = random.Random(seed)
+    n = width * length
+    types = [rnd.choice((NK, RK)) for _ in range(n)]
+    visible = [rnd.random() < 0.5 for _ in range(n)]
+    models = []
+    for _ in range(2):
+        model = RibbonModel(width, length, type)
+        rnd_colors = random.Random(seed)
+        for thread in model.threads:
+            thread.color = model.palette[rnd_colors.randrange(len(model.palette))]
+        for k in range(n):
+            model.knot_type[k] = types[k]
+            model.left_vis[k] = visible[k]
+        models.append(model)
+    return models
+
+
+@pytest.mark.parametrize("type, width, length", SIZES)
+@pytest.mark.parametrize("seed", range(3))
+def test_sweep_matches_double_pass(type, width, length, seed):
+    sweep, reference = random_models(type, width, length, seed)
+    sweep.propagate()
+    double_pass(reference)
+    for name in COLORS:
+        assert list(getattr(sweep, name)) == list(getattr(reference, name)), name
+
+
+@pytest.mark.parametrize("type, width, length", [("L", 5, 8), ("M", 7, 12), ("W", 9, 12)])
+def test_sweep_of_stale_model(type, width, length):
+    # propagating again after new knot types gives the colors of a fresh double pass
+    sweep, reference = random_models(type, width, length, 7)
+    sweep.propagate()
+    rnd = random.Random(1)
+    for k in range(width * length):
+        sweep.knot_type[k] = reference.knot_type[k] = rnd.choice((NK, RK))
+    sweep.paths = sweep.rows = None
+    sweep.propagate()
+    double_pass(reference)
+    for name in COLORS:
+        assert list(getattr(sweep, name)) == list(getattr(reference, name)), name
+
+
+EDIT_SIZES = [("L", 5, 9), ("R", 4, 7), ("M", 7, 10), ("A", 9, 6), ("W", 9, 11), ("W", 13, 5)]
+
+
+def colors(model):
+    # color arrays as colors, models with other color tables compare equal
+    return {name: [model.color(c) for c in getattr(model, name)] for name in COLORS}
+
+
+def recomputed(model):
+    # a new model with the knot types, visibility and thread colors of model, propagated from scratch
+    fresh = RibbonModel(model.w, model.l, model.type)
+    for thread, other in zip(fresh.threads, model.threads):
+        thread.color = other.color
+    fresh.knot_type = model.knot_type[:]
+    fresh.left_vis = model.left_vis[:]
+    fresh.propagate()
+    fresh.thread_paths()
+    return fresh
+
+
+def same_as_recomputed(model):
+    fresh = recomputed(model)
+    assert colors(model) == colors(fresh)
+    assert [list(ports) for ports in model.paths] == [list(ports) for ports in fresh.paths]
+    assert list(model.port_thread) == list(fresh.port_thread)
+
+
+def same_diff(model, before, diff):
+    # the diff lists exactly the knot fills and exit segments whose color changed
+    after = colors(model)
+    knots, segments = diff
+    assert sorted(knots) == [k for k, (a, b) in enumerate(zip(before["knot_color"], after["knot_color"])) if a != b]
+    changed = {(k, direction) for name, direction in (("color_out_left", Const.LeftOut),
+                                                      ("color_out_right", Const.RightOut))
+               for k, (a, b) in enumerate(zip(before[name], after[name])) if a != b}
+    assert {(k, direction) for k, direction, segment in segments} == changed
+    for k, direction, segment in segments:
+        assert model.exit_segment(k, direction)[1] == segment
+
+
+@pytest.mark.parametrize("type, width, length", EDIT_SIZES)
+@pytest.mark.parametrize("seed", range(3))
+def test_change_knot_type(type, width, length, seed):
+    # each toggle walks the new tails only, the colors, the diff and the path index equal a recompute
+    model = random_models(type, width, length, seed)[0]
+    model.propagate()
+    model.thread_paths()
+    rnd = random.Random(seed)
+    for _ in range(25):
+        k = rnd.randrange(width * length)
+        before = colors(model)
+        diff = model.change_knot_type(k, RK if model.knot_type[k] == NK else NK)
+        same_diff(model, before, diff)
+        same_as_recomputed(model)
+    assert model.change_knot_type(k, model.knot_type[k]) == ([], [])
+
+
+def random_edits(model, rnd, count):
+    # new types and visibility for count random knots
+    n = model.w * model.l
+    types = {rnd.randrange(n): rnd.choice((NK, RK)) for _ in range(count)}
+    visible = {rnd.randrange(n): rnd.random() < 0.5 for _ in range(count // 2)}
+    return types, visible
+
+
+@pytest.mark.parametrize("type, width, length", EDIT_SIZES)
+@pytest.mark.parametrize("seed", range(3))
+def test_change_knots_equals_sequential_edits(type, width, length, seed):
+    bulk, sequential = random_models(type, width, length, seed)
+    for model in (bulk, sequential):
+        model.propagate()
+        model.thread_paths()
+    rnd = random.Random(seed)
+    for count in (1, 3, 10, width * length // 2):
+        types, visible = random_edits(bulk, rnd, count)
+        before = colors(bulk)
+        diff = bulk.change_knots(types, visible)
+        for k, type in types.items():
+            sequential.change_knot_type(k, type)
+        for k, vis in visible.items():
+            sequential.left_vis[k] = vis
+            sequential.set_knot_color(k)
+        same_diff(bulk, before, diff)
+        assert colors(bulk) == colors(sequential)
+        same_as_recomputed(bulk)
+
+
+@pytest.mark.parametrize("type, width, length", [("L", 5, 8), ("M", 7, 8), ("W", 9, 8)])
+def test_change_knots_restarts_rerouted_paths(type, width, length):
+    # a knot further down a thread comes first, the change of a knot above it routes the
+    # thread away from it, the walk has to start at the first port still on the path
+    rerouted = 0
+    base = random_models(type, width, length, 3)[0]
+    base.propagate()
+    for i in range(len(base.threads)):
+        knots = [port >> 1 for port in base.thread_paths()[i]]
+        for up in range(len(knots)):
+            for down in range(up + 1, len(knots)):
+                model = base.copy()
+                port = base.paths[i][down]
+                types = {knots[down]: RK if model.knot_type[knots[down]] == NK else NK,
+                         knots[up]: RK if model.knot_type[knots[up]] == NK else NK}
+                model.change_knots(types, {})
+                if model.port_thread[port] != i:
+                    rerouted += 1
+                same_as_recomputed(model)
+    assert rerouted
+
+
+class CancelAfter():
+    # stands in for the threading.Event of a job, set after the given number of checks
+    def __init__(self, checks):
+        self.checks = checks
+
+    def is_set(self):
+        self.checks -= 1
+        return self.checks < 0
+
+
+def test_change_knots_cancel():
+    model = random_models("M", 7, 10, 4)[0]
+    model.propagate()
+    model.thread_paths()
+    types, visible = random_edits(model, random.Random(2), 12)
+    state = colors(model), list(model.knot_type), [list(ports) for ports in model.paths]
+    checks = 0
+    while True:
+        # the worker propagates on a copy, a cancelled copy is dropped and the model is untouched
+        copy = model.copy()
+        cancel = CancelAfter(checks)
+        diff = copy.change_knots(types, visible, cancel)
+        if cancel.checks >= 0:
+            break  # all checks passed, the edits are done
+        assert diff is None
+        assert (colors(model), list(model.knot_type), [list(ports) for ports in model.paths]) == state
+        checks += 1
+    assert checks > len(types)  # there is a check per edited knot and per walked thread
+    expected = model.copy()
+    assert diff == expected.change_knots(types, visible)
+    same_as_recomputed(copy)
+    event = threading.Event()
+    event.set()
+    assert model.copy().change_knots(types, visible, event) is None
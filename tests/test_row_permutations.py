@@ -0,0 +1,65 @@
+"""
+RowPermutations answers which thread enters a knot and the thread order at the bottom
+like the path index of thread_paths, also after knot type edits made once it is built.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ribbon_model import NK, RK, Const, RibbonModel  # noqa: E402
+
+SIZES = [("L", 5, 9), ("R", 4, 7), ("M", 7, 10), ("A", 9, 6), ("W", 9, 11), ("L", 2, 1)]
+
+
+def rebuilt(model):
+    # a model with the knot types of model and its path index traced from scratch
+    fresh = RibbonModel(model.w, model.l, model.type)
+    fresh.knot_type = model.knot_type[:]
+    fresh.thread_paths()
+    return fresh
+
+
+def same_threads(model):
+    rows = model.row_permutations()
+    fresh = rebuilt(model)
+    for k in range(model.w * model.l):
+        for direction in (Const.LeftIn, Const.RightIn):
+            assert rows.thread_at(k, direction) == fresh.thread_at(k, direction), (k, direction)
+    ends = sorted(range(len(fresh.paths)), key=lambda i: fresh.paths[i][-1])
+    assert rows.bottom_order() == ends
+
+
+@pytest.mark.parametrize("type, width, length", SIZES)
+@pytest.mark.parametrize("seed", range(3))
+def test_random_types(type, width, length, seed):
+    model = RibbonModel(width, length, type)
+    rnd = random.Random(seed)
+    for k in range(width * length):
+        model.knot_type[k] = rnd.choice((NK, RK))
+    same_threads(model)
+
+
+@pytest.mark.parametrize("type, width, length", SIZES)
+@pytest.mark.parametrize("seed", range(3))
+def test_edits_after_build(type, width, length, seed):
+    model = RibbonModel(width, length, type)
+    model.propagate()
+    model.row_permutations()
+    rnd = random.Random(seed)
+    n = width * length
+    for step in range(12):
+        if step % 3 == 2:
+            # several knots at once, some of them in the same row
+            types = {rnd.randrange(n): rnd.choice((NK, RK)) for _ in range(rnd.randint(1, 6))}
+            model.change_knots(types, {})
+        else:
+            k = rnd.randrange(n)
+            model.change_knot_type(k, RK if model.knot_type[k] == NK else NK)
+        if step % 4 == 3:
+            same_threads(model)
+    same_threads(model)
@@ -0,0 +1,95 @@
+"""Templates written to the cache directory are read back as the same plain data."""
+
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ribbon import KnotPoints  # noqa: E402
+from ribbon_layout import RibbonLayout  # noqa: E402
+from ribbon_model import RibbonModel, RibbonTemplate, TemplateCache  # noqa: E402
+
+
+def same_template(a, b):
+    assert a.key == b.key
+    for name in RibbonTemplate.ARRAYS:
+        assert getattr(a, name) == getattr(b, name), name
+    assert a.starts == b.starts
+    for name in ("next_port", "out_seg", "order"):
+        assert getattr(a.routes, name) == getattr(b.routes, name), name
+    if a.layout is None:
+        assert b.layout is None
+    else:
+        for name in RibbonLayout.__slots__:
+            assert getattr(a.layout, name) == getattr(b.layout, name), name
+
+
+@pytest.mark.parametrize("type, width, length", [("L", 5, 8), ("R", 4, 3), ("M", 7, 6), ("A", 9, 5), ("W", 9, 7)])
+@pytest.mark.parametrize("with_layout", [False, True])
+def test_round_trip(tmp_path, type, width, length, with_layout):
+    template = RibbonTemplate(RibbonModel(width, length, type))
+    if with_layout:
+        template.layout = RibbonLayout(type, width, length, 10, 20, 35, KnotPoints(40, 35))
+    TemplateCache(directory=str(tmp_path)).put(template)
+    loaded = TemplateCache(directory=str(tmp_path)).get(type, width, length)
+    same_template(template, loaded)
+    if with_layout:
+        # compared with the geometry of the view to decide if the layout can be used
+        assert loaded.layout.geometry == RibbonLayout.geometry_of(10, 20, 35, KnotPoints(40, 35))
+        assert loaded.layout.geometry != RibbonLayout.geometry_of(10, 20, 36, KnotPoints(40, 36))
+
+
+def test_damaged_file_is_a_miss(tmp_path):
+    cache = TemplateCache(directory=str(tmp_path))
+    cache.put(RibbonTemplate(RibbonModel(5, 8, "L")))
+    path = cache.path(("L", 5, 8))
+    with open(path, "rb") as file:
+        data = file.read()
+    for damaged in (data[:len(data) // 2], b"\x80\x04 not a template", b"{}\n"):
+        with open(path, "wb") as file:
+            file.write(damaged)
+        assert TemplateCache(directory=str(tmp_path)).get("L", 5, 8) is None
+
+
+
+@pytest.mark.parametrize("name, index, value", [
+    ("routes.next_port", 0, 0),  # the thread enters its own knot again
+    ("routes.next_port", 0, 2 * 5 * 8),  # port of no knot
+    ("routes.next_port", 4 * 9, 0),  # back to a knot before, the left knot of the row above
+    ("nKtoR", 9, 0),
+    ("routes.order", 0, 1),  # a knot twice
+])
+def test_invalid_links_are_a_miss(tmp_path, name, index, value):
+    template = RibbonTemplate(RibbonModel(5, 8, "L"))
+    owner = template.routes if name.startswith("routes.") else template
+    name = name.split(".")[-1]
+    values = getattr(owner, name)[:]
+    values[index] = value
+    if name == "next_port":
+        values[index ^ 3] = value  # the same route for a normal and a reverse knot
+    setattr(owner, name, values)
+    TemplateCache(directory=str(tmp_path)).put(template)
+    assert TemplateCache(directory=str(tmp_path)).get("L", 5, 8) is None
+
+
+def test_files_are_pruned(tmp_path):
+    cache = TemplateCache(directory=str(tmp_path))
+    for length in (3, 4, 5):
+        cache.put(RibbonTemplate(RibbonModel(5, length, "L")))
+    for name in ("v1_L_5x3.tpl", "v2_M_7x9.tpl", "notes.txt"):
+        (tmp_path / name).write_bytes(b"old")
+    # use order by modification time: 5x4, 5x3, 5x5
+    for age, length in ((300, 4), (200, 3), (100, 5)):
+        path = cache.path(("L", 5, length))
+        os.utime(path, (os.path.getmtime(path) - age,) * 2)
+    newest = RibbonTemplate(RibbonModel(5, 6, "L"))
+    file = io.BytesIO()
+    newest.dump(file)
+    cache.disk_size = 2 * len(file.getvalue())  # room for the new file and the one used last
+    cache.put(newest)
+    names = sorted(os.listdir(tmp_path))
+    assert names == sorted(["notes.txt", os.path.basename(cache.path(("L", 5, 5))),
+                            os.path.basename(cache.path(("L", 5, 6)))])
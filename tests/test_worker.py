@@ -0,0 +1,109 @@
+"""
+PropagationWorker gives the colors of RibbonModel.change_knots, whether its jobs are
+delivered, finished with sync() or cancelled.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+from PyQt6.QtCore import QCoreApplication, QThreadPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ribbon_model import NK, RK, RibbonModel  # noqa: E402
+from ribbon_worker import PropagationWorker  # noqa: E402
+
+COLORS = ("color_in_left", "color_in_right", "color_out_left", "color_out_right", "knot_color")
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def models(type, width, length):
+    # a model with a worker and a model for the direct edits, both propagated
+    result = []
+    for _ in range(2):
+        model = RibbonModel(width, length, type)
+        model.propagate()
+        model.thread_paths()
+        result.append(model)
+    return result
+
+
+def edits(model, seed, count=3):
+    rnd = random.Random(seed)
+    n = model.w * model.l
+    return [({rnd.randrange(n): rnd.choice((NK, RK)) for _ in range(4)},
+             {rnd.randrange(n): rnd.random() < 0.5 for _ in range(2)}) for _ in range(count)]
+
+
+def same_state(model, other):
+    for name in COLORS + ("knot_type", "left_vis", "port_thread"):
+        assert list(getattr(model, name)) == list(getattr(other, name)), name
+    assert [list(ports) for ports in model.paths] == [list(ports) for ports in other.paths]
+
+
+def settle(app):
+    # run the jobs in the pool to the end and deliver their results
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+
+
+@pytest.mark.parametrize("type, width, length", [("L", 9, 30), ("M", 7, 20), ("W", 9, 20)])
+@pytest.mark.parametrize("seed", range(2))
+def test_sync_after_queued_edits(app, type, width, length, seed):
+    model, direct = models(type, width, length)
+    worker = PropagationWorker(model)
+    delivered = []
+    worker.delivered.connect(lambda knots, segments: delivered.append((knots, segments)))
+    for types, visible in edits(model, seed):
+        worker.change_knots(types, visible)
+        direct.change_knots(types, visible)
+    assert worker.busy()
+    worker.sync()
+    assert not worker.busy() and not worker.base
+    assert len(delivered) == 1
+    same_state(model, direct)
+    # the jobs started before the sync are of older generations, their results are dropped
+    settle(app)
+    assert len(delivered) == 1
+    same_state(model, direct)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_delivery(app, seed):
+    model, direct = models("L", 9, 30)
+    worker = PropagationWorker(model)
+    delivered = []
+    worker.delivered.connect(lambda knots, segments: delivered.append((knots, segments)))
+    for types, visible in edits(model, seed):
+        worker.change_knots(types, visible)
+        direct.change_knots(types, visible)
+        settle(app)
+    assert not worker.busy()
+    assert len(delivered) == 3
+    same_state(model, direct)
+
+
+def test_cancel(app):
+    model, direct = models("M", 7, 20)
+    worker = PropagationWorker(model)
+    delivered = []
+    worker.delivered.connect(lambda knots, segments: delivered.append((knots, segments)))
+    generation = worker.generation
+    types, visible = edits(model, 5, 1)[0]
+    worker.change_knots(types, visible)
+    worker.cancel()
+    assert not worker.busy() and not worker.base and worker.generation > generation + 1
+    settle(app)
+    assert delivered == []
+    # the edits are written to the model at once, the colors stay those before them
+    for name in COLORS:
+        assert list(getattr(model, name)) == list(getattr(direct, name)), name
+    direct.change_knots(types, visible)
+    assert list(model.knot_type) == list(direct.knot_type)
+    assert list(model.left_vis) == list(direct.left_vis)
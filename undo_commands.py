@@ -3,16 +3,24 @@ Undo/Redo commands for RibbonEditor using Qt's QUndoCommand framework.
 """
 
 import weakref
-from PyQt6.QtGui import QUndoCommand, QColor, QPen, QBrush
+from PyQt6.QtGui import QUndoCommand, QColor
 from PyQt6.QtCore import Qt
 
 
+# id of the commands that merge, see ToggleKnotColorCommand.mergeWith
+FOLD_ID = 1
+
+
 class ToggleKnotColorCommand(QUndoCommand):
     """
     Undo command for toggling knot color visibility (left vs right thread).
 
     This command toggles the left_thread_vis property of a knot, which determines
     whether the knot displays the left or right thread color.
+
+    In the instant click mode the first click of a double click toggles the knot on the
+    press. The ChangeKnotTypeCommand of the double click is then merged into this command,
+    so both are undone in one step.
     """
 
     def __init__(self, ribbon, knot_co, old_left_thread_vis):
@@ -21,22 +29,36 @@ class ToggleKnotColorCommand(QUndoCommand):
         self.knot_co = knot_co  # [x, y]
         self.old_left_thread_vis = old_left_thread_vis
         self.new_left_thread_vis = not old_left_thread_vis
+        self.folded = None  # merged ChangeKnotTypeCommand
+
+    def id(self):
+        return FOLD_ID
+
+    def mergeWith(self, other):
+        if (self.folded is not None or not isinstance(other, ChangeKnotTypeCommand)
+                or not other.fold or list(other.knot_co) != list(self.knot_co)):
+            return False
+        self.folded = other
+        self.setText(other.text())
+        return True
 
     def undo(self):
         ribbon = self.ribbon_ref()
         if ribbon is None:
             return
+        if self.folded is not None:
+            self.folded.undo()
         knot = ribbon.K[self.knot_co[0]][self.knot_co[1]]
-        knot.left_thread_vis = self.old_left_thread_vis
-        knot.set_knot_color()
+        ribbon.set_knot_visible(knot, self.old_left_thread_vis)
 
     def redo(self):
         ribbon = self.ribbon_ref()
         if ribbon is None:
             return
         knot = ribbon.K[self.knot_co[0]][self.knot_co[1]]
-        knot.left_thread_vis = self.new_left_thread_vis
-        knot.set_knot_color()
+        ribbon.set_knot_visible(knot, self.new_left_thread_vis)
+        if self.folded is not None:
+            self.folded.redo()
 
 
 class ChangeKnotTypeCommand(QUndoCommand):
@@ -48,37 +70,33 @@ class ChangeKnotTypeCommand(QUndoCommand):
     along both thread paths.
     """
 
-    def __init__(self, ribbon, knot_co):
+    def __init__(self, ribbon, knot_co, fold=False):
         super().__init__("Change Knot Type")
         # Import here to avoid circular import
         from ribbon import Const
 
         self.ribbon_ref = weakref.ref(ribbon)
         self.knot_co = knot_co
+        self.fold = fold  # merge into the ToggleKnotColorCommand of the same knot on the stack
 
-        # Capture old state
+        # Capture old state, the input colors of the knot do not change with its type
         knot = ribbon.K[knot_co[0]][knot_co[1]]
         self.old_type = knot.type
-        self.old_color_in_left = QColor(knot.color_in_left)  # Deep copy
-        self.old_color_in_right = QColor(knot.color_in_right)  # Deep copy
 
         # New type is opposite of current
         self.new_type = Const.Rk if knot.type == Const.Nk else Const.Nk
-        self.Const = Const  # Store for use in undo/redo
+
+    def id(self):
+        return FOLD_ID if self.fold else -1
 
     def undo(self):
         ribbon = self.ribbon_ref()
         if ribbon is None:
             return
 
+        # Recalculate the two threads passing the knot, only changed items are repainted
         knot = ribbon.K[self.knot_co[0]][self.knot_co[1]]
-        knot.type = self.old_type
-        knot.color_in_left = QColor(self.old_color_in_left)
-        knot.color_in_right = QColor(self.old_color_in_right)
-
-        # Recalculate thread propagation
-        knot.set_thread(self.old_color_in_right, self.Const.RightIn, ribbon.thW)
-        knot.set_thread(self.old_color_in_left, self.Const.LeftIn, ribbon.thW)
+        ribbon.change_knot_type(knot, self.old_type)
 
     def redo(self):
         ribbon = self.ribbon_ref()
@@ -86,12 +104,42 @@ class ChangeKnotTypeCommand(QUndoCommand):
             return
 
         knot = ribbon.K[self.knot_co[0]][self.knot_co[1]]
-        knot.type = self.new_type
+        ribbon.change_knot_type(knot, self.new_type)
+
+
+class PaintKnotsCommand(QUndoCommand):
+    """
+    Undo command for setting the type and visibility of several knots at once.
+
+    types and visible map knot indices to the new type values and left_thread_vis, old_types
+    and old_visible to the values they replace. Both directions are applied with one
+    propagation by Ribbon.change_knots. A paint stroke is shown while the mouse moves, with
+    applied True the first redo on the push is skipped.
+    """
 
-        # Recalculate thread propagation with new type
-        # color_in values are already set from previous state or initialization
-        knot.set_thread(knot.color_in_right, self.Const.RightIn, ribbon.thW)
-        knot.set_thread(knot.color_in_left, self.Const.LeftIn, ribbon.thW)
+    def __init__(self, ribbon, types, visible, old_types, old_visible, text="Paint Knots", applied=False):
+        super().__init__(text)
+        self.ribbon_ref = weakref.ref(ribbon)
+        self.types = dict(types)
+        self.visible = dict(visible)
+        self.old_types = dict(old_types)
+        self.old_visible = dict(old_visible)
+        self.applied = applied
+
+    def undo(self):
+        ribbon = self.ribbon_ref()
+        if ribbon is None:
+            return
+        ribbon.change_knots(self.old_types, self.old_visible)
+
+    def redo(self):
+        ribbon = self.ribbon_ref()
+        if ribbon is None:
+            return
+        if self.applied:
+            self.applied = False
+            return
+        ribbon.change_knots(self.types, self.visible)
 
 
 class ChangeThreadColorCommand(QUndoCommand):
@@ -115,30 +163,8 @@ class ChangeThreadColorCommand(QUndoCommand):
         if ribbon is None:
             return
 
-        # Update StartKnot_list color
-        CS = ribbon.StartKnot_list[self.thread_index]
-        CS.color = QColor(color)  # Deep copy
-
-        # Update the ColorRect brush
-        # Find the ColorRect in the scene
-        scene = ribbon.scene
-        for item in scene.items():
-            # Import here to avoid circular import
-            from ribbon import ColorRect
-            if isinstance(item, ColorRect) and hasattr(item, 'index') and item.index == self.thread_index:
-                item.setBrush(QBrush(color))
-                break
-
-        # Update the line pen
-        pen = QPen()
-        pen.setColor(color)
-        pen.setWidth(ribbon.thW)
-        CS.line.setPen(pen)
-
-        # Recalculate thread propagation
-        Kh = CS.Knot
-        direction = CS.direction
-        Kh.set_thread(color, direction, ribbon.thW)
+        # Update the color bar and the graphic items along the indexed thread path
+        ribbon.set_thread_color(self.thread_index, color)
 
     def undo(self):
         self._apply_color(self.old_color)